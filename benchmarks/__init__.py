@@ -0,0 +1,3 @@
+"""
+Benchmarks for ``zds-fixcmd`` (not part of the package).
+"""
@@ -0,0 +1,260 @@
+"""
+Generator of synthetic ZdS contents.
+
+Usage: ``python -m benchmarks.generator output.zip [options]`` (see ``--help``).
+"""
+
+import argparse
+import json
+import random
+import zipfile
+
+WORDS = (
+    'le la les un une des et est dans pour avec sur que qui pas plus ce cette comme mais donc alors '
+    'fonction valeur courbe vitesse énergie intégrale dérivée équation matrice vecteur élément ensemble').split()
+
+SYMBOLS = ['x', 'y', 'z', 't', 'a', 'b', 'n', '\\alpha', '\\beta', '\\lambda', '\\omega', '\\pi']
+
+# (name, number of arguments, definition)
+MACROS = [
+    ('R', 0, '\\mathbb{R}'),
+    ('N', 0, '\\mathbb{N}'),
+    ('dd', 0, '\\mathrm{d}'),
+    ('vect', 1, '\\overrightarrow{#1}'),
+    ('norm', 1, '\\lVert #1\\rVert'),
+    ('pd', 2, '\\frac{\\partial #1}{\\partial #2}'),
+]
+
+
+class Parameters:
+    """Parameters of the generated content
+
+    :param extracts: total number of extracts
+    :type extracts: int
+    :param depth: number of levels of containers (1 is an article, 2 a tutorial with chapters, 3 with parts)
+    :type depth: int
+    :param paragraphs: number of paragraphs per extract
+    :type paragraphs: int
+    :param math_density: probability for a sentence to contain a math expression
+    :type math_density: float
+    :param macro_usage: probability for a math expression to use one of the macros defined in the introduction
+    :type macro_usage: float
+    :param env_size: number of lines of the ``align`` environments (0 for no environment)
+    :type env_size: int
+    :param seed: random seed
+    :type seed: int
+    """
+
+    def __init__(
+            self, extracts=20, depth=2, paragraphs=5, math_density=.3, macro_usage=.2, env_size=3, seed=42):
+        self.extracts = extracts
+        self.depth = depth
+        self.paragraphs = paragraphs
+        self.math_density = math_density
+        self.macro_usage = macro_usage
+        self.env_size = env_size
+        self.seed = seed
+
+
+class Generator:
+    """Generate a content
+
+    :param parameters: the parameters
+    :type parameters: Parameters
+    """
+
+    def __init__(self, parameters):
+        self.parameters = parameters
+        self.random = random.Random(parameters.seed)
+        self.files = {}
+
+    def term(self):
+        r = self.random.random()
+        if r < .1:
+            return '\\frac{{{}}}{{{}}}'.format(self.random.choice(SYMBOLS), self.random.choice(SYMBOLS))
+        elif r < .2:
+            return '{}^{{{}}}'.format(self.random.choice(SYMBOLS), self.random.randint(2, 9))
+        elif r < .3:
+            return '{}_{}'.format(self.random.choice(SYMBOLS), self.random.randint(0, 9))
+        return self.random.choice(SYMBOLS)
+
+    def macro(self):
+        name, nargs, _ = self.random.choice(MACROS)
+        return '\\' + name + ''.join('{{{}}}'.format(self.term()) for _ in range(nargs))
+
+    def expression(self, display=False):
+        """Generate a math expression (without delimiters)
+
+        :param display: display mode (environments are only used in this mode)
+        :type display: bool
+        :rtype: str
+        """
+
+        def line():
+            parts = []
+            for _ in range(self.random.randint(1, 4)):
+                if self.random.random() < self.parameters.macro_usage:
+                    parts.append(self.macro())
+                else:
+                    parts.append(self.term())
+            return ' + '.join(parts)
+
+        if display and self.parameters.env_size > 0 and self.random.random() < .3:
+            lines = ['{} &= {}'.format(line(), line()) for _ in range(self.parameters.env_size)]
+            return '\n\\begin{align}\n' + ' \\\\\n'.join(lines) + '\n\\end{align}\n'
+
+        return '{} = {}'.format(line(), line())
+
+    def sentence(self):
+        words = [self.random.choice(WORDS) for _ in range(self.random.randint(5, 15))]
+
+        if self.random.random() < self.parameters.math_density:
+            words.insert(self.random.randint(0, len(words)), '${}$'.format(self.expression()))
+
+        sentence = ' '.join(words)
+        return sentence[0].upper() + sentence[1:] + '.'
+
+    def text(self, paragraphs):
+        """Generate a markdown text
+
+        :param paragraphs: number of paragraphs
+        :type paragraphs: int
+        :rtype: str
+        """
+
+        result = []
+        for _ in range(paragraphs):
+            result.append(' '.join(self.sentence() for _ in range(self.random.randint(2, 6))))
+            if self.random.random() < self.parameters.math_density / 2:
+                result.append('$${}$$'.format(self.expression(display=True)))
+
+        return '\n\n'.join(result)
+
+    def preamble(self):
+        """Text with the definition of the macros
+
+        :rtype: str
+        """
+
+        return 'Définitions: $' + ''.join(
+            '\\newcommand{{\\{}}}{}{{{}}}'.format(name, '[{}]'.format(nargs) if nargs > 0 else '', definition)
+            for name, nargs, definition in MACROS) + '$'
+
+    def container(self, slug, level, n_extracts):
+        """Generate a container, with its files
+
+        :param slug: slug of the container (and directory in the archive)
+        :type slug: str
+        :param level: level of the container (1 contains extracts)
+        :type level: int
+        :param n_extracts: number of extracts in the container
+        :type n_extracts: int
+        :rtype: dict
+        """
+
+        directory = slug + '/' if slug else ''
+        node = {
+            'object': 'container',
+            'title': 'Container {}'.format(slug),
+            'slug': slug,
+            'introduction': directory + 'introduction.md',
+            'conclusion': directory + 'conclusion.md',
+            'children': []
+        }
+
+        self.files[node['introduction']] = (self.preamble() + '\n\n' if self.parameters.macro_usage > 0 else '') + \
+            self.text(1)
+        self.files[node['conclusion']] = self.text(1)
+
+        if level == 1:
+            for i in range(n_extracts):
+                extract_slug = 'extract-{}'.format(i + 1)
+                path = directory + extract_slug + '.md'
+                node['children'].append({
+                    'object': 'extract', 'title': 'Extract {}'.format(i + 1), 'slug': extract_slug, 'text': path})
+                self.files[path] = self.text(self.parameters.paragraphs)
+        else:
+            n_children = max(1, min(n_extracts, self.random.randint(2, 5)))
+            for i in range(n_children):
+                part = n_extracts // n_children + (1 if i < n_extracts % n_children else 0)
+                node['children'].append(
+                    self.container(directory + 'c{}'.format(i + 1), level - 1, max(part, 1)))
+
+        # slugs are not paths
+        node['slug'] = slug.replace('/', '-')
+
+        return node
+
+    def generate(self, path):
+        """Write the content in a zip archive
+
+        :param path: path of the archive
+        :type path: str
+        """
+
+        self.files = {}
+        manifest = self.container('', self.parameters.depth, self.parameters.extracts)
+        del manifest['object']
+        manifest.update({
+            'version': 2,
+            'type': 'ARTICLE' if self.parameters.depth == 1 else 'TUTORIAL',
+            'title': 'Synthetic content',
+            'slug': 'synthetic-content'
+        })
+
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+            for file_path, text in self.files.items():
+                archive.writestr(file_path, text)
+
+
+def generate_archive(path, **kwargs):
+    """Generate a synthetic content (see ``Parameters`` for the arguments)
+
+    :param path: path of the archive
+    :type path: str
+    """
+
+    Generator(Parameters(**kwargs)).generate(path)
+
+
+def add_arguments(parser):
+    """Add the parameters of the generator to an arguments parser
+
+    :param parser: the parser
+    :type parser: argparse.ArgumentParser
+    """
+
+    defaults = Parameters()
+    parser.add_argument('--extracts', type=int, default=defaults.extracts, help='total number of extracts')
+    parser.add_argument('--depth', type=int, default=defaults.depth, help='levels of containers (1-3)')
+    parser.add_argument('--paragraphs', type=int, default=defaults.paragraphs, help='paragraphs per extract')
+    parser.add_argument('--math-density', type=float, default=defaults.math_density)
+    parser.add_argument('--macro-usage', type=float, default=defaults.macro_usage)
+    parser.add_argument('--env-size', type=int, default=defaults.env_size)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+
+
+def parameters_from_arguments(args):
+    """
+    :param args: parsed arguments (see ``add_arguments()``)
+    :type args: argparse.Namespace
+    :rtype: Parameters
+    """
+
+    return Parameters(
+        extracts=args.extracts, depth=args.depth, paragraphs=args.paragraphs, math_density=args.math_density,
+        macro_usage=args.macro_usage, env_size=args.env_size, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('output', type=str)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    Generator(parameters_from_arguments(args)).generate(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Memory used by the content model (containers and extracts), on a synthetic tutorial (see ``benchmarks.generator``).
+
+Usage: ``python -m benchmarks.model [-o results.json] [generator options]`` (5000 extracts by default)
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from zds_fixcmd import content, fixes
+
+from benchmarks import generator
+
+
+def node_size(node):
+    """Size of a node, without the strings it refers to (which are shared or counted with the texts)
+
+    :param node: the node
+    :type node: zds_fixcmd.content.Base
+    :return: size (in bytes)
+    :rtype: int
+    """
+
+    size = sys.getsizeof(node)
+    if hasattr(node, '__dict__'):
+        size += sys.getsizeof(node.__dict__)
+    if isinstance(node, content.Container):
+        size += sys.getsizeof(node.children) + sys.getsizeof(node.children_dict)
+
+    return size
+
+
+def measure_model(path):
+    """Extract a content, and measure the memory of its nodes
+
+    :param path: path of the archive
+    :type path: str
+    :rtype: dict
+    """
+
+    tracemalloc.start()
+    c = fixes.FixableContent.extract(path)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    nodes = list(c.get_index().nodes.values())[1:]  # the content itself is not a node of the tree
+    texts = sum(len(text) for container in c.walk_containers() for _, text in c.container_files(container))
+    sizes = [node_size(node) for node in nodes]
+
+    return {
+        'nodes': len(nodes),
+        'containers': len(c.get_index().containers) - 1,
+        'bytes_per_node': sum(sizes) / len(sizes),
+        'bytes_per_container': sum(
+            s for n, s in zip(nodes, sizes) if isinstance(n, content.Container)) / max(
+            1, sum(1 for n in nodes if isinstance(n, content.Container))),
+        'bytes_per_extract': sum(
+            s for n, s in zip(nodes, sizes) if isinstance(n, content.Extract)) / max(
+            1, sum(1 for n in nodes if isinstance(n, content.Extract))),
+        'extract_retained': retained,
+        'extract_peak': peak,
+        'retained_per_node_without_texts': (retained - texts) / len(nodes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help='write the results in this JSON file')
+    generator.add_arguments(parser)
+    parser.set_defaults(extracts=5000, depth=3, paragraphs=1)
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'synthetic.zip')
+        generator.Generator(generator.parameters_from_arguments(args)).generate(path)
+        results = measure_model(path)
+
+    for name, value in results.items():
+        print('{:<35} {:>14.1f}'.format(name, value))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
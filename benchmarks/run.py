@@ -0,0 +1,191 @@
+"""
+Timing benchmarks, on a synthetic content (see ``benchmarks.generator``).
+
+Usage: ``python -m benchmarks.run [-o results.json] [--compare previous.json] [generator options]``
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import zds_fixcmd
+from zds_fixcmd import content, fixes, math_parser
+from zds_fixcmd.fixes import fix_align, fix_newcommand, fix_spaces
+
+from benchmarks import generator
+
+
+def measure(function, setup=None, repeat=5):
+    """Time a function
+
+    :param function: the function, which gets the result of ``setup()`` (if any) as argument
+    :type function: callable
+    :param setup: prepare the data for each repetition (not timed)
+    :type setup: callable
+    :param repeat: number of repetitions
+    :type repeat: int
+    :return: timings (in seconds)
+    :rtype: dict
+    """
+
+    timings = []
+    for _ in range(repeat):
+        data = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(data)
+        timings.append(time.perf_counter() - start)
+
+    return {'min': min(timings), 'median': statistics.median(timings), 'repeat': repeat}
+
+
+def get_expressions(path):
+    """Get all the math expressions of a content
+
+    :param path: path of the archive
+    :type path: str
+    :rtype: list of str
+    """
+
+    c = fixes.FixableContent.extract(path)
+    return [
+        g.group(2) for container in c.walk_containers() for p, text in c.container_files(container)
+        for g in fixes.FIND_MATH.finditer(text)]
+
+
+def benchmark_fix(fix, expressions, preamble, repeat):
+    """Time a fix on all expressions (with a context that contains the macros of the preamble)
+
+    :param fix: the fix
+    :type fix: zds_fixcmd.fixes.Fix
+    :param expressions: the expressions
+    :type expressions: list of str
+    :param preamble: expression with the macro definitions
+    :type preamble: str
+    :type repeat: int
+    :rtype: dict
+    """
+
+    def setup():
+        context = fix.create_context(None)
+        fix.fix(fixes.MathExpression(preamble), context, 'preamble')
+        return context, [fixes.MathExpression(e) for e in expressions]
+
+    def run(data):
+        context, math_expressions = data
+        for m in math_expressions:
+            fix.fix(m, context, 'benchmark')
+
+    return measure(run, setup, repeat)
+
+
+def run_benchmarks(path, repeat=5):
+    """Run the benchmarks
+
+    :param path: path of the archive
+    :type path: str
+    :param repeat: number of repetitions
+    :type repeat: int
+    :rtype: dict
+    """
+
+    results = {}
+
+    # content
+    results['Content.extract'] = measure(lambda _: content.Content.extract(path), repeat=repeat)
+
+    with tempfile.TemporaryDirectory() as directory:
+        c = content.Content.extract(path)
+        output = os.path.join(directory, 'output.zip')
+        results['Content.save'] = measure(lambda _: c.save(output), repeat=repeat)
+
+    # parser
+    expressions = [e for e in get_expressions(path) if 'newcommand' not in e]
+    preamble = generator.Generator(generator.Parameters()).preamble()[len('Définitions: $'):-1]
+
+    results['MathLexer.tokenize'] = measure(
+        lambda _: [list(math_parser.MathLexer(e).tokenize()) for e in expressions], repeat=repeat)
+    results['MathParser.parse'] = measure(
+        lambda _: [math_parser.MathParser.parse(e, environments=False) for e in expressions], repeat=repeat)
+
+    # (limits that are never reached on normal input, so only the cost of the checks is measured)
+    limits = math_parser.Limits(length=100000, tokens=100000, depth=1000, nodes=100000)
+    results['MathLexer.tokenize+limits'] = measure(
+        lambda _: [list(math_parser.MathLexer(e, limits).tokenize()) for e in expressions], repeat=repeat)
+    results['MathParser.parse+limits'] = measure(
+        lambda _: [math_parser.MathParser.parse(e, environments=False, limits=limits) for e in expressions],
+        repeat=repeat)
+
+    results['EnvironmentFix.modify'] = measure(
+        lambda asts: [math_parser.EnvironmentFix(a).modify() for a in asts if a is not None],
+        lambda: [math_parser.MathParser.parse(e, environments=False) for e in expressions], repeat=repeat)
+
+    asts = [math_parser.MathParser.parse(e) for e in expressions]
+    results['Interpreter.interpret'] = measure(
+        lambda _: [math_parser.Interpreter(a).interpret() for a in asts if a is not None], repeat=repeat)
+
+    # fixes
+    expressions = [e for e in expressions if e.strip() != '']
+    for fix in [fix_newcommand.FixNewCommand(), fix_align.FixAlign(), fix_spaces.FixSpaces()]:
+        results[type(fix).__name__] = benchmark_fix(fix, expressions, preamble, repeat)
+
+    # command
+    with tempfile.TemporaryDirectory() as directory:
+        archive = os.path.join(directory, 'content.zip')
+        with open(path, 'rb') as f, open(archive, 'wb') as g:
+            g.write(f.read())
+
+        results['zds-fixcmd'] = measure(
+            lambda _: subprocess.run(
+                [sys.executable, '-m', 'zds_fixcmd.cmd', '--no-cache', archive], check=True), repeat=repeat)
+
+    for r in results.values():
+        r['expressions'] = len(expressions)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-o', '--output', type=str, help='write the results in JSON')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-c', '--compare', type=str, help='compare with previous results (JSON)')
+    generator.add_arguments(parser)
+    args = parser.parse_args()
+
+    parameters = generator.parameters_from_arguments(args)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'content.zip')
+        generator.Generator(parameters).generate(path)
+        results = run_benchmarks(path, args.repeat)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+
+    for name, r in results.items():
+        line = '{:<25} min={:9.2f}ms median={:9.2f}ms'.format(name, r['min'] * 1000, r['median'] * 1000)
+        if name in previous:
+            line += ' ({:+.1f}%)'.format((r['min'] / previous[name]['min'] - 1) * 100)
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'version': zds_fixcmd.__version__,
+                'python': platform.python_version(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'parameters': vars(parameters),
+                'results': results
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Startup latency of the command, for ``--version`` and for a tiny archive.
+
+Usage: ``python -m benchmarks.startup [-n RUNS] [-o results.json]``
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+MANIFEST = {
+    'version': 2,
+    'type': 'ARTICLE',
+    'title': 'Tiny',
+    'slug': 'tiny',
+    'introduction': 'introduction.md',
+    'conclusion': 'conclusion.md',
+    'children': [{'object': 'extract', 'title': 'Extract', 'slug': 'extract', 'text': 'extract.md'}]
+}
+
+
+def make_tiny_archive(path):
+    """Create a tiny archive, with a single math expression
+
+    :param path: path of the archive
+    :type path: str
+    """
+
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('manifest.json', json.dumps(MANIFEST))
+        archive.writestr('introduction.md', 'Introduction')
+        archive.writestr('extract.md', 'Some math: $\\newcommand{\\a}{x} \\a^2$')
+        archive.writestr('conclusion.md', 'Conclusion')
+
+
+def time_command(arguments, runs):
+    """Run the command several times
+
+    :param arguments: arguments of the command
+    :type arguments: list of str
+    :param runs: number of runs
+    :type runs: int
+    :return: timings (in seconds)
+    :rtype: dict
+    """
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'zds_fixcmd.cmd'] + arguments, check=False, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+
+    return {'min': min(timings), 'median': statistics.median(timings), 'runs': runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--runs', type=int, default=20)
+    parser.add_argument('-o', '--output', type=str, help='write the results in JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tiny.zip')
+        make_tiny_archive(path)
+
+        results = {
+            'version': time_command(['--version'], args.runs),
+            'tiny_archive': time_command(['--no-cache', path], args.runs),
+        }
+
+    for name, r in results.items():
+        print('{:<15} min={:.1f}ms median={:.1f}ms'.format(name, r['min'] * 1000, r['median'] * 1000))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -25,7 +25,7 @@ setup(
     ],
     install_requires=pkgs,
     test_suite='tests',
-    python_requires='>=3',
+    python_requires='>=3.7',
     entry_points={
         'console_scripts': [
             'zds-fixcmd = zds_fixcmd.cmd:main'
@@ -0,0 +1,55 @@
+from tests import ZdsFixCmdTestCase
+
+from zds_fixcmd import api
+from zds_fixcmd.fixes import FixableContent, FixError, get_fixes
+
+
+class ApiTestCase(ZdsFixCmdTestCase):
+
+    def test_fix_text(self):
+        text = 'a $\\newcommand{\\R}{\\mathbb{R}} x \\in \\R$ b $$ y $$'
+
+        self.assertEqual(api.fix_text(text), 'a $x \\in \\mathbb{R}$ b $$y$$')
+        self.assertEqual(api.fix_text(text.encode('utf-8')), 'a $x \\in \\mathbb{R}$ b $$y$$'.encode('utf-8'))
+        self.assertEqual(api.fix_text(text, fixes=['spaces']), 'a $\\newcommand{\\R}{\\mathbb{R}} x \\in \\R$ b $$y$$')
+        self.assertEqual(api.fix_text('no math'), 'no math')
+
+        self.assertEqual(api.fix_expression(' x '), 'x')
+        self.assertEqual(api.fix_expression('\\newcommand{\\R}{x}'), '')
+
+        with self.assertRaises(FixError):
+            api.fix_expression('a$')
+
+    def test_contexts(self):
+        texts = ['$\\newcommand{\\R}{y}\\R$', '$\\R$']
+
+        # new contexts for each call, unless shared
+        self.assertEqual([api.fix_text(t) for t in texts], ['$y$', '$\\R$'])
+        self.assertEqual(list(api.fix_many(texts)), ['$y$', '$\\R$'])
+
+        context = api.TextFixer()
+        self.assertEqual([api.fix_text(t, context=context) for t in texts], ['$y$', '$y$'])
+        self.assertEqual(api.fix_expression('\\R^2', context=context), 'y^2')
+        self.assertEqual(list(api.fix_many(['$\\R$'], context=context)), ['$y$'])
+
+        context.reset()
+        self.assertEqual(api.fix_text('$\\R$', context=context), '$\\R$')
+
+        with self.assertRaises(ValueError):
+            api.fix_text('$x$', fixes=['spaces'], context=context)
+
+    def test_same_as_content(self):
+        path = self.copy_to_temporary_directory('tuto.zip')
+
+        c = FixableContent.extract(path)
+        texts = [(container, text) for container in c.walk_containers() for _, text in c.container_files(container)]
+
+        fixed = FixableContent.extract(path, fixes=get_fixes())
+        fixed.fix()
+
+        # with a context per container
+        contexts = {}
+        for (container, text), (_, expected) in zip(
+                texts, [(p, t) for x in fixed.walk_containers() for p, t in fixed.container_files(x)]):
+            context = contexts.setdefault(container.key, api.TextFixer())
+            self.assertEqual(api.fix_text(text, context=context), expected)
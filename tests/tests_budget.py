@@ -0,0 +1,160 @@
+import multiprocessing
+import os
+import threading
+import time
+
+from tests import ZdsFixCmdTestCase
+
+from zds_fixcmd import budget, cache, pool
+from zds_fixcmd.fixes import FixableContent
+
+
+def slow_fix(math_expr, container, path, *args, **kwargs):
+    if 'slow' in math_expr.base_expression:
+        end = time.monotonic() + 60
+        while time.monotonic() < end:
+            pass
+
+
+def run_task(task, factor):
+    if task == 'raise':
+        raise ValueError('nope')
+    elif task == 'exit':
+        os._exit(3)
+    elif task == 'hang':
+        time.sleep(60)
+
+    return task * factor
+
+
+class SlowConnection:
+    """Connection to a database whose writes take some time (or fail)"""
+
+    def __init__(self, connection, error=None):
+        self.connection = connection
+        self.error = error
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def executemany(self, *args):
+        time.sleep(.2)
+        if self.error is not None:
+            raise self.error
+        return self.connection.executemany(*args)
+
+
+class BudgetTestCase(ZdsFixCmdTestCase):
+
+    def make_content(self, text):
+        c = FixableContent('test', 'test', fixes=[slow_fix])
+        c.introduction_path = 'introduction.md'
+        c.introduction_value = text
+        return c
+
+    def test_expression_budget(self):
+        c = self.make_content('$a$ $\\slow$\n$b$')
+        c.errors = []
+        c.budget = budget.Budget(expression=0.05)
+
+        t = time.monotonic()
+        with c.budget:
+            c.fix()
+
+        self.assertLess(time.monotonic() - t, 10)
+        self.assertEqual(len(c.errors), 1)
+        self.assertEqual((c.errors[0].path, c.errors[0].column), ('introduction.md', 5))
+        self.assertEqual(c.errors[0].message, 'expression budget of 0.05s exceeded')
+        self.assertEqual(c.introduction_value, '$a$ $\\slow$\n$b$')
+
+        # without collecting the errors
+        c = self.make_content('$\\slow$')
+        c.budget = budget.Budget(expression=0.05)
+        with self.assertRaises(budget.ExpressionBudgetExceeded):
+            with c.budget:
+                c.fix()
+
+    def test_archive_budget(self):
+        c = self.make_content('$a$ $\\slow$')
+        c.errors = []
+        c.budget = budget.Budget(expression=30, archive=0.05)
+
+        with self.assertRaises(budget.ArchiveBudgetExceeded) as e:
+            with c.budget:
+                c.fix()
+
+        self.assertEqual(e.exception.path, 'introduction.md')
+        self.assertEqual(len(c.errors), 0)
+
+        # the timer is disarmed
+        time.sleep(0.1)
+
+    def test_outside_main_thread(self):
+        results = []
+
+        def target():
+            c = self.make_content('$\\slow b$ $a$')
+            c.fixes = [lambda *_: time.sleep(0.05)]
+            c.errors = []
+            c.budget = budget.Budget(expression=0.01)
+            with c.budget:
+                c.fix()
+            results.append((c.budget.preemptive, len(c.errors)))
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(results, [(False, 2)])
+
+    def test_pool(self):
+        with pool.WorkerPool(run_task, (2, ), processes=2, timeout=1) as p:
+            results = {task: (success, result) for task, success, result in p.imap_unordered(
+                ['a', 'raise', 'exit', 'hang', 'b'])}
+
+            self.assertEqual(p.replaced, 2)
+
+        self.assertEqual(results['a'], (True, 'aa'))
+        self.assertEqual(results['b'], (True, 'bb'))
+        self.assertEqual(results['raise'], (False, 'ValueError: nope'))
+        self.assertEqual(results['exit'], (False, 'worker died (exit code 3)'))
+        self.assertEqual(results['hang'], (False, 'worker killed after 1s'))
+
+        # the other ways to start the workers
+        for start_method in ['forkserver', 'spawn']:
+            if start_method not in multiprocessing.get_all_start_methods():
+                continue
+
+            with pool.WorkerPool(
+                    run_task, (2, ), processes=2, start_method=start_method, preload=['zds_fixcmd.fixes']) as p:
+                self.assertEqual(
+                    sorted(p.imap_unordered(['a', 'raise', 'b'])),
+                    [('a', True, 'aa'), ('b', True, 'bb'), ('raise', False, 'ValueError: nope')])
+
+    def test_cache_flush(self):
+        c = cache.FixCache(os.path.join(self.temporary_directory, 'cache'))
+        connection = c.connection
+        c.connection = SlowConnection(connection)
+
+        # the budget is exceeded during the transaction, which is completed first
+        c.put('a', 'x')
+        with self.assertRaises(budget.ArchiveBudgetExceeded):
+            with budget.Budget(archive=0.05):
+                c.flush()
+
+        self.assertFalse(connection.in_transaction)
+        self.assertEqual(c.new, {})
+
+        # any other interruption rolls the transaction back
+        c.put('b', 'y')
+        c.connection.error = KeyboardInterrupt()
+        with self.assertRaises(KeyboardInterrupt):
+            c.flush()
+
+        self.assertFalse(connection.in_transaction)
+        self.assertEqual(c.new, {'b': 'y'})
+
+        c.connection = connection
+        c.flush()
+        self.assertEqual((c.get('a'), c.get('b')), ('x', 'y'))
+        c.close()
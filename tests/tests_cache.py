@@ -0,0 +1,137 @@
+import argparse
+import os
+import time
+
+from tests import ZdsFixCmdTestCase
+
+from zds_fixcmd import cache, cmd, fixes, math_parser
+from zds_fixcmd.fixes import fix_newcommand, fix_spaces, fix_align
+
+
+class CacheTestCase(ZdsFixCmdTestCase):
+
+    def test_cache(self):
+        directory = os.path.join(self.temporary_directory, 'cache')
+        c = cache.FixCache(directory, max_entries=2)
+
+        c.put('a', 'x')
+        self.assertEqual(c.get('a'), 'x')  # buffered
+        c.flush()
+        self.assertEqual(c.get('a'), 'x')
+        self.assertIsNone(c.get('b'))
+        c.close()
+
+        # LRU eviction
+        c = cache.FixCache(directory, max_entries=2)
+        self.assertEqual(c.get('a'), 'x')
+        time.sleep(.01)
+        c.put('b', 'y')
+        c.flush()
+        time.sleep(.01)
+        c.get('a')
+        c.put('c', 'z')
+        c.flush()
+
+        self.assertEqual(len(c), 2)
+        self.assertIsNone(c.get('b'))
+        self.assertEqual(c.get('a'), 'x')
+        c.close()
+
+    def test_memory_cache(self):
+        c = cache.FixCache(os.path.join(self.temporary_directory, 'cache'))
+        m = cache.MemoryCache(2, backend=c)
+
+        m.put('a', 'x')
+        m.put('b', 'y')
+        self.assertEqual(m.get('a'), 'x')
+        m.put('c', 'z')  # "b" is the least recently used
+
+        self.assertEqual(len(m), 2)
+        self.assertEqual((m.get('a'), m.get('c')), ('x', 'z'))
+        self.assertEqual(c.hits, 0)
+
+        self.assertEqual(m.get('b'), 'y')  # from the persistent cache
+        self.assertEqual(c.hits, 1)
+        self.assertIsNone(m.get('d'))
+        self.assertEqual((m.hits, m.misses), (4, 1))
+
+        c.close()
+
+    def test_cache_content(self):
+        def get_fixes():
+            return [fix_newcommand.FixNewCommand(), fix_align.FixAlign(), fix_spaces.FixSpaces()]
+
+        path = self.copy_to_temporary_directory('tuto.zip')
+        directory = os.path.join(self.temporary_directory, 'cache')
+
+        # first run: everything is a miss
+        c = cache.FixCache(directory)
+        content = fixes.FixableContent.extract(path, fixes=get_fixes(), cache=c)
+        content.fix()
+        self.assertEqual(c.hits, 0)
+        self.assertNotEqual(c.misses, 0)
+        c.close()
+
+        # second run: only expressions with side effects are not in the cache
+        c = cache.FixCache(directory)
+        content_cached = fixes.FixableContent.extract(path, fixes=get_fixes(), cache=c)
+        content_cached.fix()
+        self.assertNotEqual(c.hits, 0)
+        original = fixes.FixableContent.extract(path)
+        definitions = [
+            g for x in original.walk_containers() for p, t in original.container_files(x)
+            for g in fixes.FIND_MATH.finditer(t) if 'newcommand' in g.group(2)]
+
+        self.assertNotEqual(len(definitions), 0)
+        self.assertEqual(c.misses, len(definitions))
+
+        for x, y in zip(content.walk_containers(), content_cached.walk_containers()):
+            self.assertEqual(list(content.container_files(x)), list(content_cached.container_files(y)))
+
+        c.close()
+
+    def test_cache_limits(self):
+        directory = os.path.join(self.temporary_directory, 'cache')
+        c = cache.FixCache(directory)
+
+        def fix(text, limits=None):
+            content = fixes.FixableContent('test', 'test', fixes=[fix_spaces.FixSpaces()], cache=c)
+            content.limits = limits
+            return content.fix_document(text, content, 'text.md').materialize()
+
+        self.assertEqual(fix('$ a+b $'), '$a+b$')
+        self.assertEqual(fix('$ a+b $'), '$a+b$')
+        self.assertEqual(c.hits, 1)
+
+        # the limits are checked, even for the expressions that are in the cache
+        with self.assertRaises(math_parser.LimitExceeded):
+            fix('$ a+b $', math_parser.Limits(length=3))
+
+        c.close()
+
+    def test_open_cache(self):
+        def open_cache(*args):
+            parser = argparse.ArgumentParser()
+            cmd.add_cache_arguments(parser)
+            return cmd.open_cache(parser.parse_args(list(args)))
+
+        directory = os.path.join(self.temporary_directory, 'cache')
+
+        # opt-in
+        self.assertIsNone(open_cache())
+        self.assertIsNone(open_cache('--cache-dir', directory, '--no-cache'))
+
+        c = open_cache('--cache-dir', directory)
+        self.assertIsNotNone(c)
+        c.close()
+
+    def test_fingerprint(self):
+        self.assertNotEqual(
+            fixes.fixes_fingerprint([fix_spaces.FixSpaces()]),
+            fixes.fixes_fingerprint([fix_spaces.FixSpaces(fix_environments=False)]))
+
+        # the code of the fixes is part of it
+        fingerprint = fixes.fixes_fingerprint([fix_align.FixAlign()])
+        fixes.code_fingerprint.cache_clear()
+        self.assertEqual(fixes.fixes_fingerprint([fix_align.FixAlign()]), fingerprint)
+        self.assertNotEqual(fixes.code_fingerprint(fix_align.__name__), '')
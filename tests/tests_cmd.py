@@ -0,0 +1,167 @@
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
+from tests import ZdsFixCmdTestCase
+
+from zds_fixcmd import cmd
+
+
+class CmdTestCase(ZdsFixCmdTestCase):
+
+    def run_command(self, *args, stdin=b''):
+        return subprocess.run(
+            [sys.executable, '-m', 'zds_fixcmd.cmd', '--no-cache'] + list(args), input=stdin, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, cwd=os.path.dirname(self.tests_files_directory), check=True).stdout
+
+    def test_get_output(self):
+        def output(infile, output=None, format_='zip'):
+            return cmd.get_output(infile, argparse.Namespace(output=output, format=format_, in_place=False))
+
+        self.assertEqual(output('a.zip'), 'a.fix.zip')
+        self.assertEqual(output('a.zip.d/b.zip'), 'a.zip.d/b.fix.zip')
+        self.assertEqual(output('a'), 'a.fix.zip')
+        self.assertEqual(output('a.md', format_='markdown'), 'a.fix.md')
+        self.assertEqual(output('-'), '-')
+        self.assertEqual(output('a.zip', 'b.zip'), 'b.zip')
+
+    def test_stdio(self):
+        path = self.copy_to_temporary_directory('tuto.zip')
+        with open(path, 'rb') as f:
+            archive = f.read()
+
+        # archives are piped
+        fixed = self.run_command('-', stdin=self.run_command('-', stdin=archive))
+        self.run_command(path, '-o', os.path.join(self.temporary_directory, 'output.zip'))
+
+        with zipfile.ZipFile(io.BytesIO(fixed)) as piped, \
+                zipfile.ZipFile(os.path.join(self.temporary_directory, 'output.zip')) as expected:
+            self.assertEqual(sorted(piped.namelist()), sorted(expected.namelist()))
+            for name in expected.namelist():
+                self.assertEqual(piped.read(name), expected.read(name))
+
+        # markdown
+        self.assertEqual(
+            self.run_command('-f', 'markdown', '-', stdin='a $\\newcommand{\\R}{x} \\R$ b $ y $'.encode()),
+            b'a $x$ b $y$')
+
+    def test_markdown_arguments(self):
+        directory = os.path.join(self.temporary_directory, 'content')
+        os.makedirs(directory)
+
+        for arguments in [[directory], ['--in-place', directory]]:
+            process = subprocess.run(
+                [sys.executable, '-m', 'zds_fixcmd.cmd', '-f', 'markdown'] + arguments, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, cwd=os.path.dirname(self.tests_files_directory))
+            self.assertEqual(process.returncode, 1)
+            self.assertNotIn(b'Traceback', process.stderr)
+            self.assertIn(b'markdown', process.stderr)
+
+    def test_serve_arguments(self):
+        for arguments in [['--workers', '0'], ['--max-pending', '0'], ['--memory-cache-size', '-1']]:
+            process = subprocess.run(
+                [sys.executable, '-m', 'zds_fixcmd.cmd', 'serve', '--port', '0'] + arguments, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, cwd=os.path.dirname(self.tests_files_directory), timeout=30)
+            self.assertEqual(process.returncode, 1)
+            self.assertIn(arguments[0].encode(), process.stderr)
+
+    def test_resume(self):
+        path = self.copy_to_temporary_directory('tuto.zip')
+        output = os.path.join(self.temporary_directory, 'tuto.fix.zip')
+        journal_path = os.path.join(self.temporary_directory, 'journal.jsonl')
+
+        self.run_command(path, '--journal', journal_path, '--resume')
+        modified = os.path.getmtime(output)
+        os.utime(output, (0, 0))
+
+        # done, so skipped
+        self.run_command(path, '--journal', journal_path, '--resume')
+        self.assertEqual(os.path.getmtime(output), 0)
+
+        # unless the input changed
+        with open(path, 'ab') as f:
+            f.write(b'\0')
+        self.run_command(path, '--journal', journal_path, '--resume')
+        self.assertGreaterEqual(os.path.getmtime(output), modified)
+
+        with open(journal_path) as f:
+            self.assertEqual([json.loads(line)['status'] for line in f], ['started', 'done'] * 2)
+
+        # in place: the input is replaced by the output, which is done
+        directory = os.path.join(self.temporary_directory, 'tuto')
+        with zipfile.ZipFile(path) as archive:
+            archive.extractall(directory)
+
+        journal_path = os.path.join(self.temporary_directory, 'journal-in-place.jsonl')
+        self.run_command(directory, '--in-place', '--journal', journal_path, '--resume')
+        self.run_command(directory, '--in-place', '--journal', journal_path, '--resume')
+
+        with open(journal_path) as f:
+            self.assertEqual([json.loads(line)['status'] for line in f], ['started', 'done'])
+
+    def test_jobs(self):
+        paths = [self.copy_to_temporary_directory('tuto.zip'), self.copy_to_temporary_directory('article.zip')]
+        outputs = [os.path.join(self.temporary_directory, name) for name in ('tuto.fix.zip', 'article.fix.zip')]
+
+        self.run_command(*paths)
+        expected = []
+        for output in outputs:
+            with open(output, 'rb') as f:
+                expected.append(f.read())
+            os.remove(output)
+
+        self.run_command('-j', '2', *paths)
+        for output, data in zip(outputs, expected):
+            with open(output, 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+        # a budget that is exceeded does not stop the run
+        for output in outputs:
+            os.remove(output)
+
+        error_report = os.path.join(self.temporary_directory, 'errors.json')
+        process = subprocess.run(
+            [sys.executable, '-m', 'zds_fixcmd.cmd', '--no-cache', '-j', '2', '--archive-budget', '0.000001',
+             '--error-report', error_report] + paths,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=os.path.dirname(self.tests_files_directory))
+
+        self.assertEqual(process.returncode, 1)
+        self.assertFalse(any(os.path.exists(output) for output in outputs))
+
+        with open(error_report) as f:
+            self.assertEqual(sorted(e['archive'] for e in json.load(f)), sorted(paths))
+
+    def test_keep_going(self):
+        path = os.path.join(self.temporary_directory, 'text.md')
+        expression = '$' + '{' * 100 + 'x$'
+        with open(path, 'w') as f:
+            f.write('a $ b $ ' + expression)
+
+        error_report = os.path.join(self.temporary_directory, 'errors.json')
+        process = subprocess.run(
+            [sys.executable, '-m', 'zds_fixcmd.cmd', '--no-cache', '-f', 'markdown', '-k', '--error-report',
+             error_report, path], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=os.path.dirname(self.tests_files_directory))
+
+        self.assertEqual(process.returncode, 1)
+        with open(os.path.join(self.temporary_directory, 'text.fix.md')) as f:
+            self.assertEqual(f.read(), 'a $b$ ' + expression)
+
+        # the expression is truncated in stderr, but not in the report
+        self.assertIn(':1:9: ', process.stderr.decode())
+        self.assertIn(expression[:57] + '...)\n', process.stderr.decode())
+        with open(error_report) as f:
+            self.assertEqual([e['expression'] for e in json.load(f)], [expression])
+
+    def test_macros(self):
+        path = os.path.join(self.temporary_directory, 'macros.tex')
+        with open(path, 'w') as f:
+            f.write('\\newcommand{\\R}{\\mathbb{R}}\n\\newcommand{\\N}{\\mathbb{N}}\n')
+
+        self.assertEqual(
+            self.run_command('-f', 'markdown', '--macros', path, '-', stdin='$\\N \\subset \\R$'.encode()),
+            b'$\\mathbb{N} \\subset \\mathbb{R}$')
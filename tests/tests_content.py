@@ -1,4 +1,5 @@
 import os
+import zipfile
 
 from tests import ZdsFixCmdTestCase
 
@@ -37,6 +38,8 @@ class ContentTestCase(ZdsFixCmdTestCase):
         self.assertEqual(tuto.title, 'Un tuto de test')
         self.assertEqual(len(tuto.children), 2)
         self.assertTrue(all(type(c) is content.Container for c in tuto.children))
+        self.assertFalse(hasattr(tuto.children[0], '__dict__'))  # slotted
+        self.assertIs(tuto.children[0].children[0].parent.top_container(), tuto)
 
         # write
         tuto.children[0].conclusion_value = self.text
@@ -44,3 +47,111 @@ class ContentTestCase(ZdsFixCmdTestCase):
         tuto.save(npath)
         tuto = content.Content.extract(npath)
         self.assertEqual(tuto.children[0].conclusion_value, self.text)
+
+    def test_document(self):
+        text = 'a $x$ b $y$ c'
+
+        document = content.Document(text)
+        self.assertFalse(document.modified)
+        self.assertEqual(document.materialize(), text)
+        self.assertEqual(''.join(document.chunks()), text)
+
+        document.edit(2, 3, '$z$')
+        document.edit(8, 3, '')
+        self.assertTrue(document.modified)
+        self.assertEqual(document.materialize(), 'a $z$ b  c')
+
+        with self.assertRaises(ValueError):
+            document.edit(9, 1, 'x')  # overlaps
+
+        # bytes
+        document = content.Document(text.encode('utf-8'))
+        document.edit(0, 1, b'A')
+        self.assertEqual(document.materialize(), b'A $x$ b $y$ c')
+
+        # documents are streamed in the archive
+        path = self.copy_to_temporary_directory('article.zip')
+        article = content.Content.extract(path)
+        document = content.Document(article.conclusion_value)
+        document.edit(0, 0, self.text)
+        article._conclusion_value = document
+
+        npath = os.path.join(self.temporary_directory, 'new_article.zip')
+        article.save(npath)
+        self.assertIsInstance(article._conclusion_value, content.Document)  # not materialized
+
+        article = content.Content.extract(npath)
+        self.assertTrue(article.conclusion_value.startswith(self.text))
+
+    def test_index(self):
+        path = self.copy_to_temporary_directory('tuto.zip')
+        tuto = content.Content.extract(path)
+        index = tuto.get_index()
+
+        # pre-order, with unique keys
+        containers = [tuto]
+        for part in tuto.children:
+            containers.append(part)
+            containers.extend(c for c in part.children if isinstance(c, content.Container))
+
+        self.assertEqual(index.containers, containers)
+        self.assertEqual(index.subtree(tuto.children[1]), containers[containers.index(tuto.children[1]):])
+        self.assertTrue(all(index.nodes[c.key] is c for c in containers))
+        self.assertEqual(tuto.children[0].key, tuto.slug + '/' + tuto.children[0].slug)
+
+        # same slugs in different places (or for siblings) do not collide
+        x = content.Content('x', 'x')
+        for slug in ['a', 'b', 'a']:
+            part = content.Container(slug, slug)
+            x.add_child(part)
+            part.add_child(content.Container('c', 'c'))
+
+        index = x.get_index()
+        self.assertEqual([c.key for c in index.containers], ['x', 'x/a', 'x/a/c', 'x/b', 'x/b/c', 'x/a~2', 'x/a~2/c'])
+        self.assertEqual(index.subtree(x.children[1]), x.children[1:2] + x.children[1].children)
+
+        # the index is rebuilt when the tree changes
+        x.children[2].add_child(content.Container('d', 'd'))
+        self.assertIsNot(x.get_index(), index)
+        self.assertEqual(x.get_index().nodes['x/a~2/d'], x.children[2].children[1])
+
+    def test_directory(self):
+        directory = os.path.join(self.temporary_directory, 'tuto')
+        with zipfile.ZipFile(self.copy_to_temporary_directory('tuto.zip')) as archive:
+            archive.extractall(directory)
+
+        tuto = content.Content.extract(os.path.join(self.temporary_directory, 'tuto.zip'))
+
+        # large files are memory-mapped
+        mmap_min_size = content.MMAP_MIN_SIZE
+        content.MMAP_MIN_SIZE = 0
+        try:
+            tuto_directory = content.Content.extract(directory)
+        finally:
+            content.MMAP_MIN_SIZE = mmap_min_size
+
+        self.assertEqual(tuto_directory.directory, directory)
+        self.assertEqual(
+            [(p, getattr(n, a)) for p, n, a in tuto_directory.get_index().files],
+            [(p, getattr(n, a)) for p, n, a in tuto.get_index().files])
+        self.assertEqual(tuto_directory.changed_paths(), [])
+
+        # only the files that changed are written in place
+        path = tuto_directory.children[0].conclusion_path
+        tuto_directory.children[0].conclusion_value = self.text
+
+        self.assertEqual(tuto_directory.changed_paths(), [path])
+        self.assertEqual(tuto_directory.save_directory(), len(self.text.encode('utf-8')))
+
+        with open(os.path.join(directory, path), encoding='utf-8') as f:
+            self.assertEqual(f.read(), self.text)
+
+        # ... or in a mirror, where the other files are copied once
+        mirror = os.path.join(self.temporary_directory, 'mirror')
+        self.assertGreater(tuto_directory.save_directory(mirror), len(self.text.encode('utf-8')))
+        self.assertEqual(tuto_directory.save_directory(mirror), len(self.text.encode('utf-8')))
+        self.assertEqual(content.Content.extract(mirror).children[0].conclusion_value, self.text)
+
+        # the files cannot be outside of the directory
+        with self.assertRaises(content.BadManifestError):
+            content.DirectorySource(directory).full_path('../manifest.json')
@@ -0,0 +1,90 @@
+from tests import ZdsFixCmdTestCase
+
+from zds_fixcmd import differential, math_parser
+
+
+class BrokenEngine(differential.Engine):
+    """Merge the strings that follow each other in the output"""
+
+    def interpret(self, ast):
+        return super().interpret(ast).replace('x y', 'xy')
+
+
+class NoFixEngine(differential.Engine):
+    """Parse and render the expressions, but do not fix them"""
+
+    def get_fixes(self):
+        return []
+
+
+class LimitedEngine(differential.Engine):
+    """Parse with limits"""
+
+    def __init__(self, **limits):
+        self.limits = math_parser.Limits(**limits)
+
+    def parse(self, expression):
+        return math_parser.MathParser.parse(expression, limits=self.limits)
+
+
+class DifferentialTestCase(ZdsFixCmdTestCase):
+
+    def test_harness(self):
+        harness = differential.Harness(differential.Engine())
+        paths = [self.copy_to_temporary_directory(archive) for archive in ['article.zip', 'tuto.zip']]
+        for path in paths:
+            self.assertTrue(harness.compare_content(path))
+
+        self.assertNotEqual(harness.expressions, 0)
+        self.assertEqual(harness.mismatches, [])
+
+        harness = differential.Harness(BrokenEngine())
+        self.assertTrue(harness.compare_expression('a+b'))
+        self.assertFalse(harness.compare_expression('\\frac{x y}{2}', 'test'))
+
+        self.assertEqual(len(harness.mismatches), 1)
+        mismatch = harness.mismatches[0]
+        self.assertEqual(mismatch.stage, 'output')
+        self.assertEqual(mismatch.index, 7)
+        self.assertEqual(mismatch.location, 'test')
+
+        # the fixed contents are produced by the engine
+        harness = differential.Harness(NoFixEngine())
+        path = paths[1]
+        self.assertNotEqual(harness.alternative.fix_content(path), harness.reference.fix_content(path))
+        self.assertFalse(harness.compare_content(path))
+        self.assertIn('fix', [m.stage for m in harness.mismatches])
+
+        # errors agree if they are the same
+        harness = differential.Harness(differential.Engine())
+        self.assertTrue(harness.compare_expression('\\frac{a'))
+        self.assertEqual(harness.mismatches, [])
+
+        harness = differential.Harness(LimitedEngine(depth=1), LimitedEngine(nodes=2))
+        self.assertFalse(harness.compare_expression('{{a}}', 'test'))
+        self.assertEqual(len(harness.mismatches), 1)
+        self.assertEqual(harness.mismatches[0].stage, 'ast')
+        self.assertIn('nodes', harness.mismatches[0].reference)
+        self.assertIn('nested', harness.mismatches[0].alternative)
+
+    def test_ast_dump(self):
+        self.assertEqual(
+            differential.ASTDump(math_parser.MathParser.parse('\\frac{a}{b}_2')).dump(), [
+                'Expression',
+                "  Command('frac', 2)",
+                '    SubElement({})', '      Expression', "        String('a')",
+                '    SubElement({})', '      Expression', "        String('b')",
+                '  Expression', "    UnaryOperator('_')", "      String('2')"
+            ])
+
+    def test_round_trip(self):
+        generator = differential.RandomMath(seed=42)
+        for i in range(500):
+            mismatch = differential.round_trip(generator.expression(), str(i))
+            self.assertIsNone(mismatch, str(mismatch))
+
+        mismatch = differential.round_trip('\\frac{a}{b}', engine=BrokenEngine())
+        self.assertIsNone(mismatch)
+
+        mismatch = differential.round_trip('x y', engine=BrokenEngine())
+        self.assertEqual((mismatch.stage, mismatch.index), ('round-trip', 1))
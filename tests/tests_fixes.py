@@ -1,6 +1,8 @@
+import os
+
 from tests import ZdsFixCmdTestCase
 
-from zds_fixcmd import fixes, math_parser
+from zds_fixcmd import fixes, math_parser, profiling, content as content_module
 from zds_fixcmd.fixes import fix_newcommand, fix_spaces, fix_align
 
 
@@ -53,8 +55,158 @@ class FixTestCase(ZdsFixCmdTestCase):
         content = fixes.FixableContent.extract(self.path, fixes=[f])
         content.fix()
 
+        self.assertIsInstance(content, fixes.FixableContent)
+        self.assertTrue(all(c.parent is content for c in content.children))
+
         self.assertEqual(f.context['naviguer-presque-sans-gps-grace-a-la-navigation-inertielle'].data, 12)
 
+    def test_unmodified_paths(self):
+        """Only the files with math expressions that changed are edited"""
+
+        content = fixes.FixableContent.extract(self.path, fixes=[fix_newcommand.FixNewCommand()])
+        content.fix()
+
+        unmodified = content.unmodified_paths()
+        self.assertIn(content.introduction_path, unmodified)
+        self.assertNotIn(content.children_dict['principe-physique'].text_path, unmodified)
+        self.assertIsInstance(content.children_dict['principe-physique']._text_value, content_module.Document)
+
+    def test_check(self):
+        """Check finds the same files as the one that the fixes modify"""
+
+        def get_fixes():
+            return [fix_newcommand.FixNewCommand(), fix_align.FixAlign(), fix_spaces.FixSpaces()]
+
+        for archive in ['article.zip', 'tuto.zip']:
+            path = self.copy_to_temporary_directory(archive, 'check_' + archive)
+
+            content = fixes.FixableContent.extract(path, fixes=get_fixes())
+            content.fix()
+            modified = [p for p, n in content.edits.items() if n != 0]
+            self.assertNotEqual(len(modified), 0)
+
+            content_check = fixes.FixableContent.extract(path, fixes=get_fixes(), raw=True)
+            self.assertEqual(content_check.check(stop_at_first=False), modified)
+
+            content_check = fixes.FixableContent.extract(path, fixes=get_fixes())
+            self.assertEqual(content_check.check(), modified[:1])
+
+            # once fixed, nothing to do
+            fixed_path = os.path.join(self.temporary_directory, 'fixed_' + archive)
+            content.save(fixed_path)
+            content_check = fixes.FixableContent.extract(fixed_path, fixes=get_fixes())
+            self.assertEqual(content_check.check(stop_at_first=False), [])
+
+    def test_memoize(self):
+        """Identical expressions are only fixed once per context"""
+
+        def get_fixes():
+            return [fix_newcommand.FixNewCommand(), fix_align.FixAlign(), fix_spaces.FixSpaces()]
+
+        path = self.copy_to_temporary_directory('tuto.zip', 'memo_tuto.zip')
+
+        content = fixes.FixableContent.extract(path, fixes=get_fixes())
+        self.assertIsNone(content.memo)
+        content.fix()
+
+        content_memo = fixes.FixableContent.extract(path, fixes=get_fixes(), memoize=True)
+        content_memo.fix()
+        self.assertNotEqual(len(content_memo.memo), 0)
+        self.assertFalse(any('newcommand' in key[1] for key in content_memo.memo))  # side effects
+
+        for c, c_memo in zip(content.walk_containers(), content_memo.walk_containers()):
+            self.assertEqual(list(content.container_files(c)), list(content_memo.container_files(c_memo)))
+
+        # a fix that is a function cannot declare side effects
+        self.assertIsNone(fixes.FixableContent.extract(path, memoize=True).memo)
+
+        # same expression, but context changed in between
+        content = fixes.FixableContent('test', 'test', fixes=get_fixes(), memoize=True)
+        self.assertEqual(
+            content.fix_document('$\\a$ $\\newcommand{\\a}{b}$ $\\a$', content, 'test').materialize(), '$\\a$  $b$')
+
+    def test_profile(self):
+        """Profiling gives the same result, and records the stages"""
+
+        path = self.copy_to_temporary_directory('tuto.zip', 'profile_tuto.zip')
+
+        content = fixes.FixableContent.extract(path, fixes=[fix_newcommand.FixNewCommand()])
+        content.fix()
+
+        profiler = profiling.Profiler(slowest=3)
+        content_profiled = fixes.FixableContent.extract(path, fixes=[fix_newcommand.FixNewCommand()])
+        content_profiled.profiler = profiler
+        content_profiled.fix()
+
+        for c, c_profiled in zip(content.walk_containers(), content_profiled.walk_containers()):
+            self.assertEqual(list(content.container_files(c)), list(content_profiled.container_files(c_profiled)))
+
+        report = profiler.report()
+        for stage in ['scan', 'lex', 'parse', 'environments', 'fix:FixNewCommand', 'render']:
+            self.assertIn(stage, report['stages'])
+
+        self.assertEqual(report['stages']['parse']['calls'], report['stages']['scan']['calls'])
+        self.assertEqual(len(report['slowest']), 3)
+
+        # the slowest expressions are located in the original files
+        original = fixes.FixableContent.extract(path)
+        texts = dict((p, t) for c in original.walk_containers() for p, t in original.container_files(c))
+
+        for e in report['slowest']:
+            self.assertEqual(
+                fixes.FIND_MATH.match(texts[e['path']], e['offset']).group(2), e['expression'])
+
+    def test_fix_raw(self):
+        """Fixing the UTF-8 bytes gives the same result as fixing the text"""
+
+        for archive in ['article.zip', 'tuto.zip']:
+            path = self.copy_to_temporary_directory(archive, 'raw_' + archive)
+
+            content = fixes.FixableContent.extract(path, fixes=[fix_newcommand.FixNewCommand()])
+            content.fix()
+
+            content_raw = fixes.FixableContent.extract(path, fixes=[fix_newcommand.FixNewCommand()], raw=True)
+            self.assertEqual(type(content_raw.introduction_value), bytes)
+            content_raw.fix()
+
+            containers = list(content.walk_containers())
+            containers_raw = list(content_raw.walk_containers())
+            self.assertEqual(len(containers), len(containers_raw))
+
+            for c, c_raw in zip(containers, containers_raw):
+                self.assertEqual(c.introduction_value.encode('utf-8'), c_raw.introduction_value)
+                self.assertEqual(c.conclusion_value.encode('utf-8'), c_raw.conclusion_value)
+
+                for e, e_raw in zip(c.children, c_raw.children):
+                    if isinstance(e, content_module.Extract):
+                        self.assertEqual(e.text_value.encode('utf-8'), e_raw.text_value)
+
+    def test_collect_errors(self):
+        """The expressions that cannot be fixed are left untouched, and reported"""
+
+        text = 'a $ x $ b\nc $\\frac{a$ d $$ é $\n$ y $'
+
+        for raw in [False, True]:
+            content = fixes.FixableContent('t', 't', fixes=fixes.get_fixes())
+            content.introduction_path = 'text.md'
+            content.introduction_value = text.encode('utf-8') if raw else text
+
+            with self.assertRaises(math_parser.ParserException):
+                content.fix()
+
+            content.introduction_value = text.encode('utf-8') if raw else text
+            content.errors = []
+            content.fix()
+
+            fixed = content.introduction_value
+            self.assertEqual(fixed.decode('utf-8') if raw else fixed, 'a $x$ b\nc $\\frac{a$ d $$ é $\n$y$')
+
+            self.assertEqual(
+                [(e.path, e.line, e.column, e.expression) for e in content.errors],
+                [('text.md', 2, 3, '$\\frac{a$'), ('text.md', 2, 15, '$$ é $')])
+            self.assertEqual(content.errors[1].offset, 24)
+            self.assertIn('not the same', content.errors[1].message)
+
 
 class WithCheck:
     def check_base(self, expr, expected, fix, context):
@@ -81,6 +233,7 @@ class NewCommandTestCase(ZdsFixCmdTestCase, WithCheck):
         self.check('\\newcommand{\\a}[1]{x: #1}\\a 1', 'x:  1')
         self.check('\\newcommand{\\a}[1]{\\u{#1}}\\newcommand{\\b}[1]{\\v{#1}}\\a{x}\\b{y}', '\\u{x}\\v{y}')
         self.check('x\\newcommand{\\a}[1]{\\u{#1}}\\newcommand{\\b}[1]{\\v{#1}}\\a{\\b{y}}', 'x\\u{\\v{y}}')
+        self.check('\\newcommand{\\a}[1]{\\u #1\\v}\\a{\\beta_0}', '\\u \\beta_0\\v')
 
     def test_fix_article(self):
         """Test the fix on content"""
@@ -109,6 +262,67 @@ class NewCommandTestCase(ZdsFixCmdTestCase, WithCheck):
         extract = content.children_dict['test-aussi'].children_dict['une-section-qui-utilise-la-commande']
         self.match_expected('newcommand.une-section-qui-utilise-la-commande', extract.text_value)
 
+    def test_library(self):
+        """Test the commands defined in a library"""
+
+        path = os.path.join(self.temporary_directory, 'macros.md')
+        with open(path, 'w') as f:
+            f.write('Macros: $\\newcommand{\\R}{\\mathbb{R}} \\newcommand{\\vect}[1]{\\vec{#1}}$')
+
+        library = fix_newcommand.MacroLibrary.load(path)
+        self.assertEqual(sorted(library.commands), ['R', 'vect'])
+
+        with self.assertRaises(fixes.FixError):
+            fix_newcommand.MacroLibrary(['\\newcommand{\\R}{x} y'])
+
+        def fix(text):
+            content = fixes.FixableContent('test', 'test', fixes=[fix_newcommand.FixNewCommand()])
+            return content.fix_document(text, content, 'text.md').materialize(), content.fixes_fingerprint
+
+        fixed, fingerprint = fix('$x \\in \\R$')
+
+        fix_newcommand.set_library(library)
+        try:
+            fixed_with_library, fingerprint_with_library = fix('$x \\in \\R$ $\\vect{u}$')
+            fixed_with_preamble, _ = fix('$\\newcommand{\\R}{\\mathbb{R}}$ $x \\in \\R$')
+            fixed_redefined, _ = fix('$\\newcommand{\\R}{\\mathcal{R}}$ $x \\in \\R$')
+
+            # local definitions are on top of the library, in their own context
+            context = fix_newcommand.FixNewCommand().create_context(None)
+            self.assertEqual(len(context.commands), 2)
+            self.assertEqual(len(context.defined), 0)
+        finally:
+            fix_newcommand.set_library(None)
+
+        self.assertEqual(fixed, '$x \\in \\R$')
+        self.assertEqual(fixed_with_library, '$x \\in \\mathbb{R}$ $\\vec{u}$')
+        self.assertEqual(fixed_with_preamble, ' $x \\in \\mathbb{R}$')
+        self.assertEqual(fixed_redefined, ' $x \\in \\mathcal{R}$')
+        self.assertNotEqual(fingerprint, fingerprint_with_library)
+        self.assertEqual(sorted(library.commands), ['R', 'vect'])
+
+    def test_may_change(self):
+        """Test that only the commands of the expression are looked up"""
+
+        self.assertEqual(
+            list(fix_newcommand.command_names('\\R^2 + \\alpha_1 \\frac{a}{b} \\, \\\\x \\2ab')),
+            ['R', 'alpha', 'frac', 'x'])
+
+        names = [chr(ord('a') + i % 26) * (i // 26 + 1) for i in range(500)]
+        definitions = ['\\newcommand{{\\cmd{}}}{{x}}'.format(name) for name in names]
+        library = fix_newcommand.MacroLibrary(definitions + ['\\newcommand{\\R}{\\mathbb{R}}'])
+        context = fix_newcommand.FixNewCommandContext(None, library)
+        f = fix_newcommand.FixNewCommand()
+
+        self.assertTrue(f.may_change('x \\in \\R', context))
+        self.assertTrue(f.may_change('\\cmdbb', context))
+        self.assertTrue(f.may_change('\\newcommand{\\S}{y}', context))
+        self.assertFalse(f.may_change('a \\Rightarrow b', context))  # not ``\R``
+        self.assertFalse(f.may_change('\\frac{a}{b}', context))
+
+        context.defined['S'] = context.commands['R']
+        self.assertTrue(f.may_change('\\S', context))
+
 
 class SpacesTestCase(ZdsFixCmdTestCase, WithCheck):
 
@@ -143,3 +357,40 @@ class AlignTestCase(ZdsFixCmdTestCase, WithCheck):
         """Test the principle"""
 
         self.check('\\begin{align}a&=b\\end{align}', '\\begin{aligned}a&=b\\end{aligned}')
+
+
+class RegistryTestCase(ZdsFixCmdTestCase):
+
+    def test_get_fixes(self):
+        self.assertEqual(
+            [type(f) for f in fixes.get_fixes()],
+            [fix_newcommand.FixNewCommand, fix_align.FixAlign, fix_spaces.FixSpaces])
+
+        # order is the one of the constraints, not the one of the list
+        self.assertEqual([type(f) for f in fixes.get_fixes(only=['spaces', 'newcommand'])],
+                         [fix_newcommand.FixNewCommand, fix_spaces.FixSpaces])
+        self.assertEqual([type(f) for f in fixes.get_fixes(skip=['newcommand', 'spaces'])], [fix_align.FixAlign])
+
+        with self.assertRaises(fixes.RegistryError):
+            fixes.get_fixes(only=['whatever'])
+
+        # circular constraints
+        registry = dict(fixes.REGISTRY)
+        try:
+            fixes.REGISTRY['a'] = __name__ + ':FixA'
+            fixes.REGISTRY['b'] = __name__ + ':FixB'
+            self.assertEqual([type(f) for f in fixes.get_fixes(only=['a'])], [FixA])
+
+            with self.assertRaises(fixes.RegistryError):
+                fixes.get_fixes(only=['a', 'b'])
+        finally:
+            fixes.REGISTRY.clear()
+            fixes.REGISTRY.update(registry)
+
+
+class FixA(fixes.Fix):
+    after = ['b']
+
+
+class FixB(fixes.Fix):
+    after = ['a']
@@ -0,0 +1,97 @@
+import os
+
+from tests import ZdsFixCmdTestCase
+
+from zds_fixcmd import fixes, incremental, math_parser
+from zds_fixcmd.fixes import fix_newcommand, fix_spaces, fix_align
+
+
+class IncrementalTestCase(ZdsFixCmdTestCase):
+
+    @staticmethod
+    def get_fixes():
+        return [fix_newcommand.FixNewCommand(), fix_align.FixAlign(), fix_spaces.FixSpaces()]
+
+    def fix(self, path, output, previous_index=None, previous_output=None, limits=None):
+        c = fixes.FixableContent.extract(path, fixes=self.get_fixes())
+        c.limits = limits
+        c.incremental = incremental.IncrementalFix(c.fixes, previous_index, previous_output, limits)
+        c.fix()
+        c.incremental.close()
+        c.save(output)
+
+        return c
+
+    def test_reuse(self):
+        path = self.copy_to_temporary_directory('tuto.zip')
+        output = os.path.join(self.temporary_directory, 'tuto.fix.zip')
+
+        # first run: nothing to reuse
+        c = self.fix(path, output)
+        self.assertEqual(c.incremental.reused, [])
+        index_path = output + '.index.json'
+        c.incremental.index.save(index_path)
+
+        # second run: everything is reused, except files with definitions
+        original = fixes.FixableContent.extract(path)
+        files = [(p, t) for container in original.walk_containers() for p, t in original.container_files(container)]
+
+        c = self.fix(
+            path, os.path.join(self.temporary_directory, 'tuto2.fix.zip'),
+            incremental.FixIndex.load(index_path), output)
+
+        self.assertNotEqual(c.incremental.reused, [])
+        self.assertEqual(
+            sorted(c.incremental.reused), sorted(p for p, t in files if not incremental.defines_commands(t)))
+
+        # change one file: it is fixed again, and the result is the same as a full run
+        extract = original.children_dict['test-aussi'].children_dict['une-section-qui-utilise-la-commande']
+        extract.text_value += '\n\n$ \\test $'
+        modified_path = os.path.join(self.temporary_directory, 'modified.zip')
+        original.save(modified_path)
+
+        c = self.fix(
+            modified_path, os.path.join(self.temporary_directory, 'tuto3.fix.zip'),
+            incremental.FixIndex.load(index_path), output)
+        self.assertNotIn(extract.text_path, c.incremental.reused)
+        self.assertIn('du-binaire.md', ' '.join(c.incremental.reused))
+
+        full = fixes.FixableContent.extract(modified_path, fixes=self.get_fixes())
+        full.fix()
+
+        for container, full_container in zip(c.walk_containers(), full.walk_containers()):
+            for (p, t), (full_p, full_t) in zip(c.container_files(container), full.container_files(full_container)):
+                self.assertEqual(t, full_t, msg=p)
+
+    def test_fingerprint(self):
+        """Output of a run with other fixes is not reused"""
+
+        path = self.copy_to_temporary_directory('tuto.zip')
+        output = os.path.join(self.temporary_directory, 'tuto.fix.zip')
+
+        c = self.fix(path, output)
+        c.incremental.index.fingerprint = 'something else'
+
+        c = self.fix(path, os.path.join(self.temporary_directory, 'tuto2.fix.zip'), c.incremental.index, output)
+        self.assertEqual(c.incremental.reused, [])
+
+    def test_limits(self):
+        """Output of a run with other limits is not reused"""
+
+        path = self.copy_to_temporary_directory('tuto.zip')
+        output = os.path.join(self.temporary_directory, 'tuto.fix.zip')
+
+        c = self.fix(path, output)
+        c = self.fix(path, os.path.join(self.temporary_directory, 'tuto2.fix.zip'), c.incremental.index, output)
+        self.assertNotEqual(c.incremental.reused, [])
+
+        # with (other) limits, every file is fixed again, so that the expressions that exceed them fail
+        limited = self.fix(
+            path, os.path.join(self.temporary_directory, 'tuto3.fix.zip'), c.incremental.index, output,
+            limits=math_parser.Limits(length=1000))
+        self.assertEqual(limited.incremental.reused, [])
+
+        with self.assertRaises(math_parser.LimitExceeded):
+            self.fix(
+                path, os.path.join(self.temporary_directory, 'tuto4.fix.zip'), c.incremental.index, output,
+                limits=math_parser.Limits(length=5))
@@ -0,0 +1,77 @@
+import os
+
+from tests import ZdsFixCmdTestCase
+
+from zds_fixcmd import journal
+
+
+class JournalTestCase(ZdsFixCmdTestCase):
+
+    def test_journal(self):
+        path = os.path.join(self.temporary_directory, 'journal.jsonl')
+        output = self.copy_to_temporary_directory('tuto.zip', 'output.zip')
+
+        j = journal.Journal(path)
+        j.start('a.zip', 'h1')
+        j.done('a.zip', output)
+        j.start('b.zip', 'h2')
+        j.failed('b.zip', 'error')
+        j.start('c.zip', 'h3')  # crashed
+        j.close()
+
+        with open(path, 'a') as f:
+            f.write('{"archive": "d.zip", "sta')
+
+        j = journal.Journal(path)
+        self.assertTrue(j.is_done('a.zip', 'h1'))
+        self.assertFalse(j.is_done('a.zip', 'changed'))
+        self.assertFalse(j.is_done('b.zip', 'h2'))
+        self.assertFalse(j.is_done('c.zip', 'h3'))
+        self.assertEqual(j.state['c.zip']['status'], journal.STARTED)
+        j.close()
+
+        # the next events are not appended to the truncated line
+        j = journal.Journal(path)
+        j.start('e.zip', 'h5')
+        j.done('e.zip', output, output_hash='h6')  # in place
+        j.close()
+
+        j = journal.Journal(path)
+        self.assertTrue(j.is_done('e.zip', 'h5'))
+        self.assertTrue(j.is_done('e.zip', 'h6'))
+        self.assertFalse(j.is_done('e.zip', 'h7'))
+        j.close()
+
+        os.remove(output)
+        j = journal.Journal(path)
+        self.assertFalse(j.is_done('a.zip', 'h1'))
+        j.close()
+
+    def test_hash_input(self):
+        path = self.copy_to_temporary_directory('tuto.zip')
+        directory = os.path.join(self.temporary_directory, 'd')
+        os.makedirs(os.path.join(directory, 'sub'))
+
+        with open(os.path.join(directory, 'sub', 'a.md'), 'w') as f:
+            f.write('a')
+
+        h_file, h_directory = journal.hash_input(path, chunk_size=100), journal.hash_input(directory)
+        self.assertEqual(h_file, journal.hash_input(path))
+
+        with open(os.path.join(directory, 'sub', 'a.md'), 'w') as f:
+            f.write('b')
+
+        self.assertNotEqual(h_directory, journal.hash_input(directory))
+
+    def test_shard(self):
+        self.assertEqual(journal.parse_shard('2/3'), (2, 3))
+        for s in ['0/3', '4/3', '1', 'a/b']:
+            with self.assertRaises(journal.BadShardError):
+                journal.parse_shard(s)
+
+        # each input is in exactly one shard
+        paths = ['content-{}.zip'.format(i) for i in range(100)]
+        shards = [[p for p in paths if journal.in_shard(p, i, 3)] for i in range(1, 4)]
+        self.assertEqual(sorted(p for shard in shards for p in shard), sorted(paths))
+        self.assertTrue(all(len(shard) > 0 for shard in shards))
+        self.assertEqual(shards[0], [p for p in paths if journal.in_shard('./' + p, 1, 3)])
@@ -181,3 +181,41 @@ class MathTestCase(ZdsFixCmdTestCase):
         self.assertEqual(x.left.content, 'y')
 
         self.assertIsNone(t.right)
+
+        # empty environment, and groups right after the end of an environment
+        for m in [
+                '\\begin{a}\\end{a}x', 'x\\begin{a}{y}\\end{a}', '\\begin{a}x\\end{a}{y}z',
+                '\\begin{a}\\end{a}{y}{z}']:
+            ast = math_parser.MathParser(math_parser.MathLexer(m)).ast()
+            self.assertEqual(m, math_parser.Interpreter(ast).interpret())
+
+        ast = math_parser.MathParser(math_parser.MathLexer('\\begin{a}x\\end{a}{y}')).ast()
+        self.assertEqual(type(ast.left), math_parser.Environment)
+        self.assertEqual(type(ast.right.left), math_parser.SubElement)
+
+    def test_limits(self):
+        """Test the limits on the size of a math expression"""
+
+        m = 'a_{b^{c}} \\frac{x}{[y]}'
+        limits = math_parser.Limits(length=len(m), tokens=20, depth=2, nodes=25)
+        ast = math_parser.MathParser.parse(m, limits=limits)
+        self.assertEqual(m, math_parser.Interpreter(ast).interpret())
+
+        # once parsed, the nodes are exactly counted
+        parser = math_parser.MathParser(math_parser.MathLexer(m))
+        self.assertEqual(parser.nodes, 0)
+        self.assertEqual(math_parser.NodeCounter(parser.ast(environments=False)).count_nodes(), parser.nodes)
+
+        for limit, maximum in [('length', len(m) - 1), ('tokens', 19), ('depth', 1), ('nodes', 24)]:
+            with self.assertRaises(math_parser.LimitExceeded) as e:
+                math_parser.MathParser.parse(m, limits=math_parser.Limits(**{limit: maximum}))
+
+            self.assertEqual((e.exception.limit, e.exception.maximum), (limit, maximum))
+            self.assertIsInstance(e.exception, math_parser.ParserException)
+
+        # too deep for Python, whatever the limits
+        for m in ['{' * 3000 + 'x' + '}' * 3000, '\\alpha ' * 3000]:
+            with self.assertRaises(math_parser.LimitExceeded) as e:
+                math_parser.MathParser.parse(m)
+
+            self.assertEqual(e.exception.limit, 'recursion')
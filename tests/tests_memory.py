@@ -0,0 +1,38 @@
+from tests import ZdsFixCmdTestCase
+
+from zds_fixcmd import fixes, math_parser, memory
+from zds_fixcmd.fixes import fix_newcommand
+
+
+class MemoryTestCase(ZdsFixCmdTestCase):
+
+    def test_node_counter(self):
+        self.assertEqual(math_parser.NodeCounter(math_parser.MathParser.parse('a')).count_nodes(), 2)
+        self.assertEqual(math_parser.NodeCounter(math_parser.MathParser.parse('\\frac{a}{b}')).count_nodes(), 8)
+        self.assertEqual(math_parser.NodeCounter(None).count_nodes(), 0)
+
+    def test_content(self):
+        path = self.copy_to_temporary_directory('tuto.zip', 'memory_tuto.zip')
+
+        report = memory.MemoryReport(top=3)
+        report.start()
+
+        try:
+            content = fixes.FixableContent.extract(path, fixes=[fix_newcommand.FixNewCommand()])
+            report.snapshot('extract')
+            content.memory = report
+            content.fix()
+            report.snapshot('fix', sites=True)
+        finally:
+            report.stop()
+
+        r = report.report()
+        self.assertEqual(
+            [s['stage'] for s in r['stages']],
+            ['extract'] + ['fix:' + c.key for c in content.walk_containers()] + ['fix'])
+        self.assertTrue(all(s['peak'] >= s['retained'] for s in r['stages']))
+        self.assertEqual(len(r['sites']), 3)
+
+        self.assertEqual(len(r['largest_asts']), 3)
+        nodes = [a['nodes'] for a in r['largest_asts']]
+        self.assertEqual(nodes, sorted(nodes, reverse=True))
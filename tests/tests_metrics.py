@@ -0,0 +1,78 @@
+import json
+import os
+
+from tests import ZdsFixCmdTestCase
+
+from zds_fixcmd import fixes, metrics
+from zds_fixcmd.fixes import fix_newcommand, fix_spaces, fix_align
+
+
+class MetricsTestCase(ZdsFixCmdTestCase):
+
+    def test_histogram(self):
+        h = metrics.Histogram(buckets=(1., 2.))
+        for value in [.5, 1., 1.5, 3.]:
+            h.observe(value)
+
+        self.assertEqual(h.cumulative_counts(), [(1., 2), (2., 3), (float('inf'), 4)])
+        self.assertEqual(h.sum, 6.)
+
+    def test_content(self):
+        """Expressions are counted, and the result is the same"""
+
+        def get_fixes():
+            return [fix_newcommand.FixNewCommand(), fix_align.FixAlign(), fix_spaces.FixSpaces()]
+
+        path = self.copy_to_temporary_directory('tuto.zip', 'metrics_tuto.zip')
+
+        content = fixes.FixableContent.extract(path, fixes=get_fixes())
+        content.fix()
+
+        m = metrics.Metrics()
+        content_metrics = fixes.FixableContent.extract(path, fixes=get_fixes(), memoize=True)
+        content_metrics.metrics = m
+        content_metrics.fix()
+
+        for c, c_metrics in zip(content.walk_containers(), content_metrics.walk_containers()):
+            self.assertEqual(list(content.container_files(c)), list(content_metrics.container_files(c_metrics)))
+
+        original = fixes.FixableContent.extract(path)
+        seen = sum(
+            len(fixes.FIND_MATH.findall(t)) for c in original.walk_containers() for _, t in original.container_files(c))
+        self.assertEqual(m.get('expressions_seen'), seen)
+        self.assertEqual(m.get('expressions_parsed'), m.histograms['parse_seconds'].count)
+        self.assertEqual(m.get('expressions_modified'), sum(content.edits.values()))
+
+        skipped = [v for name, _, v in m.all_counters() if name == 'expressions_skipped'][0]
+        self.assertEqual(skipped, seen - m.get('expressions_parsed'))
+
+        # expressions that no fix may change are not parsed by check
+        m_check = metrics.Metrics()
+        content_check = fixes.FixableContent.extract(path, fixes=get_fixes())
+        content_check.metrics = m_check
+        content_check.check(stop_at_first=False)
+
+        self.assertEqual(m_check.get('expressions_seen'), seen)
+        self.assertLess(m_check.get('expressions_parsed'), seen)
+
+        # exports
+        m.inc('bytes_read', 10, archive='a"b.zip')
+        m.inc('bytes_read', 5, archive='c.zip')
+        text = m.to_prometheus()
+        self.assertIn('zds_fixcmd_expressions_seen_total {}\n'.format(seen), text)
+        self.assertIn('zds_fixcmd_bytes_read_total 15\n', text)  # not one series per archive
+        self.assertNotIn('archive=', text)
+        self.assertIn('zds_fixcmd_parse_seconds_bucket{le="+Inf"}', text)
+
+        path = os.path.join(self.temporary_directory, 'metrics.jsonl')
+        exporter = metrics.MetricsExporter(m, path, 'jsonl')
+        exporter.export()
+        exporter.export()
+
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1]['histograms']['parse_seconds']['count'], m.get('expressions_parsed'))
+        self.assertIn(
+            {'name': 'bytes_read', 'labels': {'archive': 'c.zip'}, 'value': 5}, lines[1]['counters'])
@@ -0,0 +1,152 @@
+import concurrent.futures
+import http.client
+import io
+import json
+import os
+import socket
+import threading
+import time
+
+from tests import ZdsFixCmdTestCase
+
+from zds_fixcmd import cache, server
+from zds_fixcmd.fixes import FixableContent, fix_newcommand, fix_spaces
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class ServerTestCase(ZdsFixCmdTestCase):
+
+    def setUp(self):
+        self.fix_classes = [fix_newcommand.FixNewCommand, fix_spaces.FixSpaces]
+        self.fix_cache = cache.FixCache(os.path.join(self.temporary_directory, 'cache'))
+        self.service = server.FixService(self.fix_classes, self.fix_cache)
+        self.servers = []
+
+    def tearDown(self):
+        for s in self.servers:
+            s.shutdown()
+            s.server_close()
+
+        self.fix_cache.close()
+        super().tearDown()
+
+    def start(self, **kwargs):
+        s = server.create_server(self.service, **kwargs)
+        threading.Thread(target=s.serve_forever, daemon=True).start()
+        self.servers.append(s)
+        return s
+
+    def request(self, connection, method, path, body=None):
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        data = response.read()
+        connection.close()
+        return response.status, data
+
+    def test_http(self):
+        s = self.start(port=0, workers=2)
+
+        def connect():
+            return http.client.HTTPConnection(*s.server_address[:2], timeout=30)
+
+        self.assertEqual(self.request(connect(), 'GET', '/health'), (200, b'{"status": "ok"}'))
+        self.assertEqual(self.request(connect(), 'GET', '/nope')[0], 404)
+
+        # archives (concurrently), give the same result as the command
+        path = self.copy_to_temporary_directory('tuto.zip')
+        with open(path, 'rb') as f:
+            archive = f.read()
+
+        expected = FixableContent.extract(path, fixes=[f() for f in self.fix_classes])
+        expected.fix()
+
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(lambda _: self.request(connect(), 'POST', '/fix', archive), range(6)))
+
+        for status, data in results:
+            self.assertEqual(status, 200)
+            fixed = FixableContent.extract(io.BytesIO(data))
+            for c, c_expected in zip(fixed.walk_containers(), expected.walk_containers()):
+                self.assertEqual(list(fixed.container_files(c)), list(expected.container_files(c_expected)))
+
+        # markdown
+        status, data = self.request(connect(), 'POST', '/fix/markdown', 'a $\\newcommand{\\a}{x} \\a$ b'.encode())
+        self.assertEqual((status, data.decode()), (200, 'a $x$ b'))
+
+        # errors
+        self.assertEqual(self.request(connect(), 'POST', '/fix', b'not a zip')[0], 400)
+
+        stats = json.loads(self.request(connect(), 'GET', '/stats')[1])
+        self.assertEqual(stats['requests'], 8)
+        self.assertEqual(stats['archives'], 6)
+        self.assertEqual(stats['texts'], 1)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertGreater(stats['cache_hits'], 0)
+
+    def test_memory_cache(self):
+        service = server.FixService(self.fix_classes)  # no persistent cache
+        self.assertEqual(service.fix_markdown('$ a^2 $'), '$a^2$')
+        self.assertEqual(service.fix_markdown('b $ a^2 $'), 'b $a^2$')
+
+        stats = service.stats()
+        self.assertEqual((stats['cache_hits'], stats['cache_misses']), (1, 1))
+        self.assertNotIn('persistent_cache_hits', stats)
+
+        self.assertIsNone(server.FixService(self.fix_classes, memory_entries=0).cache)
+
+    def test_unix_socket(self):
+        path = os.path.join(self.temporary_directory, 'fix.sock')
+        self.start(socket_path=path)
+
+        self.assertEqual(self.request(UnixHTTPConnection(path), 'GET', '/health')[0], 200)
+        status, data = self.request(UnixHTTPConnection(path), 'POST', '/fix/markdown', '$ a^2 $'.encode())
+        self.assertEqual((status, data.decode()), (200, '$a^2$'))
+
+    def test_limits(self):
+        s = self.start(port=0, workers=1, max_pending=1, max_body_size=1000)
+
+        def connect():
+            return http.client.HTTPConnection(*s.server_address[:2], timeout=30)
+
+        def wait_pending(n):
+            # the worker may still be closing the previous connection
+            while s.pending != n:
+                time.sleep(.01)
+
+        # size of the body
+        self.assertEqual(self.request(connect(), 'POST', '/fix/markdown', b'x' * 5000)[0], 413)
+        wait_pending(0)
+
+        connection = connect()
+        connection.putrequest('POST', '/fix/markdown')
+        connection.putheader('Content-Length', 'nope')
+        connection.endheaders()
+        response = connection.getresponse()
+        self.assertEqual((response.status, response.read()), (400, b'{"error": "invalid length of the body"}'))
+        connection.close()
+        wait_pending(0)
+
+        # pending requests: the only worker waits for the body of this one
+        blocking = socket.create_connection(s.server_address[:2])
+        blocking.sendall(b'POST /fix/markdown HTTP/1.0\r\nContent-Length: 5\r\n\r\n')
+        wait_pending(1)
+
+        self.assertEqual(self.request(connect(), 'POST', '/fix/markdown', b'$ a $')[0], 503)
+
+        blocking.sendall(b'$ b $')
+        with blocking.makefile('rb') as f:
+            self.assertTrue(f.read().endswith(b'\r\n$b$'))
+        blocking.close()
+
+        self.assertEqual(self.service.stats()['rejected'], 1)
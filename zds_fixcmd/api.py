@@ -0,0 +1,151 @@
+"""
+Fix markdown texts and math expressions in memory, without archive.
+
+.. code-block:: python
+
+    from zds_fixcmd import api
+
+    api.fix_text('$\\\\newcommand{\\\\R}{\\\\mathbb{R}} x \\\\in \\\\R$')  # '$x \\\\in \\\\mathbb{R}$'
+
+    # the macros defined in a text are used in the next ones
+    context = api.TextFixer()
+    fixed = [api.fix_text(t, context=context) for t in texts]
+
+    # each text is fixed in a new context (but the fixes are created once)
+    fixed = list(api.fix_many(texts))
+
+Each call with ``context=None`` starts from fresh contexts, as a content would.
+"""
+
+import functools
+
+from zds_fixcmd.fixes import FixableContent, get_fix_classes
+
+TEXT_PATH = 'text.md'
+
+
+@functools.lru_cache(maxsize=None)
+def _fix_classes(names):
+    return get_fix_classes(None if names is None else list(names))
+
+
+class TextFixer:
+    """Fixes (and their contexts) used for the texts and expressions that are fixed through it
+
+    :param fixes: names of the fixes to apply (those of ``zds_fixcmd.fixes.REGISTRY`` if ``None``)
+    :type fixes: list of str
+    :param memoize: reuse the result of identical math expressions in the same context
+    :type memoize: bool
+    :param cache: persistent cache of the results
+    :type cache: zds_fixcmd.cache.FixCache
+    """
+
+    def __init__(self, fixes=None, memoize=True, cache=None):
+        self.content = FixableContent(
+            'text', 'text', fixes=[c() for c in _fix_classes(None if fixes is None else tuple(fixes))],
+            memoize=memoize, cache=cache)
+
+    def fix_text(self, text, path=TEXT_PATH):
+        """Fix the math expressions of a text
+
+        :param text: the text (if ``bytes``, in UTF-8, and only the math expressions are decoded)
+        :type text: str|bytes
+        :param path: name of the text (in the errors)
+        :type path: str
+        :return: the fixed text
+        :rtype: str|bytes
+        """
+
+        document = self.content.fix_document(text, self.content, path)
+        return document.materialize() if document.modified else text
+
+    def fix_expression(self, expression, display=False, path=TEXT_PATH):
+        """Fix a math expression
+
+        :param expression: the math expression, without delimiters
+        :type expression: str
+        :param display: the expression is in display mode (``$$...$$``)
+        :type display: bool
+        :param path: name of the text (in the errors)
+        :type path: str
+        :return: the fixed expression (empty if it should be removed)
+        :rtype: str
+        """
+
+        return self.content.fix_expression(expression, self.content, path, display)
+
+    def reset(self):
+        """Forget the contexts (and the results obtained in them)
+        """
+
+        for fix in self.content.fixes:
+            fix.context = {}
+
+        if self.content.memo is not None:
+            self.content.memo = {}
+
+
+def _get_fixer(fixes, context):
+    if context is None:
+        return TextFixer(fixes)
+    if fixes is not None:
+        raise ValueError('the fixes are the ones of the context')
+
+    return context
+
+
+def fix_text(text, fixes=None, context=None):
+    """Fix the math expressions of a text
+
+    :param text: the text
+    :type text: str|bytes
+    :param fixes: names of the fixes to apply (all if ``None``), only if there is no ``context``
+    :type fixes: list of str
+    :param context: fixer whose contexts are used (and modified), new ones otherwise
+    :type context: TextFixer
+    :rtype: str|bytes
+    """
+
+    return _get_fixer(fixes, context).fix_text(text)
+
+
+def fix_expression(expression, display=False, fixes=None, context=None):
+    """Fix a math expression
+
+    :param expression: the math expression, without delimiters
+    :type expression: str
+    :param display: the expression is in display mode (``$$...$$``)
+    :type display: bool
+    :param fixes: names of the fixes to apply (all if ``None``), only if there is no ``context``
+    :type fixes: list of str
+    :param context: fixer whose contexts are used (and modified), new ones otherwise
+    :type context: TextFixer
+    :rtype: str
+    """
+
+    return _get_fixer(fixes, context).fix_expression(expression, display)
+
+
+def fix_many(texts, fixes=None, context=None):
+    """Fix texts, one at a time.
+    If ``context`` is given, all the texts share its contexts (in order), otherwise, each text gets new contexts.
+
+    :param texts: the texts
+    :type texts: collections.Iterable
+    :param fixes: names of the fixes to apply (all if ``None``), only if there is no ``context``
+    :type fixes: list of str
+    :param context: fixer whose contexts are used (and modified)
+    :type context: TextFixer
+    :return: the fixed texts
+    :rtype: collections.Iterator
+    """
+
+    return _fix_many(_get_fixer(fixes, context), texts, context is None)
+
+
+def _fix_many(fixer, texts, reset):
+    for text in texts:
+        if reset:
+            fixer.reset()
+
+        yield fixer.fix_text(text)
@@ -0,0 +1,163 @@
+"""
+Wall-clock budgets of a run: per math expression, and per archive.
+
+When the budgets are used from the main thread of a process (and ``signal.setitimer()`` is available), a timer
+interrupts the expression or archive that exceeds its budget, even in the middle of the parser or of a regular
+expression (but not inside an ``uninterrupted()`` block). Otherwise, the budgets are only checked at the end of each
+expression.
+"""
+
+import contextlib
+import signal
+import threading
+import time
+
+EXPRESSION = 'expression'
+ARCHIVE = 'archive'
+
+
+class BudgetExceeded(Exception):
+    """A time budget was exceeded
+
+    :param unit: ``EXPRESSION`` or ``ARCHIVE``
+    :type unit: str
+    :param seconds: the budget
+    :type seconds: float
+    :param path: the file where it happened (if known)
+    :type path: str
+    """
+
+    def __init__(self, unit, seconds, path=None):
+        self.unit = unit
+        self.seconds = seconds
+        self.path = path
+        self.err = '{} budget of {:g}s exceeded'.format(unit, seconds)
+
+        super().__init__(self.err if path is None else '{}: {}'.format(path, self.err))
+
+
+class ExpressionBudgetExceeded(BudgetExceeded):
+    def __init__(self, seconds, path=None):
+        super().__init__(EXPRESSION, seconds, path)
+
+
+class ArchiveBudgetExceeded(BudgetExceeded):
+    def __init__(self, seconds, path=None):
+        super().__init__(ARCHIVE, seconds, path)
+
+
+@contextlib.contextmanager
+def uninterrupted():
+    """Defer the interruptions of the budgets until the end of the block, e.g. around a transaction that should not
+    be left open (where it is possible to block the signals)
+    """
+
+    if not hasattr(signal, 'pthread_sigmask'):
+        yield
+        return
+
+    previous = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, previous)  # a deferred alarm is handled here
+
+
+class Budget:
+    """Time budgets. The budget of the archive starts when the ``with`` block is entered:
+
+    .. code-block:: python
+
+        with budget:
+            c = FixableContent.extract(path)
+            c.budget = budget  # each expression gets (at most) its own budget
+            c.fix()
+
+    :param expression: budget of a math expression (in seconds), no limit if ``None``
+    :type expression: float
+    :param archive: budget of an archive (in seconds), no limit if ``None``
+    :type archive: float
+    """
+
+    def __init__(self, expression=None, archive=None):
+        self.expression_budget = expression
+        self.archive_budget = archive
+
+        self.archive_deadline = None
+        self.expression_deadline = None
+        self.path = None
+
+        self.preemptive = False
+        self.previous_handler = None
+
+    def __enter__(self):
+        self.archive_deadline = None if self.archive_budget is None else time.monotonic() + self.archive_budget
+        self.expression_deadline = None
+
+        self.preemptive = hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+        if self.preemptive:
+            self.previous_handler = signal.signal(signal.SIGALRM, self._alarm)
+            self._arm()
+
+        return self
+
+    def __exit__(self, *_):
+        if self.preemptive:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.previous_handler)
+            self.preemptive = False
+
+        self.archive_deadline = self.expression_deadline = None
+
+    def _arm(self):
+        """Set the timer to the closest deadline
+        """
+
+        deadlines = [d for d in (self.archive_deadline, self.expression_deadline) if d is not None]
+        if deadlines:
+            signal.setitimer(signal.ITIMER_REAL, max(min(deadlines) - time.monotonic(), 1e-6))
+        else:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    def _alarm(self, *_):
+        self.check()
+        self._arm()  # woken up too early
+
+    def check(self):
+        """Raise if a deadline is passed (the archive first, since it is the larger unit)
+        """
+
+        now = time.monotonic()
+
+        if self.archive_deadline is not None and now >= self.archive_deadline:
+            self.archive_deadline = self.expression_deadline = None
+            raise ArchiveBudgetExceeded(self.archive_budget, self.path)
+
+        if self.expression_deadline is not None and now >= self.expression_deadline:
+            self.expression_deadline = None
+            raise ExpressionBudgetExceeded(self.expression_budget, self.path)
+
+    @contextlib.contextmanager
+    def expression(self, path):
+        """Budget of a math expression (which is also limited by the one of the archive)
+
+        :param path: the file of the expression
+        :type path: str
+        """
+
+        self.path = path
+        if self.expression_budget is not None:
+            self.expression_deadline = time.monotonic() + self.expression_budget
+            if self.preemptive:
+                self._arm()
+
+        try:
+            yield
+            if not self.preemptive:
+                self.check()
+        finally:
+            self.path = None
+            if self.expression_budget is not None:
+                self.expression_deadline = None
+                if self.preemptive:
+                    self._arm()  # back to the deadline of the archive
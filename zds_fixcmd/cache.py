@@ -0,0 +1,218 @@
+"""
+Caches of the fixed math expressions: persistent (SQLite database, with LRU eviction), and in memory (e.g. for a
+long-running service, in front of the persistent one).
+"""
+
+import collections
+import os
+import sqlite3
+import threading
+import time
+
+from zds_fixcmd import budget
+
+DEFAULT_MAX_ENTRIES = 100000
+
+DEFAULT_MEMORY_ENTRIES = 10000
+
+
+def default_cache_directory():
+    """
+    :return: ``$XDG_CACHE_HOME/zds-fixcmd`` (or ``~/.cache/zds-fixcmd``)
+    :rtype: str
+    """
+
+    return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'zds-fixcmd')
+
+
+class FixCache:
+    """Map a key (see ``FixableContent._cache_key()``) to a fixed math expression.
+
+    Reads are immediate, but writes (new results and last use of the entries) are buffered and flushed in a single
+    transaction, which is also when the least recently used entries above ``max_entries`` are evicted (and which is
+    not interrupted by the time budgets, see ``zds_fixcmd.budget``).
+    The database is in WAL mode, so that it can be used by concurrent processes, and the accesses are serialized by
+    a lock, so that it can be shared by threads (e.g. the workers of ``zds_fixcmd.server``).
+
+    :param directory: directory of the cache
+    :type directory: str
+    :param max_entries: maximum number of entries
+    :type max_entries: int
+    :param flush_every: flush the writes each time that many are buffered
+    :type flush_every: int
+    """
+
+    def __init__(self, directory, max_entries=DEFAULT_MAX_ENTRIES, flush_every=1000):
+        os.makedirs(directory, exist_ok=True)
+
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(
+            os.path.join(directory, 'fixes.sqlite'), timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS fixes (key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS fixes_used ON fixes (used)')
+
+        self.new = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        :param key: the key
+        :type key: str
+        :rtype: str|None
+        """
+
+        with self.lock:
+            value = self.new.get(key)
+            if value is None:
+                row = self.connection.execute('SELECT value FROM fixes WHERE key = ?', (key, )).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+
+                value = row[0]
+                self.used.add(key)
+                self._flush_if_needed()
+
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        :param key: the key
+        :type key: str
+        :param value: the fixed expression
+        :type value: str
+        """
+
+        with self.lock:
+            self.new[key] = value
+            self._flush_if_needed()
+
+    def _flush_if_needed(self):
+        if len(self.new) + len(self.used) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered entries, and evict the least recently used ones
+        """
+
+        with self.lock, budget.uninterrupted():
+            if len(self.new) == 0 and len(self.used) == 0:
+                return
+
+            now = time.time()
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO fixes (key, value, used) VALUES (?, ?, ?)',
+                    ((k, v, now) for k, v in self.new.items()))
+                self.connection.executemany('UPDATE fixes SET used = ? WHERE key = ?', ((now, k) for k in self.used))
+
+                count = self.connection.execute('SELECT COUNT(*) FROM fixes').fetchone()[0]
+                if count > self.max_entries:
+                    self.connection.execute(
+                        'DELETE FROM fixes WHERE key IN (SELECT key FROM fixes ORDER BY used LIMIT ?)',
+                        (count - self.max_entries, ))
+
+                self.connection.execute('COMMIT')
+            except BaseException:
+                if self.connection.in_transaction:
+                    self.connection.execute('ROLLBACK')
+                raise
+
+            self.new = {}
+            self.used = set()
+
+    def close(self):
+        """Flush and close the cache
+        """
+
+        with self.lock:
+            self.flush()
+            self.connection.close()
+
+    def __len__(self):
+        with self.lock:
+            self.flush()
+            return self.connection.execute('SELECT COUNT(*) FROM fixes').fetchone()[0]
+
+
+class MemoryCache:
+    """Same interface as ``FixCache``, but the entries are kept in memory (the least recently used ones above
+    ``max_entries`` being evicted), in front of an (optional) persistent cache. It can be shared by threads.
+
+    :param max_entries: maximum number of entries
+    :type max_entries: int
+    :param backend: persistent cache, looked up on a miss and written on each new entry
+    :type backend: FixCache
+    """
+
+    def __init__(self, max_entries=DEFAULT_MEMORY_ENTRIES, backend=None):
+        self.max_entries = max_entries
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        """
+        :param key: the key
+        :type key: str
+        :rtype: str|None
+        """
+
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self.backend is not None:
+            value = self.backend.get(key)
+
+        if value is None:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        self._store(key, value)
+        with self.lock:
+            self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        """
+        :param key: the key
+        :type key: str
+        :param value: the fixed expression
+        :type value: str
+        """
+
+        self._store(key, value)
+        if self.backend is not None:
+            self.backend.put(key, value)
+
+    def flush(self):
+        if self.backend is not None:
+            self.backend.flush()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
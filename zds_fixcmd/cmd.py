@@ -1,16 +1,20 @@
-import argparse
 import os
 import sys
 
 import zds_fixcmd
-from zds_fixcmd import content
-from zds_fixcmd.fixes import FixableContent, FixError, fix_align, fix_newcommand, fix_spaces
 
-FIXES = [
-    fix_newcommand.FixNewCommand(),
-    fix_align.FixAlign(),
-    fix_spaces.FixSpaces()
-]
+# Note: to keep the startup fast, the other modules (including the parser and the fixes) are only imported when
+# they are needed.
+
+EXIT_NEEDS_FIX = 2
+
+STDIO = '-'
+
+# archives read from stdin are kept in memory up to that size, then in a temporary file
+SPOOL_MAX_SIZE = 64 * 1024 * 1024
+
+# with --jobs, a worker that is still busy that long (in seconds) after the budget of its archive is killed
+WORKER_KILL_DELAY = 5
 
 
 def exit_failure(msg, status=1):
@@ -27,34 +31,882 @@ def exit_failure(msg, status=1):
     return sys.exit(status)
 
 
+def names_list(s):
+    """Comma-separated list
+
+    :param s: the argument
+    :type s: str
+    :rtype: list of str
+    """
+
+    return [n.strip() for n in s.split(',') if n.strip() != '']
+
+
+def add_fixes_arguments(arguments_parser):
+    """Add the options to select the fixes
+
+    :param arguments_parser: the parser
+    :type arguments_parser: argparse.ArgumentParser
+    """
+
+    arguments_parser.add_argument(
+        '--only', type=names_list, help='comma-separated list of the fixes to apply (default: all)')
+    arguments_parser.add_argument(
+        '--skip', type=names_list, default=[], help='comma-separated list of the fixes not to apply')
+    arguments_parser.add_argument(
+        '--macros', type=str, metavar='FILE',
+        help='file of \\newcommand definitions that are available in all the contents')
+
+
+def add_cache_arguments(arguments_parser):
+    """Add the options of the persistent cache
+
+    :param arguments_parser: the parser
+    :type arguments_parser: argparse.ArgumentParser
+    """
+
+    arguments_parser.add_argument(
+        '--cache', action='store_true',
+        help='keep the fixed expressions in a persistent cache (in ~/.cache/zds-fixcmd, unless --cache-dir is given)')
+    arguments_parser.add_argument(
+        '--cache-dir', type=str, help='directory of the persistent cache of fixed expressions (implies --cache)')
+    arguments_parser.add_argument('--cache-size', type=int, help='maximum number of entries in the cache')
+    arguments_parser.add_argument(
+        '--no-cache', action='store_true', help='do not use the persistent cache (even with --cache-dir)')
+
+
+def add_limits_arguments(arguments_parser):
+    """Add the options to limit the size of the math expressions
+
+    :param arguments_parser: the parser
+    :type arguments_parser: argparse.ArgumentParser
+    """
+
+    arguments_parser.add_argument(
+        '--max-length', type=int, metavar='N', help='fail on math expressions of more than N characters')
+    arguments_parser.add_argument(
+        '--max-tokens', type=int, metavar='N', help='fail on math expressions of more than N tokens')
+    arguments_parser.add_argument(
+        '--max-depth', type=int, metavar='N', help='fail on math expressions with more than N nested sub-elements')
+    arguments_parser.add_argument(
+        '--max-nodes', type=int, metavar='N', help='fail on math expressions of more than N nodes')
+
+
+def get_limits(args):
+    """Get the limits on the size of the math expressions given by the options (if any)
+
+    :param args: the arguments
+    :type args: argparse.Namespace
+    :rtype: zds_fixcmd.math_parser.Limits
+    """
+
+    limits = (args.max_length, args.max_tokens, args.max_depth, args.max_nodes)
+    if all(limit is None for limit in limits):
+        return None
+
+    from zds_fixcmd import math_parser
+    return math_parser.Limits(*limits)
+
+
+def load_fix_classes(args):
+    """Get the fixes selected by the options, and load the library of macros (exit if they cannot be loaded)
+
+    :param args: the arguments
+    :type args: argparse.Namespace
+    :rtype: list of type
+    """
+
+    from zds_fixcmd.fixes import EXPRESSION_ERRORS, RegistryError, get_fix_classes
+
+    try:
+        fix_classes = get_fix_classes(args.only, args.skip)
+    except RegistryError as e:
+        return exit_failure('error while loading fixes: {}'.format(str(e)))
+
+    if args.macros is not None:
+        from zds_fixcmd.fixes import fix_newcommand
+
+        try:
+            fix_newcommand.load_library(args.macros)
+        except (OSError, UnicodeDecodeError) + EXPRESSION_ERRORS as e:
+            return exit_failure('error while loading macros: {}'.format(str(e)))
+
+    return fix_classes
+
+
+def open_cache(args):
+    """Open the persistent cache, if enabled (and if it can be used)
+
+    :param args: the arguments
+    :type args: argparse.Namespace
+    :rtype: zds_fixcmd.cache.FixCache
+    """
+
+    if args.no_cache or not (args.cache or args.cache_dir):
+        return None
+
+    import sqlite3
+    from zds_fixcmd import cache
+
+    try:
+        return cache.FixCache(
+            args.cache_dir or cache.default_cache_directory(), args.cache_size or cache.DEFAULT_MAX_ENTRIES)
+    except (OSError, sqlite3.Error) as e:
+        sys.stderr.write('warning: cannot use the cache ({}), continuing without\n'.format(str(e)))
+
+
 # program options
 def get_arguments_parser():
+    import argparse
+
     arguments_parser = argparse.ArgumentParser(description=zds_fixcmd.__doc__)
     arguments_parser.add_argument(
         '-v', '--version', action='version', version='%(prog)s ' + zds_fixcmd.__version__)
 
-    arguments_parser.add_argument('infile', type=str)
+    arguments_parser.add_argument(
+        'infile', type=str, nargs='+', help='archive or directory of a content ("-" for stdin)')
+    arguments_parser.add_argument(
+        '-o', '--output', type=str,
+        help='output ("-" for stdout), if there is a single input (default: X.fix.zip for X.zip, X.fix for a '
+             'directory X, stdout for stdin)')
+    arguments_parser.add_argument(
+        '--in-place', action='store_true', help='write the fixed files in the directory of the content')
+    arguments_parser.add_argument(
+        '-f', '--format', choices=['zip', 'markdown'], default='zip',
+        help='format of the inputs: archive of a content, or markdown text')
+    arguments_parser.add_argument(
+        '-r', '--raw', action='store_true', help='work on the UTF-8 bytes and only decode the math expressions')
+
+    group = arguments_parser.add_mutually_exclusive_group()
+    group.add_argument(
+        '-c', '--check', action='store_true',
+        help='do not fix, but exit with status {} if any content needs to be fixed'.format(EXIT_NEEDS_FIX))
+    group.add_argument(
+        '-l', '--list', action='store_true', help='same as --check, but list the files that need to be fixed')
+    group.add_argument(
+        '-i', '--index', action='store_true',
+        help='write an index of the files next to the output, and use it to reuse the unchanged files next time')
+
+    add_fixes_arguments(arguments_parser)
+    add_cache_arguments(arguments_parser)
+    add_limits_arguments(arguments_parser)
+
+    arguments_parser.add_argument(
+        '-k', '--keep-going', action='store_true',
+        help='leave the math expressions that cannot be fixed untouched and report them, instead of stopping')
+    arguments_parser.add_argument(
+        '--error-report', type=str, metavar='FILE', help='write all the errors in FILE (JSON)')
+
+    arguments_parser.add_argument(
+        '-j', '--jobs', type=int, default=1, metavar='N', help='process the inputs in N worker processes')
+    arguments_parser.add_argument(
+        '--start-method', choices=['fork', 'forkserver', 'spawn'],
+        help='how the worker processes are started (default: fork, where it is available)')
+    arguments_parser.add_argument(
+        '--expression-budget', type=float, metavar='SECONDS',
+        help='give up a math expression that takes more than SECONDS to fix (with --keep-going, it is left untouched '
+             'and reported, otherwise, the whole input is given up)')
+    arguments_parser.add_argument(
+        '--archive-budget', type=float, metavar='SECONDS',
+        help='give up an input that takes more than SECONDS to fix, report it, and go on with the next one')
+
+    arguments_parser.add_argument(
+        '--journal', type=str, metavar='FILE',
+        help='append the inputs that are started, done and failed (with the hash of their content) to FILE')
+    arguments_parser.add_argument(
+        '--resume', action='store_true', help='skip the inputs that are done according to the journal')
+    arguments_parser.add_argument(
+        '--shard', type=str, metavar='i/N',
+        help='only process the i-th of N slices of the inputs (which only depend on their path)')
+
+    arguments_parser.add_argument(
+        '--profile', type=str, metavar='REPORT',
+        help='time each stage of the run, write the report in REPORT (JSON) and a summary in stderr')
+    arguments_parser.add_argument(
+        '--profile-slowest', type=int, default=10, metavar='N', help='number of slowest expressions in the report')
+
+    arguments_parser.add_argument(
+        '--metrics', type=str, metavar='FILE', help='write the metrics of the run (counters and latency histograms)')
+    arguments_parser.add_argument(
+        '--metrics-format', choices=['prometheus', 'jsonl'], default='prometheus',
+        help='Prometheus text format (the file is replaced) or JSON lines (a line is appended for each export)')
+    arguments_parser.add_argument(
+        '--metrics-interval', type=float, default=0, metavar='SECONDS',
+        help='also export the metrics during the run, at most every SECONDS (after an archive is processed)')
+
+    arguments_parser.add_argument(
+        '--memory-report', type=str, metavar='REPORT',
+        help='trace the memory allocations, write the report in REPORT (JSON) and a summary in stderr')
+    arguments_parser.add_argument(
+        '--memory-top', type=int, default=10, metavar='N',
+        help='number of allocation sites and of largest ASTs in the report')
 
     return arguments_parser
 
 
 def main():
+    # shortcut, to avoid loading argparse
+    if len(sys.argv) == 2 and sys.argv[1] in ['-v', '--version']:
+        print('{} {}'.format(os.path.basename(sys.argv[0]), zds_fixcmd.__version__))
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        return serve(sys.argv[2:])
+
     args = get_arguments_parser().parse_args()
 
-    if not os.path.exists(args.infile):
-        return exit_failure('{}: file does not exist')
+    for infile in args.infile:
+        if infile != STDIO and not os.path.exists(infile):
+            return exit_failure('{}: file does not exist'.format(infile))
+
+    if args.infile.count(STDIO) > 1:
+        return exit_failure('stdin can only be read once')
+    if args.output is not None and len(args.infile) > 1:
+        return exit_failure('--output can only be used with a single input')
+    if args.index and any(get_output(infile, args) == STDIO or os.path.isdir(infile) for infile in args.infile):
+        return exit_failure('--index cannot be used with stdout or directories')
+    if args.format == 'markdown' and args.in_place:
+        return exit_failure('--in-place cannot be used with markdown inputs')
+    if args.format == 'markdown' and any(os.path.isdir(infile) for infile in args.infile):
+        return exit_failure('markdown inputs cannot be directories')
+    if args.in_place and (args.output is not None or not all(os.path.isdir(infile) for infile in args.infile)):
+        return exit_failure('--in-place can only be used with directories, without --output')
+
+    if args.jobs < 1:
+        return exit_failure('--jobs should be at least 1')
+    if any(b is not None and b <= 0 for b in (args.expression_budget, args.archive_budget)):
+        return exit_failure('the time budgets should be positive')
+    if args.jobs > 1 and (STDIO in args.infile or args.profile or args.metrics or args.memory_report):
+        return exit_failure('--jobs cannot be used with stdin, --profile, --metrics or --memory-report')
+
+    if args.shard is not None:
+        from zds_fixcmd import journal as journal_module
+
+        try:
+            i, n = journal_module.parse_shard(args.shard)
+        except journal_module.BadShardError as e:
+            return exit_failure('invalid shard: {}'.format(str(e)))
+
+        args.infile = [infile for infile in args.infile if journal_module.in_shard(infile, i, n)]
+
+    journal = None
+    if args.resume and args.journal is None:
+        return exit_failure('--resume requires --journal')
+    if args.journal is not None:
+        if args.check or args.list or STDIO in args.infile:
+            return exit_failure('--journal cannot be used with --check, --list or stdin')
+
+        from zds_fixcmd import journal as journal_module
+        journal = journal_module.Journal(args.journal)
+
+    fix_classes = load_fix_classes(args)
+
+    # with --jobs, each worker opens its own connection (which should not be inherited from the parent)
+    fix_cache = open_cache(args) if args.jobs == 1 else None
+
+    memory = None
+    if args.memory_report:
+        from zds_fixcmd import memory as memory_module
+        memory = memory_module.MemoryReport(args.memory_top)
+        memory.start()
+
+    profiler = None
+    if args.profile:
+        from zds_fixcmd import profiling
+        profiler = profiling.Profiler(args.profile_slowest)
+
+    metrics_exporter = None
+    if args.metrics:
+        from zds_fixcmd import metrics
+        metrics_exporter = metrics.MetricsExporter(
+            metrics.Metrics(), args.metrics, args.metrics_format, args.metrics_interval)
 
     try:
-        c = FixableContent.extract(args.infile, fixes=FIXES)
-    except (content.BadManifestError, content.BadArchiveError) as e:
-        return exit_failure('error while opening archive: {}'.format(str(e)))
+        return process(args, fix_classes, fix_cache, profiler, metrics_exporter, memory, journal)
+    finally:
+        if fix_cache is not None:
+            fix_cache.close()
+
+        if journal is not None:
+            journal.close()
+
+        if profiler is not None:
+            write_profile(args.profile, profiler, fix_cache)
+
+        if metrics_exporter is not None:
+            metrics_exporter.export()
+
+        if memory is not None:
+            memory.stop()
+            write_memory_report(args.memory_report, memory)
+
+
+def get_serve_arguments_parser():
+    import argparse
+
+    arguments_parser = argparse.ArgumentParser(
+        prog='zds-fixcmd serve', description='Fix archives and texts sent over HTTP (see zds_fixcmd.server)')
+
+    group = arguments_parser.add_mutually_exclusive_group()
+    group.add_argument('-p', '--port', type=int, default=8421, help='port (on localhost)')
+    group.add_argument('-s', '--socket', type=str, help='listen on this Unix socket instead')
+    arguments_parser.add_argument('--host', type=str, default='127.0.0.1', help='address to listen on')
+
+    arguments_parser.add_argument(
+        '-j', '--workers', type=int, default=4, help='number of requests handled at the same time')
+    arguments_parser.add_argument(
+        '--memory-cache-size', type=int,
+        help='maximum number of fixed expressions kept in memory between the requests (default: 10000, 0 to disable)')
+    arguments_parser.add_argument(
+        '--max-pending', type=int,
+        help='number of requests handled or waiting, the other ones being rejected (default: 4 per worker)')
+    arguments_parser.add_argument(
+        '--max-body-size', type=int, help='maximum size of a request (in bytes, default: 64 MiB)')
+    arguments_parser.add_argument(
+        '-r', '--raw', action='store_true', help='work on the UTF-8 bytes and only decode the math expressions')
+    arguments_parser.add_argument('--verbose', action='store_true', help='log the requests in stderr')
+
+    add_fixes_arguments(arguments_parser)
+    add_cache_arguments(arguments_parser)
+    add_limits_arguments(arguments_parser)
+
+    return arguments_parser
+
+
+def serve(argv):
+    """Run the fix service, until interrupted
+
+    :param argv: the arguments (after ``serve``)
+    :type argv: list of str
+    """
+
+    import signal
+
+    args = get_serve_arguments_parser().parse_args(argv)
+
+    if args.workers < 1:
+        return exit_failure('--workers should be at least 1')
+    if args.max_pending is not None and args.max_pending < 1:
+        return exit_failure('--max-pending should be at least 1')
+    if args.memory_cache_size is not None and args.memory_cache_size < 0:
+        return exit_failure('--memory-cache-size should be positive')
+
+    from zds_fixcmd import cache, server
+
+    fix_classes = load_fix_classes(args)
+    fix_cache = open_cache(args)
+
+    try:
+        s = server.create_server(
+            server.FixService(
+                fix_classes, fix_cache, args.raw, get_limits(args),
+                cache.DEFAULT_MEMORY_ENTRIES if args.memory_cache_size is None else args.memory_cache_size),
+            port=args.port, host=args.host,
+            socket_path=args.socket, workers=args.workers, verbose=args.verbose, max_pending=args.max_pending,
+            max_body_size=args.max_body_size or server.MAX_BODY_SIZE)
+    except OSError as e:
+        if fix_cache is not None:
+            fix_cache.close()
+        return exit_failure('cannot listen: {}'.format(str(e)))
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    sys.stderr.write('listening on {}\n'.format(
+        args.socket if args.socket else 'http://{}:{}'.format(*s.server_address[:2])))
 
     try:
-        c.fix()
-    except FixError as e:
-        return exit_failure('error while fixing content: {}'.format(str(e)))
+        s.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        s.server_close()
+        if fix_cache is not None:
+            fix_cache.close()
+
+
+def write_profile(path, profiler, fix_cache=None):
+    """Write the report of the profiler, and its summary in stderr
+
+    :param path: path of the report
+    :type path: str
+    :param profiler: the profiler
+    :type profiler: zds_fixcmd.profiling.Profiler
+    :param fix_cache: persistent cache
+    :type fix_cache: zds_fixcmd.cache.FixCache
+    """
+
+    import json
+
+    if fix_cache is not None:
+        profiler.count('cache hits', fix_cache.hits)
+        profiler.count('cache misses', fix_cache.misses)
+
+    with open(path, 'w') as f:
+        json.dump(profiler.report(), f, indent=2)
+
+    sys.stderr.write(profiler.summary())
+    sys.stderr.write('\n')
+
+
+def write_memory_report(path, memory):
+    """Write the memory report, and its summary in stderr
+
+    :param path: path of the report
+    :type path: str
+    :param memory: the memory report
+    :type memory: zds_fixcmd.memory.MemoryReport
+    """
+
+    import json
+
+    with open(path, 'w') as f:
+        json.dump(memory.report(), f, indent=2)
+
+    sys.stderr.write(memory.summary())
+    sys.stderr.write('\n')
+
+
+def get_output(infile, args):
+    """Get the output for a given input: ``--output`` if given, otherwise stdout for stdin, the directory itself if
+    ``--in-place``, ``X.fix`` for a directory ``X`` and ``X.fix.zip`` for ``X.zip`` (or ``X.fix.md`` for ``X.md``)
+
+    :param infile: the input
+    :type infile: str
+    :param args: the arguments
+    :type args: argparse.Namespace
+    :rtype: str
+    """
+
+    if args.output is not None:
+        return args.output
+
+    if infile == STDIO:
+        return STDIO
+
+    if os.path.isdir(infile):
+        return infile if args.in_place else infile.rstrip(os.sep) + '.fix'
+
+    base, extension = os.path.splitext(infile)
+    if extension == '':
+        extension = '.zip' if args.format == 'zip' else '.md'
+
+    return base + '.fix' + extension
+
+
+def read_input(infile, args, **kwargs):
+    """Create the content of an input.
+
+    An archive read from stdin is spooled (if stdin cannot seek), since ``zipfile`` needs to seek, while a markdown
+    text is the introduction of an empty content.
+
+    :param infile: the input
+    :type infile: str
+    :param args: the arguments
+    :type args: argparse.Namespace
+    :param kwargs: arguments of the content (see ``zds_fixcmd.fixes.FixableContent``)
+    :type kwargs: dict
+    :return: the content, and the size of the input
+    :rtype: tuple
+    """
+
+    import shutil
+    import tempfile
+
+    from zds_fixcmd import content
+    from zds_fixcmd.fixes import FixableContent
+
+    raw = args.raw or args.check or args.list
+
+    if args.format == 'markdown':
+        if infile == STDIO:
+            text = sys.stdin.buffer.read()
+        else:
+            with open(infile, 'rb') as f:
+                text = f.read()
+
+        size = len(text)
+        if not raw:
+            try:
+                text = str(text, 'utf-8')
+            except UnicodeDecodeError:
+                raise content.BadArchiveError('{}: not UTF-8'.format(infile))
+
+        c = FixableContent(infile, 'markdown', **kwargs)
+        c.introduction_path = infile
+        c.introduction_value = text
+        return c, size
+
+    if infile != STDIO:
+        return FixableContent.extract(infile, raw=raw, **kwargs), os.path.getsize(infile)
+
+    source = sys.stdin.buffer
+    if not source.seekable():
+        source = tempfile.SpooledTemporaryFile(SPOOL_MAX_SIZE)
+        shutil.copyfileobj(sys.stdin.buffer, source)
+
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+
+    return FixableContent.extract(source, raw=raw, **kwargs), size
+
+
+class CountingWriter:
+    """Count the bytes written in a (non-seekable) stream
+
+    :param stream: the stream
+    :type stream: io.BufferedIOBase
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def write_output(c, outfile, args):
+    """Write the fixed content (a content extracted from a directory is written in a directory, unless the output
+    is an archive)
+
+    :param c: the content
+    :type c: zds_fixcmd.fixes.FixableContent
+    :param outfile: the output
+    :type outfile: str
+    :param args: the arguments
+    :type args: argparse.Namespace
+    :return: the number of bytes written
+    :rtype: int
+    """
+
+    from zds_fixcmd import content
+
+    if outfile == STDIO:
+        stream = CountingWriter(sys.stdout.buffer)
+        if args.format == 'markdown':
+            content.write_in_file(stream, c._introduction_value)
+        else:
+            c.save(stream)
+
+        stream.flush()
+        return stream.count
+
+    if args.format == 'markdown':
+        with open(outfile, 'wb') as f:
+            content.write_in_file(f, c._introduction_value)
+    elif os.path.isdir(outfile) or (c.directory is not None and not outfile.endswith('.zip')):
+        return c.save_directory(outfile)
+    else:
+        c.save(outfile)
+
+    return os.path.getsize(outfile)
+
+
+def get_budget(args):
+    """Get the time budgets given by the options (if any)
+
+    :param args: the arguments
+    :type args: argparse.Namespace
+    :rtype: zds_fixcmd.budget.Budget
+    """
+
+    if args.expression_budget is None and args.archive_budget is None:
+        return None
+
+    from zds_fixcmd import budget
+    return budget.Budget(args.expression_budget, args.archive_budget)
+
+
+def fix_input(
+        infile, args, fix_classes, fix_cache=None, profiler=None, metrics_exporter=None, memory=None,
+        time_budget=None):
+    """Fix an input (or check it, with ``--check`` and ``--list``), and write its output.
+    The time budget of the archive covers the extraction and the fix (or check), but not the output.
+
+    :param infile: the input
+    :type infile: str
+    :param args: the arguments
+    :type args: argparse.Namespace
+    :param fix_classes: the fixes to apply
+    :type fix_classes: list of type
+    :param fix_cache: persistent cache
+    :type fix_cache: zds_fixcmd.cache.FixCache
+    :param profiler: the profiler
+    :type profiler: zds_fixcmd.profiling.Profiler
+    :param metrics_exporter: exporter of the metrics
+    :type metrics_exporter: zds_fixcmd.metrics.MetricsExporter
+    :param memory: the memory report
+    :type memory: zds_fixcmd.memory.MemoryReport
+    :param time_budget: time budgets
+    :type time_budget: zds_fixcmd.budget.Budget
+    :return: ``archive`` (the input), ``output`` (if written), ``paths`` (the files that need a fix, with
+      ``--check`` and ``--list``), ``errors`` (on math expressions, with ``--keep-going``), ``failure`` (the error, if
+      the input could not be processed) and ``fatal`` (if the failure should stop the run, unless ``--keep-going``)
+    :rtype: dict
+    """
+
+    import contextlib
+    import zipfile
+
+    from zds_fixcmd import budget, content, incremental
+    from zds_fixcmd.fixes import EXPRESSION_ERRORS
+
+    def stage(name):
+        return profiler.stage(name) if profiler is not None else contextlib.nullcontext()
+
+    result = {
+        'archive': infile, 'output': None, 'paths': [], 'errors': [], 'failure': None, 'fatal': False}
+
+    step = 'opening {}'.format('archive' if args.format == 'zip' else 'text')
+    outfile = index_path = None
+
+    try:
+        with time_budget if time_budget is not None else contextlib.nullcontext():
+            with stage('extract'):
+                c, size = read_input(
+                    infile, args, fixes=[f() for f in fix_classes], memoize=True, cache=fix_cache)
+
+            c.budget = time_budget
+            c.limits = get_limits(args)
+
+            if args.keep_going:
+                c.errors = []
+
+            if profiler is not None:
+                profiler.archive = infile
+                c.profiler = profiler
+
+            if memory is not None:
+                memory.archive = infile
+                memory.snapshot('extract')
+                c.memory = memory
+
+            if metrics_exporter is not None:
+                c.metrics = metrics_exporter.metrics
+                c.metrics.inc('archives')
+                c.metrics.inc('bytes_read', size, archive=infile)
+
+            if args.check or args.list:
+                step = 'checking content'
+                result['paths'] = c.check(stop_at_first=not args.list)
+            else:
+                step = 'fixing content'
+                outfile = get_output(infile, args)
+                index_path = outfile + '.index.json'
+
+                if args.index:
+                    previous_index = None
+                    if os.path.exists(index_path) and os.path.exists(outfile):
+                        try:
+                            previous_index = incremental.FixIndex.load(index_path)
+                        except incremental.BadIndexError:
+                            pass
+
+                    c.incremental = incremental.IncrementalFix(c.fixes, previous_index, outfile, c.limits)
+
+                try:
+                    c.fix()
+                finally:
+                    if c.incremental is not None:
+                        c.incremental.close()
+    except (content.BadManifestError, content.BadArchiveError, zipfile.BadZipFile, budget.BudgetExceeded) + \
+            EXPRESSION_ERRORS as e:
+        result['failure'] = 'error while {}: {}'.format(step, str(e))
+        result['fatal'] = not isinstance(e, budget.BudgetExceeded)
+        return result
+
+    c.budget = None
+
+    if args.keep_going:
+        result['errors'] = [dict(error.as_dict(), archive=infile) for error in c.errors]
+
+    if args.check or args.list:
+        if memory is not None:
+            memory.snapshot('check', sites=True)
+
+        return result
+
+    if memory is not None:
+        memory.snapshot('fix', sites=True)
+
+    with stage('save'):
+        written = write_output(c, outfile, args)
+
+    if memory is not None:
+        memory.snapshot('save')
+
+    if profiler is not None:
+        profiler.count('files', len(c.edits))
+        profiler.count('modified files', len(c.edits) - len(c.unmodified_paths()))
+        if c.incremental is not None:
+            profiler.count('reused files', len(c.incremental.reused))
+
+    if args.index:
+        c.incremental.index.save(index_path)
+
+    if metrics_exporter is not None:
+        c.metrics.inc('bytes_written', written, archive=infile)
+
+    result['output'] = outfile
+    return result
+
+
+# state of a worker of the pool (``--jobs``)
+_worker = {}
+
+# modules imported before the workers are started, so that they do not import them again
+WORKER_PRELOAD = [
+    'zds_fixcmd.budget', 'zds_fixcmd.cache', 'zds_fixcmd.content', 'zds_fixcmd.fixes', 'zds_fixcmd.incremental',
+    'zds_fixcmd.math_parser', 'zipfile']
+
+
+def _start_worker(args, fix_classes):
+    if args.macros is not None:  # (already there if the worker was forked)
+        from zds_fixcmd.fixes import fix_newcommand
+        fix_newcommand.load_library(args.macros)
+
+    _worker['cache'] = open_cache(args)
+    _worker['budget'] = get_budget(args)
+
+
+def _fix_in_worker(infile, args, fix_classes):
+    return fix_input(infile, args, fix_classes, _worker['cache'], time_budget=_worker['budget'])
+
+
+def _stop_worker(args, fix_classes):
+    if _worker['cache'] is not None:
+        _worker['cache'].close()
+
+
+def process(args, fix_classes, fix_cache=None, profiler=None, metrics_exporter=None, memory=None, journal=None):
+    """Process the archives given as input (in worker processes, with ``--jobs``)
+
+    :param args: the arguments
+    :type args: argparse.Namespace
+    :param fix_classes: the fixes to apply
+    :type fix_classes: list of type
+    :param fix_cache: persistent cache
+    :type fix_cache: zds_fixcmd.cache.FixCache
+    :param profiler: the profiler
+    :type profiler: zds_fixcmd.profiling.Profiler
+    :param metrics_exporter: exporter of the metrics
+    :type metrics_exporter: zds_fixcmd.metrics.MetricsExporter
+    :param memory: the memory report
+    :type memory: zds_fixcmd.memory.MemoryReport
+    :param journal: the journal
+    :type journal: zds_fixcmd.journal.Journal
+    """
+
+    if journal is not None:
+        from zds_fixcmd.journal import hash_input
+
+    needs_fix = False
+    errors = []
+    skipped = 0
+
+    def fail(infile, message, stop):
+        """Stop on an error (or report it and go on with the next input)"""
+
+        if journal is not None and infile in journal.running:
+            journal.failed(infile, message)
+
+        if stop:
+            return exit_failure(message)
+
+        sys.stderr.write('{}: {}\n'.format(infile, message))
+        errors.append({'archive': infile, 'message': message})
+
+    def inputs():
+        nonlocal skipped
+
+        for infile in args.infile:
+            if journal is not None:
+                input_hash = hash_input(infile)
+                if args.resume and journal.is_done(infile, input_hash):
+                    skipped += 1
+                    continue
+
+                journal.start(infile, input_hash)
+
+            yield infile
+
+    pool = None
+
+    if args.jobs > 1:
+        from zds_fixcmd import pool as pool_module
+
+        # a worker stuck where the timer cannot interrupt it is killed (and replaced)
+        pool = pool_module.WorkerPool(
+            _fix_in_worker, (args, fix_classes), args.jobs,
+            None if args.archive_budget is None else args.archive_budget + WORKER_KILL_DELAY,
+            initializer=_start_worker, finalizer=_stop_worker, start_method=args.start_method,
+            preload=WORKER_PRELOAD + sorted(set(f.__module__ for f in fix_classes)))
+
+        results = (
+            result if success else {
+                'archive': infile, 'output': None, 'paths': [], 'errors': [], 'failure': result, 'fatal': False}
+            for infile, success, result in pool.imap_unordered(inputs()))
+    else:
+        time_budget = get_budget(args)
+        results = (
+            fix_input(infile, args, fix_classes, fix_cache, profiler, metrics_exporter, memory, time_budget)
+            for infile in inputs())
+
+    try:
+        for result in results:
+            infile = result['archive']
+
+            for error in result['errors']:
+                # (the whole expression is only in the error report)
+                expression = error['expression'].replace('\n', ' ')
+                sys.stderr.write('{archive}:{path}:{line}:{column}: {message} ({0})\n'.format(
+                    expression if len(expression) < 60 else expression[:57] + '...', **error))
+                errors.append(error)
+
+            # (exceeded budgets and lost workers never stop the run)
+            if result['failure'] is not None:
+                fail(infile, result['failure'], stop=result['fatal'] and not args.keep_going)
+                continue
+
+            if args.check or args.list:
+                if len(result['paths']) != 0:
+                    needs_fix = True
+
+                    if args.check:
+                        break
+
+                    for path in result['paths']:
+                        print('{}:{}'.format(infile, path) if args.format == 'zip' else infile)
+            elif journal is not None:
+                if len(result['errors']) != 0:
+                    journal.failed(infile, '{} math expression(s) could not be fixed'.format(len(result['errors'])))
+                else:
+                    journal.done(infile, result['output'], hash_input(result['output']) if args.in_place else None)
+
+            if metrics_exporter is not None:
+                metrics_exporter.export_if_needed()
+    finally:
+        if pool is not None:
+            pool.close()
+
+    if skipped != 0:
+        sys.stderr.write('{} input(s) skipped (done according to the journal)\n'.format(skipped))
+
+    if args.error_report:
+        import json
+
+        with open(args.error_report, 'w') as f:
+            json.dump(errors, f, indent=2, ensure_ascii=False)
+
+    if len(errors) != 0:
+        return exit_failure('{} error(s)'.format(len(errors)))
 
-    c.save(args.infile.replace('.zip', '.fix.zip'))
+    if needs_fix:
+        return sys.exit(EXIT_NEEDS_FIX)
 
 
 if __name__ == '__main__':
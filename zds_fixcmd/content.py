@@ -1,24 +1,307 @@
 # Note: inspired by https://github.com/zestedesavoir/zds-site/blob/dev/zds/tutorialv2/
 
+import mmap
+import os
+import sys
 import zipfile
 
-try:
-    import ujson as json_handler
-except ImportError:
+_json_handler = None
+
+# files of a directory that are larger are memory-mapped (and decoded from the mapping)
+MMAP_MIN_SIZE = 1024 * 1024
+
+
+def get_json_handler():
+    """Get the fastest JSON module available (``ujson``, ``simplejson`` or ``json``), imported on first call
+
+    :rtype: module
+    """
+
+    global _json_handler
+
+    if _json_handler is None:
+        try:
+            import ujson as json_handler
+        except ImportError:
+            try:
+                import simplejson as json_handler
+            except ImportError:
+                import json as json_handler
+
+        _json_handler = json_handler
+
+    return _json_handler
+
+
+class Document:
+    """Piece table over a text: the original text, plus a list of edits (``offset, length, replacement``).
+
+    The text is only materialized (once) when needed, and can otherwise be streamed in chunks.
+
+    :param original: the original text
+    :type original: str|bytes
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self.edits = []
+
+    @property
+    def modified(self):
+        """
+        :return: ``True`` if there is at least one edit
+        :rtype: bool
+        """
+        return len(self.edits) != 0
+
+    def edit(self, offset, length, replacement):
+        """Replace ``length`` characters (or bytes), starting at ``offset`` in the original text, by ``replacement``.
+        Edits must be added in order, and must not overlap.
+
+        :param offset: offset in the original text
+        :type offset: int
+        :param length: length of the replaced part
+        :type length: int
+        :param replacement: the replacement
+        :type replacement: str|bytes
+        """
+
+        if len(self.edits) != 0 and offset < self.edits[-1][0] + self.edits[-1][1]:
+            raise ValueError('edit at {} overlaps (or is before) the previous one'.format(offset))
+
+        self.edits.append((offset, length, replacement))
+
+    def chunks(self):
+        """Stream the (modified) text
+
+        :rtype: collections.Iterator
+        """
+
+        original = self.original
+        if isinstance(original, bytes):
+            original = memoryview(original)
+
+        last = 0
+        for offset, length, replacement in self.edits:
+            if offset > last:
+                yield original[last:offset]
+            if len(replacement) != 0:
+                yield replacement
+            last = offset + length
+
+        if last < len(original) or len(self.edits) == 0:
+            yield original[last:]
+
+    def materialize(self):
+        """Get the (modified) text
+
+        :rtype: str|bytes
+        """
+
+        if not self.modified:
+            return self.original
+
+        return self.original[:0].join(self.chunks())
+
+
+def text_property(name):
+    """Property for a text, which may be set to a ``Document`` (that is then materialized on first access)
+
+    :param name: name of the attribute that actually stores the text
+    :type name: str
+    :rtype: property
+    """
+
+    def getter(self):
+        value = getattr(self, name)
+        if isinstance(value, Document):
+            value = value.materialize()
+            setattr(self, name, value)
+        return value
+
+    def setter(self, value):
+        setattr(self, name, value)
+
+    return property(getter, setter)
+
+
+def write_in_file(f, value):
+    """Write a text (in UTF-8) in a binary file. Documents are streamed, so that they are never materialized.
+
+    :param f: the file
+    :type f: io.BufferedIOBase
+    :param value: the text
+    :type value: str|bytes|Document
+    """
+
+    for chunk in (value.chunks() if isinstance(value, Document) else [value]):
+        f.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+
+
+def write_in_zip(archive, path, value):
+    """Write a text in the archive. Documents are streamed, so that they are never materialized.
+
+    :param archive: the zip
+    :type archive: zipfile.ZipFile
+    :param path: path in the archive
+    :type path: str
+    :param value: the text
+    :type value: str|bytes|Document
+    """
+
+    if not isinstance(value, Document):
+        archive.writestr(path, value)
+    else:
+        with archive.open(path, 'w') as f:
+            write_in_file(f, value)
+
+
+def decode(path, data):
+    """
+    :param path: path of the file
+    :type path: str
+    :param data: UTF-8 text
+    :type data: bytes|mmap.mmap
+    :rtype: str
+    """
+
+    try:
+        return str(data, 'utf-8')
+    except UnicodeDecodeError:
+        raise BadArchiveError('{}: not UTF-8'.format(path))
+
+
+def write_atomically(path, value, mode_from=None):
+    """Write a text in a file, through a temporary file that replaces it, so that the file is never partially written
+
+    :param path: path of the file
+    :type path: str
+    :param value: the text
+    :type value: str|bytes|Document
+    :param mode_from: file from which the permissions are copied (otherwise, ``rw-r--r--``)
+    :type mode_from: str
+    :return: number of bytes written
+    :rtype: int
+    """
+
+    import shutil
+    import tempfile
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
     try:
-        import simplejson as json_handler
-    except ImportError:
-        import json as json_handler
+        with os.fdopen(fd, 'wb') as f:
+            write_in_file(f, value)
+            size = f.tell()
+
+        if mode_from is not None and os.path.exists(mode_from):
+            shutil.copymode(mode_from, temporary)
+        else:
+            os.chmod(temporary, 0o644)
+
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+    return size
+
+
+class ZipSource:
+    """Files of a content in a zip archive
+
+    :param path: the archive
+    :type path: str|io.IOBase
+    """
+
+    def __init__(self, path):
+        self.archive = zipfile.ZipFile(path, 'r')
+
+    def read_text(self, path, raw=False):
+        """Read a file and get its text
+
+        :param path: path in the archive
+        :type path: str
+        :param raw: do not decode the content
+        :type raw: bool
+        :rtype: str|bytes
+        """
+
+        try:
+            data = self.archive.read(path)
+        except KeyError:
+            raise BadArchiveError('{}: no such file in archive'.format(path))
+
+        return data if raw else decode(path, data)
+
+    def close(self):
+        self.archive.close()
+
+
+class DirectorySource:
+    """Files of a content in a directory.
+    Files larger than ``MMAP_MIN_SIZE`` are decoded straight from a memory mapping (instead of being read in a buffer
+    first).
+
+    :param directory: the directory
+    :type directory: str
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def full_path(self, path):
+        """
+        :param path: path of a file, relative to the directory
+        :type path: str
+        :rtype: str
+        """
+
+        normalized = os.path.normpath(path)
+        if os.path.isabs(normalized) or normalized.split(os.sep)[0] == os.pardir:
+            raise BadManifestError('{}: outside of the content'.format(path))
+
+        return os.path.join(self.directory, normalized)
+
+    def read_text(self, path, raw=False):
+        """Read a file and get its text
+
+        :param path: path in the directory
+        :type path: str
+        :param raw: do not decode the content
+        :type raw: bool
+        :rtype: str|bytes
+        """
+
+        try:
+            with open(self.full_path(path), 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if raw or size == 0 or size < MMAP_MIN_SIZE:  # (an empty file cannot be mapped)
+                    data = f.read()
+                    return data if raw else decode(path, data)
+
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                    return decode(path, mapping)
+        except (FileNotFoundError, IsADirectoryError):
+            raise BadArchiveError('{}: no such file in directory'.format(path))
+
+    def close(self):
+        pass
 
 
 class Base:
-    title = ''
-    slug = ''
-    parent = None
+    """
+    A node of the tree of a content (slotted, since a content may have thousands of them).
+    """
+
+    __slots__ = ('title', 'slug', 'key', 'parent')
 
     def __init__(self, title, slug='', parent=None):
         self.title = title
         self.slug = slug
+        self.key = slug  # unique key in the content, set by ``ManifestIndex``
         self.parent = parent
 
     def __str__(self):
@@ -30,19 +313,22 @@ class Container(Base):
      A container, which can have sub-Containers or Extracts.
     """
 
-    children = []
-    children_dict = {}
+    __slots__ = (
+        'children', 'children_dict', 'introduction_path', '_introduction_value', 'conclusion_path',
+        '_conclusion_value')
 
-    introduction_path = None
-    introduction_value = ''
-    conclusion_path = None
-    conclusion_value = ''
+    introduction_value = text_property('_introduction_value')
+    conclusion_value = text_property('_conclusion_value')
 
     def __init__(self, title, slug='', parent=None):
         super().__init__(title, slug, parent)
 
         self.children = []
         self.children_dict = {}
+        self.introduction_path = None
+        self._introduction_value = ''
+        self.conclusion_path = None
+        self._conclusion_value = ''
 
     def top_container(self):
         """
@@ -86,18 +372,26 @@ class Container(Base):
         self.children.append(child)
         self.children_dict[child.slug] = child
 
+        top = self.top_container()
+        if isinstance(top, Content):
+            top.index = None
+
 
 class Extract(Base):
     """
     A content extract from a Container.
     """
 
-    text_path = None
-    text_value = ''
+    __slots__ = ('text_path', '_text_value')
+
+    text_value = text_property('_text_value')
 
     def __init__(self, title, slug='', parent=None):
         super().__init__(title, slug, parent)
 
+        self.text_path = None
+        self._text_value = ''
+
 
 class BadArchiveError(Exception):
     pass
@@ -107,48 +401,152 @@ class BadManifestError(Exception):
     pass
 
 
+class ManifestIndex:
+    """Flat view of the tree of a content, built once (without recursion).
+
+    Each node gets a unique ``key``, made of the slugs from the content to the node (e.g. ``content/part/chapter``).
+
+    + ``containers``: the containers, in pre-order (the content first) ;
+    + ``files``: ``(path, node, attribute)`` for each file, in the order of the containers (then introduction,
+      extracts and conclusion), where ``attribute`` is the one that holds the text (e.g. ``text_value``) ;
+    + ``nodes``: key -> node ;
+    + ``container_files``: key -> files of the container (as in ``files``) ;
+    + ``subtrees``: key -> ``(begin, end)``, the slice of ``containers`` of the container and its descendants.
+
+    :param content: the content
+    :type content: Content
+    """
+
+    def __init__(self, content):
+        self.containers = []
+        self.files = []
+        self.nodes = {}
+        self.container_files = {}
+        self.subtrees = {}
+
+        content.key = content.slug
+        self.nodes[content.key] = content
+
+        depths = []
+        stack = [(content, 0)]
+
+        while len(stack) != 0:
+            container, depth = stack.pop()
+            self.containers.append(container)
+            depths.append(depth)
+
+            files = []
+            if container.introduction_path:
+                files.append((container.introduction_path, container, 'introduction_value'))
+
+            subcontainers = []
+            for child in container.children:
+                key = container.key + '/' + child.slug
+                n = 1
+                while key in self.nodes:  # same slug for siblings
+                    n += 1
+                    key = '{}/{}~{}'.format(container.key, child.slug, n)
+
+                child.key = key
+                self.nodes[key] = child
+
+                if isinstance(child, Container):
+                    subcontainers.append(child)
+                elif child.text_path:
+                    files.append((child.text_path, child, 'text_value'))
+
+            if container.conclusion_path:
+                files.append((container.conclusion_path, container, 'conclusion_value'))
+
+            self.container_files[container.key] = files
+            self.files.extend(files)
+
+            stack.extend((c, depth + 1) for c in reversed(subcontainers))
+
+        # a subtree ends with the first next container which is not deeper
+        opened = []
+        for i, depth in enumerate(depths):
+            while len(opened) != 0 and depths[opened[-1]] >= depth:
+                j = opened.pop()
+                self.subtrees[self.containers[j].key] = (j, i)
+            opened.append(i)
+
+        for j in opened:
+            self.subtrees[self.containers[j].key] = (j, len(self.containers))
+
+    def subtree(self, container):
+        """
+        :param container: the container
+        :type container: Container
+        :return: the container and its descendants, in pre-order
+        :rtype: list of Container
+        """
+
+        begin, end = self.subtrees[container.key]
+        return self.containers[begin:end]
+
+
 class Content(Container):
 
     type = ''
     manifest = ''
+    index = None
+    directory = None
+    loaded = None
 
     def __init__(self, title, slug=''):
         super().__init__(title, slug, None)
 
-    @staticmethod
-    def extract(path):
-        """Open a zip file and create a content
+    def get_index(self):
+        """Get the index of the tree (built if the tree changed)
+
+        :rtype: ManifestIndex
+        """
+
+        if self.index is None:
+            self.index = ManifestIndex(self)
+
+        return self.index
+
+    @classmethod
+    def extract(cls, path, raw=False, **kwargs):
+        """Open a zip file (or a directory) and create a content (of the class on which it is called, to which
+        ``kwargs`` are given).
+
+        If ``raw`` is set, the text of the files is kept as (UTF-8 encoded) ``bytes`` rather than decoded to ``str``
+        (the manifest is still decoded).
 
         :param path: the path
         :type path: str
+        :param raw: keep the files as bytes
+        :type raw: bool
         :rtype: Content
         """
 
-        def read_in_zip(archive, path):
-            """Read a file in the archive and get text
-
-            :param archive: the zip
-            :type archive: zpifile.ZupFile
-            :param path: path in the archive
-            :type path: str
-            :rtype: str
-            """
+        if isinstance(path, str) and os.path.isdir(path):
+            source = DirectorySource(path)
+        else:
+            source = ZipSource(path)
 
-            try:
-                txt = str(archive.read(path), 'utf-8')
-            except KeyError:
-                raise BadArchiveError('{}: no such file in archive'.format(path))
-            except UnicodeDecodeError:
-                raise BadArchiveError('{}: not UTF-8'.format(path))
+        try:
+            content = cls._extract_from(source, raw, **kwargs)
+        finally:
+            source.close()
 
-            return txt
+        if isinstance(source, DirectorySource):
+            # (to find the files that changed, see ``changed_paths()``)
+            content.directory = path
+            content.loaded = dict(
+                (file_path, getattr(node, '_' + attribute)) for file_path, node, attribute in content.get_index().files)
 
-        zip_archive = zipfile.ZipFile(path, 'r')
+        return content
 
+    @classmethod
+    def _extract_from(cls, source, raw, **kwargs):
         # is the manifest ok ?
         try:
-            manifest = read_in_zip(zip_archive, 'manifest.json')
-            manifest = json_handler.loads(manifest)
+            manifest = source.read_text('manifest.json')
+            manifest = get_json_handler().loads(manifest)
         except ValueError:
             raise BadArchiveError('the manifest is not in the JSON format (or there is an error)')
         if 'version' not in manifest or manifest['version'] not in (2, 2.1):
@@ -160,7 +558,7 @@ class Content(Container):
         if 'slug' not in manifest:
             raise BadManifestError('no slug in manifest')
 
-        content = Content(manifest['title'], manifest['slug'])
+        content = cls(manifest['title'], manifest['slug'], **kwargs)
 
         if 'type' in manifest:
             content.type = manifest['type']
@@ -170,91 +568,126 @@ class Content(Container):
         content.manifest = manifest
 
         # extract containers and extracts:
+        # (paths are interned, as they are shared by the nodes, the index and the manifest)
         if 'introduction' in manifest:
-            content.introduction_path = manifest['introduction']
+            content.introduction_path = sys.intern(manifest['introduction'])
         if 'conclusion' in manifest:
-            content.conclusion_path = manifest['conclusion']
-
-        def fill(json_sub, parent):
-            """Create the structure from the manifest
-
-            :param json_sub: subset of the json file
-            :type json_sub: dict
-            :param parent: parent container
-            :type parent: Container
-            """
-            if 'children' in json_sub:  # it is a container
-                for child in json_sub['children']:
-                    if 'title' not in child:
-                        raise BadManifestError('no title for a child in "{}"'.format(parent.title))
-                    if 'slug' not in child:
-                        raise BadManifestError('no slug for a child in "{}"'.format(parent.title))
-
-                    if child['object'] == 'container':
-                        c = Container(child['title'], child['slug'])
-                        if 'introduction' in child:
-                            c.introduction_path = child['introduction']
-                        if 'conclusion' in child:
-                            c.conclusion_path = child['conclusion']
-
-                        fill(child, c)
-                    else:
-                        c = Extract(child['title'], child['slug'])
-                        if 'text' in child:
-                            c.text_path = child['text']
-
-                    parent.add_child(c)
-
-        fill(manifest, content)
+            content.conclusion_path = sys.intern(manifest['conclusion'])
+
+        # create the structure from the manifest
+        queue = [(manifest, content)]
+        while len(queue) != 0:
+            json_sub, parent = queue.pop()
+
+            for child in json_sub.get('children', []):
+                if 'title' not in child:
+                    raise BadManifestError('no title for a child in "{}"'.format(parent.title))
+                if 'slug' not in child:
+                    raise BadManifestError('no slug for a child in "{}"'.format(parent.title))
+
+                if child['object'] == 'container':
+                    c = Container(child['title'], child['slug'])
+                    if 'introduction' in child:
+                        c.introduction_path = sys.intern(child['introduction'])
+                    if 'conclusion' in child:
+                        c.conclusion_path = sys.intern(child['conclusion'])
+
+                    queue.append((child, c))
+                else:
+                    c = Extract(child['title'], child['slug'])
+                    if 'text' in child:
+                        c.text_path = sys.intern(child['text'])
 
-        # check if all files are present in the archive, and extract them
-        def walk(archive, container):
-            """Get all files that the archive should contain
-
-            :param archive: the zip
-            :type archive: zpifile.ZipFile
-            :param container: the container
-            :type container: Container
-            """
-            if container.introduction_path:
-                container.introduction_value = read_in_zip(archive, container.introduction_path)
-            if container.conclusion_path:
-                container.conclusion_value = read_in_zip(archive, container.conclusion_path)
+                parent.add_child(c)
 
-            for child in container.children:
-                if isinstance(child, Container):
-                    walk(archive, child)
-                else:
-                    child.text_value = read_in_zip(archive, child.text_path)
+        # check if all files are present in the archive, and extract them
+        for file_path, node, attribute in content.get_index().files:
+            setattr(node, attribute, source.read_text(file_path, raw))
 
-        walk(zip_archive, content)
         return content
 
     def save(self, path):
         zip_archive = zipfile.ZipFile(path, 'w')
 
         # dump manifest
-        zip_archive.writestr('manifest.json', json_handler.dumps(self.manifest, indent=4, ensure_ascii=False))
+        zip_archive.writestr('manifest.json', get_json_handler().dumps(self.manifest, indent=4, ensure_ascii=False))
 
-        # dump other files
-        def walk(archive, container):
-            """Get all files that the archive should contain
+        # dump other files (the documents are not materialized)
+        for file_path, node, attribute in self.get_index().files:
+            write_in_zip(zip_archive, file_path, getattr(node, '_' + attribute))
 
-            :param archive: the zip
-            :type archive: zpifile.ZipFile
-            :param container: the container
-            :type container: Container
-            """
-            if container.introduction_path:
-                zip_archive.writestr(container.introduction_path, container.introduction_value)
-            if container.conclusion_path:
-                zip_archive.writestr(container.conclusion_path, container.conclusion_value)
+        zip_archive.close()
 
-            for child in container.children:
-                if isinstance(child, Container):
-                    walk(archive, child)
-                else:
-                    zip_archive.writestr(child.text_path, child.text_value)
+    def changed_paths(self):
+        """Files whose text is not the one that was extracted from a directory (all of them for another content)
 
-        walk(zip_archive, self)
-        zip_archive.close()
+        :rtype: list of str
+        """
+
+        loaded = self.loaded or {}
+        paths = []
+
+        for file_path, node, attribute in self.get_index().files:
+            value = getattr(node, '_' + attribute)
+            if file_path not in loaded or \
+                    (value is not loaded[file_path] and not (isinstance(value, Document) and not value.modified)):
+                paths.append(file_path)
+
+        return paths
+
+    def save_directory(self, directory=None):
+        """Write the content in a directory: in place (by default, for a content extracted from a directory), or in
+        a mirror.
+
+        Only the files that changed are written (atomically). In a mirror of the directory of the content, the other
+        files (and the manifest) are copied, unless they are already up to date.
+
+        :param directory: the directory
+        :type directory: str
+        :return: number of bytes written
+        :rtype: int
+        """
+
+        import shutil
+
+        if directory is None:
+            if self.directory is None:
+                raise ValueError('the content was not extracted from a directory')
+            directory = self.directory
+
+        source = DirectorySource(self.directory) if self.directory is not None else None
+        target = DirectorySource(directory)
+        in_place = source is not None and os.path.realpath(directory) == os.path.realpath(source.directory)
+
+        def copy(path):
+            """Copy a file to the mirror, unless it is already there (same size and modification time)"""
+            origin, destination = source.full_path(path), target.full_path(path)
+            stat = os.stat(origin)
+            if os.path.exists(destination):
+                stat_destination = os.stat(destination)
+                if stat.st_size == stat_destination.st_size and stat.st_mtime == stat_destination.st_mtime:
+                    return 0
+
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copy2(origin, destination)
+            return stat.st_size
+
+        written = 0
+
+        if source is None:
+            written += write_atomically(
+                target.full_path('manifest.json'),
+                get_json_handler().dumps(self.manifest, indent=4, ensure_ascii=False))
+        elif not in_place:
+            written += copy('manifest.json')
+
+        changed = set(self.changed_paths()) if source is not None else None
+        for file_path, node, attribute in self.get_index().files:
+            if changed is None or file_path in changed:
+                written += write_atomically(
+                    target.full_path(file_path), getattr(node, '_' + attribute),
+                    source.full_path(file_path) if source is not None else None)
+            elif not in_place:
+                written += copy(file_path)
+
+        return written
@@ -0,0 +1,491 @@
+"""
+Differential testing of an alternative engine (lexer, parser, interpreter or fixes) against the reference one, on
+the math expressions of contents or on random ones.
+
+Usage: ``python -m zds_fixcmd.differential [--engine module:Class] [--round-trip] [--random N] [archive ...]``
+"""
+
+import random
+import sys
+
+from zds_fixcmd import math_parser, fixes as fixes_module
+
+
+class ASTDump(math_parser.ASTVisitor):
+    """Flat (pre-ordered) description of the nodes of an AST, to compare them
+
+    :param node: the node to visit
+    :type node: zds_fixcmd.math_parser.AST
+    """
+
+    def __init__(self, node):
+        super().__init__(node)
+        self.nodes = []
+        self.depth = 0
+
+    def visit(self, node, *args, **kwargs):
+        if isinstance(node, math_parser.String):
+            description = 'String({!r})'.format(node.content)
+        elif isinstance(node, math_parser.Command):
+            description = 'Command({!r}, {})'.format(node.name, len(node.parameters))
+        elif isinstance(node, math_parser.Environment):
+            description = 'Environment({!r}, {})'.format(node.name, len(node.parameters))
+        elif isinstance(node, math_parser.SubElement):
+            description = 'SubElement({})'.format('[]' if node.squared else '{}')
+        elif isinstance(node, math_parser.UnaryOperator):
+            description = 'UnaryOperator({!r})'.format(node.operator)
+        else:
+            description = type(node).__name__
+
+        self.nodes.append('  ' * self.depth + description)
+
+        self.depth += 1
+        try:
+            return super().visit(node, *args, **kwargs)
+        finally:
+            self.depth -= 1
+
+    def dump(self):
+        """
+
+        :rtype: list of str
+        """
+
+        self.nodes = []
+        if self.node is not None:
+            self._start()
+
+        return self.nodes
+
+
+class Engine:
+    """The reference engine (``zds_fixcmd.math_parser`` and the fixes of the registry).
+
+    Alternative engines should inherit from it and redefine the stages they implement.
+    """
+
+    def tokenize(self, expression):
+        """
+        :param expression: the math expression
+        :type expression: str
+        :return: ``(type, value, position)`` of the tokens
+        :rtype: list of tuple
+        """
+
+        return [(t.type, t.value, t.position) for t in math_parser.MathLexer(expression).tokenize()]
+
+    def parse(self, expression):
+        """
+        :param expression: the math expression
+        :type expression: str
+        :return: the AST
+        """
+
+        return math_parser.MathParser.parse(expression)
+
+    def dump(self, ast):
+        """
+        :param ast: an AST produced by ``parse()``
+        :return: flat description of the nodes (see ``ASTDump``)
+        :rtype: list of str
+        """
+
+        return ASTDump(ast).dump()
+
+    def interpret(self, ast):
+        """
+        :param ast: an AST produced by ``parse()``
+        :rtype: str
+        """
+
+        return math_parser.Interpreter(ast).interpret()
+
+    def get_fixes(self):
+        """
+        :return: the fixes, applied to the ASTs produced by ``parse()``
+        :rtype: list
+        """
+
+        return fixes_module.get_fixes()
+
+    def fix_content(self, path):
+        """Fix a content, with the stages of this engine (``parse()``, ``get_fixes()`` and ``interpret()``)
+
+        :param path: path of the archive
+        :type path: str
+        :return: path -> fixed text, for all the files
+        :rtype: dict
+        """
+
+        content = EngineContent.extract(path, fixes=self.get_fixes())
+        content.engine = self
+        content.fix()
+
+        return dict((p, text) for container in content.walk_containers() for p, text in content.container_files(
+            container))
+
+
+class EngineContent(fixes_module.FixableContent):
+    """Content whose math expressions are parsed and rendered by an engine (set ``engine`` before the fix)
+    """
+
+    engine = None
+
+    def _fix_math(self, groups, container, path, *args, **kwargs):
+        if groups.group(1) != groups.group(3):
+            return super()._fix_math(groups, container, path, *args, **kwargs)
+
+        e = fixes_module.MathExpression('', line=groups.group(1) == '')
+        e.base_expression = groups.group(2)
+        e.ast = self.engine.parse(groups.group(2))
+
+        for fix in self.fixes:
+            fix(e, container, path, *args, **kwargs)
+
+        s = self.engine.interpret(e.ast)
+        sep = '$' * (1 if groups.group(1) is None else 2)
+
+        return sep + s + sep if s != '' else ''
+
+
+class Mismatch:
+    """A difference between the engines
+
+    :param stage: ``tokens``, ``ast``, ``output``, ``fix`` or ``round-trip``
+    :type stage: str
+    :param location: location of the input
+    :type location: str
+    :param index: index of the first diverging token, node or character
+    :type index: int
+    :param reference: reference value at this index
+    :param alternative: alternative value at this index
+    :param expression: the input
+    :type expression: str
+    """
+
+    def __init__(self, stage, location, index, reference, alternative, expression=None):
+        self.stage = stage
+        self.location = location
+        self.index = index
+        self.reference = reference
+        self.alternative = alternative
+        self.expression = expression
+
+    def __str__(self):
+        r = '{}: {} differ at {}: {!r} != {!r}'.format(
+            self.location, self.stage, self.index, self.reference, self.alternative)
+
+        if self.expression is not None:
+            r += ' (in {!r})'.format(self.expression)
+
+        return r
+
+
+def first_difference(a, b):
+    """Find the first difference between two sequences
+
+    :type a: list|str
+    :type b: list|str
+    :return: the index (``None`` if they are equal)
+    :rtype: int
+    """
+
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return i
+
+    if len(a) != len(b):
+        return min(len(a), len(b))
+
+    return None
+
+
+def _at(sequence, index, context=0):
+    if isinstance(sequence, str):
+        return sequence[index:index + context] if context > 0 else sequence[index:index + 1]
+    return sequence[index] if index < len(sequence) else None
+
+
+def _run(function, *args):
+    try:
+        return function(*args), None
+    except Exception as e:
+        return None, e
+
+
+class Harness:
+    """Compare two engines
+
+    :param alternative: the engine to test
+    :type alternative: Engine
+    :param reference: the reference engine
+    :type reference: Engine
+    """
+
+    def __init__(self, alternative, reference=None):
+        self.alternative = alternative
+        self.reference = reference if reference is not None else Engine()
+        self.mismatches = []
+        self.expressions = 0
+
+    def _compare(self, stage, location, expression, reference, alternative, context=0):
+        (ref_value, ref_error), (alt_value, alt_error) = reference, alternative
+
+        # the same error (type and message, which includes the position) is an agreement
+        if ref_error is not None or alt_error is not None:
+            if type(ref_error) is type(alt_error) and str(ref_error) == str(alt_error):
+                return True
+
+            self.mismatches.append(Mismatch(
+                stage, location, 0, repr(ref_error) if ref_error else ref_value,
+                repr(alt_error) if alt_error else alt_value, expression))
+            return False
+
+        index = first_difference(ref_value, alt_value)
+        if index is not None:
+            self.mismatches.append(Mismatch(
+                stage, location, index, _at(ref_value, index, context), _at(alt_value, index, context), expression))
+            return False
+
+        return True
+
+    def compare_expression(self, expression, location=''):
+        """Compare the tokens, the AST and the output of an expression
+
+        :param expression: the math expression
+        :type expression: str
+        :param location: location of the expression
+        :type location: str
+        :return: ``True`` if the engines agree
+        :rtype: bool
+        """
+
+        self.expressions += 1
+        r, a = self.reference, self.alternative
+
+        same = self._compare(
+            'tokens', location, expression, _run(r.tokenize, expression), _run(a.tokenize, expression))
+
+        ref_ast, alt_ast = _run(r.parse, expression), _run(a.parse, expression)
+        same = self._compare(
+            'ast', location, expression,
+            _run(r.dump, ref_ast[0]) if ref_ast[1] is None else ref_ast,
+            _run(a.dump, alt_ast[0]) if alt_ast[1] is None else alt_ast) and same
+
+        if ref_ast[1] is None and alt_ast[1] is None:
+            same = self._compare(
+                'output', location, expression, _run(r.interpret, ref_ast[0]), _run(a.interpret, alt_ast[0]),
+                context=20) and same
+
+        return same
+
+    def compare_content(self, path):
+        """Compare all the math expressions of a content, then the fixed files
+
+        :param path: path of the archive
+        :type path: str
+        :return: ``True`` if the engines agree
+        :rtype: bool
+        """
+
+        same = True
+
+        for location, expression in content_expressions(path):
+            same = self.compare_expression(expression, location) and same
+
+        reference, error = _run(self.reference.fix_content, path)
+        alternative, alt_error = _run(self.alternative.fix_content, path)
+
+        if error is not None or alt_error is not None:
+            return self._compare('fix', path, None, (reference, error), (alternative, alt_error)) and same
+
+        for p in sorted(set(reference) | set(alternative)):
+            same = self._compare(
+                'fix', '{}:{}'.format(path, p), None,
+                (str(reference.get(p, '')), None), (str(alternative.get(p, '')), None), context=40) and same
+
+        return same
+
+
+def round_trip(expression, location='', engine=None):
+    """Check that interpreting the AST of an expression gives back the expression
+
+    :param expression: the math expression
+    :type expression: str
+    :param location: location of the expression
+    :type location: str
+    :param engine: the engine (the reference one if ``None``)
+    :type engine: Engine
+    :return: the mismatch, if any
+    :rtype: Mismatch
+    """
+
+    engine = engine if engine is not None else Engine()
+
+    try:
+        output = engine.interpret(engine.parse(expression))
+    except Exception as e:
+        return Mismatch('round-trip', location, 0, expression, repr(e), expression)
+
+    index = first_difference(expression, output)
+    if index is not None:
+        return Mismatch(
+            'round-trip', location, index, _at(expression, index, 20), _at(output, index, 20), expression)
+
+
+def content_expressions(path):
+    """Get the math expressions of a content
+
+    :param path: path of the archive
+    :type path: str
+    :return: ``(location, expression)``
+    :rtype: collections.Iterator
+    """
+
+    content = fixes_module.FixableContent.extract(path)
+
+    for container in content.walk_containers():
+        for p, text in content.container_files(container):
+            for groups in fixes_module.FIND_MATH.finditer(text):
+                yield '{}:{}:{}'.format(path, p, groups.start()), groups.group(2)
+
+
+class RandomMath:
+    """Generator of random (valid) math expressions
+
+    :param seed: random seed
+    :type seed: int
+    :param max_depth: maximum depth of nesting
+    :type max_depth: int
+    """
+
+    CHARS = 'abcxyz0123456789+-=<>()|,.;:!/* \n&\'"'
+    COMMANDS = ['alpha', 'frac', 'sqrt', 'mathbb', 'vec', 'left', 'right', 'sum', 'int', 'text', 'a', 'b']
+    ENVIRONMENTS = ['align', 'aligned', 'matrix', 'pmatrix', 'cases', 'array']
+
+    def __init__(self, seed=0, max_depth=4):
+        self.random = random.Random(seed)
+        self.max_depth = max_depth
+
+    def string(self):
+        return ''.join(self.random.choice(self.CHARS) for _ in range(self.random.randint(1, 6)))
+
+    def command(self, depth):
+        if self.random.random() < .1:
+            return '\\' + self.random.choice(math_parser.SPACES)
+
+        r = '\\' + self.random.choice(self.COMMANDS)
+        for _ in range(self.random.choice([0, 0, 1, 1, 2, 3])):
+            if self.random.random() < .8:
+                r += '{' + self.expression(depth + 1) + '}'
+            else:
+                r += '[' + self.expression(depth + 1, squared=True) + ']'
+
+        return r
+
+    def item(self, depth, squared=False):
+        r = self.random.random()
+
+        if depth >= self.max_depth or r < .3:
+            return self.string()
+        elif r < .5:
+            return self.command(depth)
+        elif r < .6:
+            return '{' + self.expression(depth + 1) + '}'
+        elif r < .75:
+            operator = self.random.choice(['^', '_'])
+            s = self.random.random()
+            if s < .4:
+                return operator + self.random.choice('abcxyz0123456789')
+            elif s < .7:
+                return operator + '{' + self.expression(depth + 1) + '}'
+            return operator + self.command(depth)
+        elif r < .8:
+            return self.random.choice(['\\{', '\\}', '\\\\'])
+        elif r < .85 and not squared:
+            # brackets right after a command would be its parameter
+            return self.string() + self.random.choice(['[', ']', '[' + self.string() + ']'])
+        elif r < .95:
+            name = self.random.choice(self.ENVIRONMENTS)
+            parameters = '{' + self.string() + '}' if self.random.random() < .2 else ''
+            return '\\begin{' + name + '}' + parameters + self.expression(depth + 1, squared) + '\\end{' + name + '}'
+
+        return self.string()
+
+    def expression(self, depth=0, squared=False):
+        """Generate an expression
+
+        :param depth: current depth
+        :type depth: int
+        :param squared: inside squared brackets (``]`` cannot be used)
+        :type squared: bool
+        :rtype: str
+        """
+
+        items = [self.item(depth, squared) for _ in range(self.random.randint(1, 5))]
+
+        # a command name would absorb the letters that follow it
+        for i in range(len(items) - 1):
+            if items[i][-1:].isalpha() and items[i + 1][:1].isalpha() and '\\' in items[i]:
+                items[i] += ' '
+
+        return ''.join(items)
+
+
+def load_engine(reference):
+    """Create an engine
+
+    :param reference: "module:Class"
+    :type reference: str
+    :rtype: Engine
+    """
+
+    return fixes_module.load_fix(reference)()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('archives', nargs='*', type=str)
+    parser.add_argument(
+        '-e', '--engine', type=str, default='zds_fixcmd.differential:Engine', help='alternative engine (module:Class)')
+    parser.add_argument('-t', '--round-trip', action='store_true', help='check the round trip of the expressions')
+    parser.add_argument('-n', '--random', type=int, default=0, help='also test N random expressions')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the random expressions')
+    parser.add_argument('-m', '--max-mismatches', type=int, default=20, help='maximum number of mismatches shown')
+    args = parser.parse_args()
+
+    engine = load_engine(args.engine)
+    harness = Harness(engine)
+    mismatches = harness.mismatches
+
+    expressions = []
+    for path in args.archives:
+        harness.compare_content(path)
+        if args.round_trip:
+            expressions.extend(content_expressions(path))
+
+    generator = RandomMath(args.seed)
+    for i in range(args.random):
+        expression = generator.expression()
+        harness.compare_expression(expression, 'random:{}:{}'.format(args.seed, i))
+        if args.round_trip:
+            expressions.append(('random:{}:{}'.format(args.seed, i), expression))
+
+    for location, expression in expressions:
+        mismatch = round_trip(expression, location, engine)
+        if mismatch is not None:
+            mismatches.append(mismatch)
+
+    for mismatch in mismatches[:args.max_mismatches]:
+        print(mismatch)
+
+    print('{} expressions, {} mismatches'.format(harness.expressions, len(mismatches)))
+
+    if len(mismatches) != 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
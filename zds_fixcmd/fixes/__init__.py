@@ -1,20 +1,160 @@
+import contextlib
+import functools
+import hashlib
+import importlib
 import re
+import sys
+import time
 
-from zds_fixcmd import content, math_parser
+import zds_fixcmd
+from zds_fixcmd import budget, content, math_parser
 
 FIND_MATH = re.compile('\\$(\\$)?(.*?)(\\$)?\\$', re.DOTALL)
 
+# same pattern, on the UTF-8 encoded text: since "$" is ASCII (and no multibyte sequence contains its byte),
+# the spans found are exactly the ones that ``FIND_MATH`` would find in the decoded text
+FIND_MATH_BYTES = re.compile(b'\\$(\\$)?(.*?)(\\$)?\\$', re.DOTALL)
+
 
 class MathExpression:
-    def __init__(self, expression, line=True):
+    def __init__(self, expression, line=True, limits=None):
         self.base_expression = expression
-        self.ast = math_parser.MathParser.parse(expression)
+        self.ast = math_parser.MathParser.parse(expression, limits=limits)
         self.line = line
 
 
 class FixError(Exception):
     def __init__(self, path, err):
         super().__init__('{}: {}'.format(path, err))
+        self.path = path
+        self.err = err
+
+
+# errors on a math expression, which are collected if ``FixableContent.errors`` is set (an AST that the parser
+# could build may still be too deep for the fixes or the interpreter)
+EXPRESSION_ERRORS = (
+    FixError, math_parser.LexerException, math_parser.ParserException, math_parser.BadEnvironment,
+    budget.ExpressionBudgetExceeded, RecursionError)
+
+
+class ExpressionError:
+    """Error on a math expression (which was left untouched)
+
+    :param path: the file
+    :type path: str
+    :param offset: offset of the expression in the file (in bytes, for ``bytes``)
+    :type offset: int
+    :param line: line of the expression (from 1)
+    :type line: int
+    :param column: column of the expression (from 1)
+    :type column: int
+    :param expression: the expression (with its delimiters)
+    :type expression: str
+    :param message: the error
+    :type message: str
+    """
+
+    def __init__(self, path, offset, line, column, expression, message):
+        self.path = path
+        self.offset = offset
+        self.line = line
+        self.column = column
+        self.expression = expression
+        self.message = message
+
+    @classmethod
+    def create(cls, error, text, path, offset, expression):
+        """
+        :param error: the error
+        :type error: Exception
+        :param text: the text of the file
+        :type text: str|bytes
+        :param path: the file
+        :type path: str
+        :param offset: offset of the expression
+        :type offset: int
+        :param expression: the expression (with its delimiters)
+        :type expression: str|bytes
+        :rtype: ExpressionError
+        """
+
+        newline = '\n' if isinstance(text, str) else b'\n'
+        if not isinstance(expression, str):
+            expression = str(expression, 'utf-8', 'replace')
+
+        return cls(
+            path, offset, text.count(newline, 0, offset) + 1, offset - text.rfind(newline, 0, offset), expression,
+            error.err if isinstance(error, (FixError, budget.BudgetExceeded)) else str(error))
+
+    def as_dict(self):
+        return {
+            'path': self.path, 'offset': self.offset, 'line': self.line, 'column': self.column,
+            'expression': self.expression, 'message': self.message}
+
+    def __str__(self):
+        return '{}:{}:{}: {}'.format(self.path, self.line, self.column, self.message)
+
+
+class _DecodedMatch:
+    """Decoded view of a match of ``FIND_MATH_BYTES``, with the same interface as a match of ``FIND_MATH``
+
+    :param match: the match
+    :type match: re.Match
+    """
+
+    def __init__(self, match):
+        self.match = match
+
+    def group(self, n=0):
+        g = self.match.group(n)
+        return None if g is None else str(g, 'utf-8')
+
+    def start(self, n=0):
+        return self.match.start(n)
+
+
+@functools.lru_cache(maxsize=None)
+def code_fingerprint(module_name):
+    """Fingerprint of the code of a (loaded) module, so that a change in a fix is noticed even if the version
+    is the same (empty if its file cannot be read)
+
+    :param module_name: name of the module
+    :type module_name: str
+    :rtype: str
+    """
+
+    path = getattr(sys.modules.get(module_name), '__file__', None)
+    if path is None:
+        return ''
+
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return ''
+
+
+def fixes_fingerprint(fixes):
+    """Fingerprint of a set of fixes (results obtained with another set cannot be reused): the version, the code of
+    the parser and of the fixes, and the settings of the fixes
+
+    :param fixes: the fixes
+    :type fixes: list
+    :rtype: str
+    """
+
+    names = []
+    code = hashlib.sha1()
+    for module_name in (math_parser.__name__, __name__):
+        code.update(code_fingerprint(module_name).encode('utf-8'))
+
+    for f in fixes:
+        name = getattr(f, '__qualname__', type(f).__qualname__)
+        settings = f.fingerprint() if isinstance(f, Fix) else ''
+        names.append(name if settings == '' else '{}[{}]'.format(name, settings))
+        code.update(code_fingerprint(f.__module__).encode('utf-8'))
+
+    return '{}:{}:{}'.format(zds_fixcmd.__version__, code.hexdigest(), ','.join(names))
 
 
 def dummy(math_expr, container, path, *args, **kwargs):
@@ -33,26 +173,35 @@ def dummy(math_expr, container, path, *args, **kwargs):
 
 class FixableContent(content.Content):
 
-    def __init__(self, title, slug, fixes=None):
+    def __init__(self, title, slug, fixes=None, memoize=False, cache=None):
         super().__init__(title, slug)
 
         self.fixes = fixes if fixes is not None else [dummy]
+        self.edits = {}
+        self.incremental = None
+        self.profiler = None
+        self.metrics = None
+        self.memory = None
+        self.errors = None  # if a list, errors on math expressions are collected there instead of being raised
+        self.budget = None  # time budgets (``zds_fixcmd.budget.Budget``) of the expressions that are not reused
+        self.limits = None  # limits on the size of the expressions (``zds_fixcmd.math_parser.Limits``)
+
+        # fixes that are not ``Fix`` objects cannot declare their side effects, so nothing is memoized with them
+        pure = all(isinstance(f, Fix) for f in self.fixes)
+        self.memo = {} if memoize and pure else None
+        self.cache = cache if pure else None
+        self.fixes_fingerprint = fixes_fingerprint(self.fixes)
 
     def walk_containers(self, container=None):
-        """Walk the different containers
+        """Walk the different containers (in pre-order, through the index)
 
         :param container: the container to explore
         :type container: fix_cmd.content.Container
+        :rtype: collections.Iterator
         """
-        if container is None:
-            container = self
-
-        yield container
 
-        if len(container.children) != 0 and isinstance(container.children[0], content.Container):
-            for child in container.children:
-                for _y in self.walk_containers(child):
-                    yield _y
+        index = self.get_index()
+        return iter(index.containers if container is None else index.subtree(container))
 
     def fix(self, *args, **kwargs):
         """Fix the different containers
@@ -61,6 +210,105 @@ class FixableContent(content.Content):
         for container in self.walk_containers():
             self.fix_container(container, *args, **kwargs)
 
+            if self.memory is not None:
+                self.memory.snapshot('fix:' + container.key)
+
+    def check(self, stop_at_first=True, *args, **kwargs):
+        """Find the files that contain math expressions that would be changed by the fixes, without modifying
+        anything.
+
+        Expressions for which no fix ``may_change()`` are not even parsed.
+
+        :param stop_at_first: stop as soon as a file that needs a fix is found
+        :type stop_at_first: bool
+        :return: the path of the files that would be changed
+        :rtype: list of str
+        """
+
+        paths = []
+
+        for container in self.walk_containers():
+            for path, text in self.container_files(container):
+                if self._check_file(text, container, path, *args, **kwargs):
+                    paths.append(path)
+                    if stop_at_first:
+                        return paths
+
+        return paths
+
+    def _check_file(self, text, container, path, *args, **kwargs):
+        """Check if a file would be changed.
+
+        Note that all the expressions are checked (so that the contexts are correctly filled).
+
+        :param text: the text
+        :type text: str|bytes
+        :param container: the container
+        :type container: fix_cmd.content.Container
+        :param path: the file
+        :type path: str
+        :rtype: bool
+        """
+
+        changed = False
+
+        if isinstance(text, str):
+            matches = self._find_math(FIND_MATH, text)
+        else:
+            matches = (_DecodedMatch(g) for g in self._find_math(FIND_MATH_BYTES, text))
+
+        for groups in matches:
+            try:
+                try:
+                    expression = groups.group(2)
+                except UnicodeDecodeError:
+                    raise FixError(path, 'math expression at byte {} is not UTF-8'.format(groups.match.start()))
+
+                if expression != '' and groups.group(1) == groups.group(3) and \
+                        not self._may_change(expression, container, *args, **kwargs):
+                    continue
+
+                fixed = self._fix_math(groups, container, path, *args, **kwargs)
+            except EXPRESSION_ERRORS as e:
+                matched = groups.match.group(0) if isinstance(text, bytes) else groups.group(0)
+                self._collect_error(e, text, path, groups.start(), matched)
+                continue
+
+            if fixed != groups.group(0):
+                changed = True
+                if self.metrics is not None:
+                    self.metrics.inc('expressions_modified')
+
+        return changed
+
+    def _may_change(self, expression, container, *args, **kwargs):
+        """Check if any fix may change the expression (fixes that are not ``Fix`` objects are always assumed to)
+
+        :param expression: the math expression (text)
+        :type expression: str
+        :param container: the container
+        :type container: fix_cmd.content.Container
+        :rtype: bool
+        """
+
+        for fix in self.fixes:
+            if not isinstance(fix, Fix) or fix.may_change(expression, fix.get_context(container, *args, **kwargs)):
+                return True
+
+        return False
+
+    def container_files(self, container):
+        """Get the files of a given container (introduction, extracts, then conclusion)
+
+        :param container: the container
+        :type container: fix_cmd.content.Container
+        :return: ``(path, text)``
+        :rtype: collections.Iterator
+        """
+
+        for path, node, attribute in self.get_index().container_files[container.key]:
+            yield path, getattr(node, attribute)
+
     def fix_container(self, container, *args, **kwargs):
         """Fix a given container
 
@@ -68,21 +316,166 @@ class FixableContent(content.Content):
         :type container: fix_cmd.content.Container
         """
 
-        if container.introduction_path is not None:
-            container.introduction_value = FIND_MATH.sub(
-                lambda g: self._fix_math(g, container, container.introduction_path, *args, **kwargs),
-                container.introduction_value)
+        for path, node, attribute in self.get_index().container_files[container.key]:
+            setattr(node, attribute, self._fix_file(getattr(node, attribute), container, path, *args, **kwargs))
+
+    def _fix_file(self, text, container, path, *args, **kwargs):
+        """Fix a file, and record the number of edits.
+        If ``self.incremental`` is set (to a ``zds_fixcmd.incremental.IncrementalFix``), the output of a previous run
+        is used when possible.
+
+        :param text: the text
+        :type text: str|bytes
+        :param container: the container
+        :type container: fix_cmd.content.Container
+        :param path: the file
+        :type path: str
+        :return: the document if it was modified, the original text otherwise
+        :rtype: str|bytes|fix_cmd.content.Document
+        """
+
+        if self.incremental is not None:
+            reused = self.incremental.reuse(container, path, text)
+            if reused is not None:
+                output, self.edits[path] = reused
+                self.incremental.record(container, path, text, output, self.edits[path])
+                return output
 
-        if len(container.children) != 0 and isinstance(container.children[0], content.Extract):
-            for child in container.children:
-                child.text_value = FIND_MATH.sub(
-                    lambda g: self._fix_math(g, container, child.text_path, *args, **kwargs),
-                    child.text_value)
+        n_errors = len(self.errors) if self.errors is not None else 0
 
-        if container.conclusion_path is not None:
-            container.conclusion_value = FIND_MATH.sub(
-                lambda g: self._fix_math(g, container, container.conclusion_path, *args, **kwargs),
-                container.conclusion_value)
+        document = self.fix_document(text, container, path, *args, **kwargs)
+        self.edits[path] = len(document.edits)
+
+        if self.metrics is not None:
+            self.metrics.inc('expressions_modified', self.edits[path])
+
+        # (a partially fixed file is not reused, so that its errors are reported again)
+        if self.incremental is not None and (self.errors is None or len(self.errors) == n_errors):
+            self.incremental.record(container, path, text, document, self.edits[path])
+
+        return document if document.modified else text
+
+    def unmodified_paths(self):
+        """Files for which no math expression were changed by the last ``fix()`` (their content is left untouched,
+        so there is no need to write them again)
+
+        :rtype: list of str
+        """
+
+        return [path for path, n in self.edits.items() if n == 0]
+
+    def fix_document(self, text, container, path, *args, **kwargs):
+        """Fix the math expressions of a text.
+
+        If ``text`` is ``bytes`` (UTF-8), only the math expressions are decoded.
+        Only the expressions that actually changed are recorded as edits.
+
+        :param text: the text
+        :type text: str|bytes
+        :param container: the container
+        :type container: fix_cmd.content.Container
+        :param path: the file from where the text is issued
+        :type path: str
+        :rtype: fix_cmd.content.Document
+        """
+
+        document = content.Document(text)
+
+        if isinstance(text, str):
+            for groups in self._find_math(FIND_MATH, text):
+                try:
+                    fixed = self._fix_math(groups, container, path, *args, **kwargs)
+                except EXPRESSION_ERRORS as e:
+                    self._collect_error(e, text, path, groups.start(), groups.group(0))
+                    continue
+
+                if fixed != groups.group(0):
+                    begin, end = groups.span()
+                    document.edit(begin, end - begin, fixed)
+        else:
+            for groups in self._find_math(FIND_MATH_BYTES, text):
+                begin, end = groups.span()
+
+                try:
+                    try:
+                        fixed = self._fix_math(
+                            _DecodedMatch(groups), container, path, *args, **kwargs).encode('utf-8')
+                    except UnicodeDecodeError:
+                        raise FixError(path, 'math expression at byte {} is not UTF-8'.format(begin))
+                except EXPRESSION_ERRORS as e:
+                    self._collect_error(e, text, path, begin, groups.group(0))
+                    continue
+
+                if fixed != groups.group(0):
+                    document.edit(begin, end - begin, fixed)
+
+        return document
+
+    def _collect_error(self, error, text, path, offset, expression):
+        """Record an error on a math expression in ``self.errors`` (if set, otherwise the error is raised)
+
+        :param error: the error
+        :type error: Exception
+        :param text: the text of the file
+        :type text: str|bytes
+        :param path: the file
+        :type path: str
+        :param offset: offset of the expression in the text
+        :type offset: int
+        :param expression: the expression (with its delimiters)
+        :type expression: str|bytes
+        """
+
+        if self.errors is None:
+            raise error
+
+        self.errors.append(ExpressionError.create(error, text, path, offset, expression))
+
+    def fix_expression(self, expression, container, path, display=False, *args, **kwargs):
+        """Fix a single math expression (given without its delimiters)
+
+        :param expression: the math expression
+        :type expression: str
+        :param container: the container
+        :type container: fix_cmd.content.Container
+        :param path: the file from where the math expression is issued
+        :type path: str
+        :param display: the expression is in display mode (``$$...$$``)
+        :type display: bool
+        :return: the fixed expression (without delimiters, empty if the expression should be removed)
+        :rtype: str
+        """
+
+        delimiter = '$$' if display else '$'
+        groups = FIND_MATH.fullmatch(delimiter + expression + delimiter)
+        if groups is None or groups.group(2) != expression:
+            raise FixError(path, 'a "$" in the math expression would end it')
+
+        return self._fix_math(groups, container, path, *args, **kwargs)[len(delimiter):-len(delimiter)]
+
+    def _find_math(self, pattern, text):
+        """Find the math expressions (the search is timed if ``self.profiler`` is set, and the expressions are counted
+        if ``self.metrics`` is)
+
+        :param pattern: ``FIND_MATH`` or ``FIND_MATH_BYTES``
+        :type pattern: re.Pattern
+        :param text: the text
+        :type text: str|bytes
+        :rtype: collections.Iterator
+        """
+
+        matches = pattern.finditer(text)
+        if self.profiler is not None:
+            matches = self.profiler.iterate('scan', matches)
+        if self.metrics is not None:
+            matches = self._count_matches(matches)
+
+        return matches
+
+    def _count_matches(self, matches):
+        for groups in matches:
+            self.metrics.inc('expressions_seen')
+            yield groups
 
     def _fix_math(self, groups, container, path, *args, **kwargs):
         """Fix a math expression found in a container
@@ -95,61 +488,202 @@ class FixableContent(content.Content):
         """
 
         if groups.group(1) != groups.group(3):
+            if self.metrics is not None:
+                self.metrics.inc('expressions_failed')
             raise FixError(
                 path, 'begin and end of math expression are not the same (${}!=${})'.format(
                     groups.group(1), groups.group(3)))
 
-        e = MathExpression(groups.group(2), line=groups.group(1) == '')
+        stamp = key = cache_key = None
+        if self.memo is not None or self.cache is not None:
+            stamp = self._contexts_stamp(container, *args, **kwargs)
 
-        for fix in self.fixes:
-            fix(e, container, path, *args, **kwargs)
+        if self.memo is not None:
+            key = (groups.group(1), groups.group(2), container.key, stamp, self.limits)
+            if key in self.memo:
+                return self.memo[key]
+
+        if self.cache is not None:
+            cache_key = self._cache_key(groups, container, *args, **kwargs)
+            s = self.cache.get(cache_key)
+            if s is not None:
+                if key is not None:
+                    self.memo[key] = s
+                return s
+
+        with self.budget.expression(path) if self.budget is not None else contextlib.nullcontext():
+            if self.profiler is not None or self.metrics is not None or self.memory is not None:
+                s = self._fix_expression_instrumented(groups, container, path, *args, **kwargs)
+            else:
+                e = MathExpression(groups.group(2), line=groups.group(1) == '', limits=self.limits)
+
+                for fix in self.fixes:
+                    fix(e, container, path, *args, **kwargs)
+
+                s = math_parser.Interpreter(e.ast).interpret()
 
         sep = '$' * (1 if groups.group(1) is None else 2)
-        s = math_parser.Interpreter(e.ast).interpret()
 
         if s != '':
-            return sep + math_parser.Interpreter(e.ast).interpret() + sep
-        else:
-            return ''  # remove empty math
+            s = sep + s + sep  # otherwise, remove empty math
+
+        # if a fix had side effects, the context changed, so the result cannot be reused
+        if stamp is not None and stamp == self._contexts_stamp(container, *args, **kwargs):
+            if key is not None:
+                self.memo[key] = s
+            if cache_key is not None:
+                self.cache.put(cache_key, s)
+
+        return s
+
+    def _fix_expression_instrumented(self, groups, container, path, *args, **kwargs):
+        """Same as the fix of the expression in ``_fix_math()``, but each stage is timed, for ``self.profiler``
+        and ``self.metrics`` (if set), and the size of the AST is recorded for ``self.memory`` (if set)
+
+        :param container: the container
+        :type container: fix_cmd.content.Container
+        :param path: the file from where the math expression is issued
+        :type path: str
+        :return: the fixed expression (without the delimiters)
+        :rtype: str
+        """
+
+        from zds_fixcmd.profiling import TokensLexer
+
+        try:
+            t_begin = time.perf_counter()
+            tokens = list(math_parser.MathLexer(groups.group(2), self.limits).tokenize())
+            t_lexed = time.perf_counter()
+            ast = math_parser.MathParser(TokensLexer(tokens), self.limits).ast(environments=False)
+            t_parsed = time.perf_counter()
+            if ast is not None:
+                math_parser.EnvironmentFix(ast).modify()
+            t_environments = time.perf_counter()
+
+            if self.memory is not None:
+                self.memory.ast(
+                    path, groups.start(), math_parser.NodeCounter(ast).count_nodes(), groups.group(2))
+
+            e = MathExpression('', line=groups.group(1) == '')
+            e.base_expression = groups.group(2)
+            e.ast = ast
+
+            t_fixes = []
+            for fix in self.fixes:
+                t = time.perf_counter()
+                fix(e, container, path, *args, **kwargs)
+                t_fixes.append(time.perf_counter() - t)
+            t_fixed = time.perf_counter()
+
+            s = math_parser.Interpreter(e.ast).interpret()
+            t_end = time.perf_counter()
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.inc('expressions_failed')
+            raise
+
+        if self.profiler is not None:
+            self.profiler.add('lex', t_lexed - t_begin)
+            self.profiler.add('parse', t_parsed - t_lexed)
+            self.profiler.add('environments', t_environments - t_parsed)
+            for fix, t in zip(self.fixes, t_fixes):
+                self.profiler.add('fix:' + getattr(fix, '__qualname__', type(fix).__qualname__), t)
+            self.profiler.add('render', t_end - t_fixed)
+            self.profiler.expression(path, groups.start(), t_end - t_begin, groups.group(2))
+
+        if self.metrics is not None:
+            self.metrics.inc('expressions_parsed')
+            self.metrics.observe('parse_seconds', t_environments - t_begin)
+            self.metrics.observe('fix_seconds', t_fixed - t_environments)
+
+        return s
+
+    def _cache_key(self, groups, container, *args, **kwargs):
+        """Key of a math expression in the (persistent) cache: depends on the version, the fixes, the fingerprint
+        of their contexts and the limits (so that an expression that exceeds them is not found in the cache)
 
-    @staticmethod
-    def extract(path, fixes=None):
+        :param container: the container
+        :type container: fix_cmd.content.Container
+        :rtype: str
+        """
+
+        h = hashlib.sha1(self.fixes_fingerprint.encode('utf-8'))
+        h.update(b'\0' + (self.limits or math_parser.NO_LIMITS).fingerprint().encode('utf-8'))
+        for fix in self.fixes:
+            h.update(b'\0' + fix.get_context(container, *args, **kwargs).fingerprint().encode('utf-8'))
+
+        h.update(b'\0' + (groups.group(1) or '').encode('utf-8') + b'\0' + groups.group(2).encode('utf-8'))
+        return h.hexdigest()
+
+    def _contexts_stamp(self, container, *args, **kwargs):
+        """Version stamp of the contexts of the fixes for a given container
+
+        :param container: the container
+        :type container: fix_cmd.content.Container
+        :rtype: tuple
+        """
+
+        return tuple(fix.get_context(container, *args, **kwargs).version for fix in self.fixes)
+
+    @classmethod
+    def extract(cls, path, fixes=None, raw=False, memoize=False, cache=None):
         """Extract a content
 
         :param path: the path
         :type path: str
         :param fixes: the fixes to apply
         :type fixes: list
+        :param raw: keep the files as UTF-8 bytes, and only decode the math expressions
+        :type raw: bool
+        :param memoize: reuse the result of identical math expressions in the same context
+        :type memoize: bool
+        :param cache: persistent cache of the results
+        :type cache: zds_fixcmd.cache.FixCache
         :rtype: FixableContent
         """
-        x = content.Content.extract(path)
 
-        y = FixableContent(x.title, x.slug, fixes=fixes)
-        y.type = x.type
-        y.manifest = x.manifest
-        y.children = x.children
-        y.children_dict = x.children_dict
-        y.introduction_path = x.introduction_path
-        y.introduction_value = x.introduction_value
-        y.conclusion_path = x.conclusion_path
-        y.conclusion_value = x.conclusion_value
-
-        return y
+        return super().extract(path, raw=raw, fixes=fixes, memoize=memoize, cache=cache)
 
 
 class FixContext:
-    """Basic context"""
+    """Basic context.
+
+    ``version`` must be increased (through ``touch()``) each time the context is modified by a fix, so that the
+    results obtained with the previous version are not reused.
+    """
 
     def __init__(self, container):
         self.container = container
         self.data = None
+        self.version = 0
+
+    def touch(self):
+        """Signal a modification of the context
+        """
+
+        self.version += 1
+
+    def fingerprint(self):
+        """Fingerprint of the state of the context, stable from one run to another (results obtained in a context
+        with the same fingerprint can be reused)
+
+        :rtype: str
+        """
+
+        return ''
 
 
 class Fix:
     """A fix.
 
     The context is container based.
+    ``after`` and ``before`` are the names (in the registry) of the fixes that should respectively be applied before
+    and after this one, if they are enabled.
     """
+
+    after = []
+    before = []
+
     def __init__(self):
         self.context = {}
 
@@ -187,8 +721,154 @@ class Fix:
         :type path: str
         """
 
-        if container.slug not in self.context:
-            self.context[container.slug] = self.create_context(container, *args, **kwargs)
+        return self.fix(math_expr, self.get_context(container, *args, **kwargs), path, *args, **kwargs)
+
+    def get_context(self, container, *args, **kwargs):
+        """Get (or create) the context of a given container
+
+        :param container: the container
+        :type container: fix_cmd.content.Container
+        :rtype: FixContext
+        """
+
+        if container.key not in self.context:
+            self.context[container.key] = self.create_context(container, *args, **kwargs)
+
+        return self.context[container.key]
+
+    def may_change(self, expression, context):
+        """Quick check on the text of a math expression, before it is even parsed.
+        Should only return ``False`` if the fix would certainly leave the expression unchanged.
+
+        :param expression: the math expression (text)
+        :type expression: str
+        :param context: the context
+        :rtype: bool
+        """
+
+        return True
+
+    def fingerprint(self):
+        """Fingerprint of the settings of the fix, common to all its contexts (e.g. the library of macros)
+
+        :rtype: str
+        """
+
+        return ''
+
+
+# registry of the fixes: name -> "module:class". Modules are only imported if the fix is enabled.
+# Other fixes can be provided by packages through the ``zds_fixcmd.fixes`` entry points group.
+REGISTRY = {
+    'newcommand': 'zds_fixcmd.fixes.fix_newcommand:FixNewCommand',
+    'align': 'zds_fixcmd.fixes.fix_align:FixAlign',
+    'spaces': 'zds_fixcmd.fixes.fix_spaces:FixSpaces'
+}
+
+ENTRY_POINTS_GROUP = 'zds_fixcmd.fixes'
+
+
+class RegistryError(Exception):
+    pass
+
+
+def available_fixes():
+    """Get the fixes of the registry, and the ones provided through entry points
+
+    :return: name -> "module:class"
+    :rtype: dict
+    """
+
+    fixes = dict(REGISTRY)
+
+    try:
+        from importlib import metadata
+    except ImportError:  # Python < 3.8
+        return fixes
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=ENTRY_POINTS_GROUP)
+    else:
+        entry_points = entry_points.get(ENTRY_POINTS_GROUP, [])
+
+    for entry_point in entry_points:
+        if entry_point.name not in fixes:
+            fixes[entry_point.name] = entry_point.value
+
+    return fixes
+
+
+def load_fix(reference):
+    """Import a fix
+
+    :param reference: "module:class"
+    :type reference: str
+    :rtype: type
+    """
+
+    module_name, class_name = reference.split(':')
+
+    try:
+        return getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError) as e:
+        raise RegistryError('cannot load {}: {}'.format(reference, str(e)))
+
+
+def get_fix_classes(only=None, skip=None):
+    """Load the enabled fixes, in an order that satisfies their ``after`` and ``before`` constraints (otherwise,
+    the order of the registry is kept).
+
+    The entry points are only looked up (which is slow) if a fix is not in ``REGISTRY``, so that fixes provided by
+    other packages have to be explicitly enabled.
+
+    :param only: names of the fixes to enable (those of ``REGISTRY`` if ``None``)
+    :type only: list of str
+    :param skip: names of the fixes to disable
+    :type skip: list of str
+    :rtype: list of type
+    """
+
+    names = list(REGISTRY) if only is None else list(only)
+
+    available = REGISTRY
+    if any(name not in available for name in names + list(skip or [])):
+        available = available_fixes()
+
+    for name in names + list(skip or []):
+        if name not in available:
+            raise RegistryError('unknown fix "{}" (available: {})'.format(name, ', '.join(available)))
+
+    names = [n for n in names if n not in (skip or [])]
+    classes = dict((n, load_fix(available[n])) for n in names)
+
+    # topological sort
+    requirements = dict((n, set(a for a in classes[n].after if a in classes)) for n in names)
+    for name in names:
+        for other in classes[name].before:
+            if other in classes:
+                requirements[other].add(name)
+
+    ordered = []
+    while len(ordered) != len(names):
+        ready = [n for n in names if n not in ordered and requirements[n].issubset(ordered)]
+        if len(ready) == 0:
+            raise RegistryError('circular order between fixes {}'.format(
+                ', '.join(n for n in names if n not in ordered)))
+        ordered.append(ready[0])
+
+    return [classes[n] for n in ordered]
+
+
+def get_fixes(only=None, skip=None):
+    """Create the enabled fixes (see ``get_fix_classes()``).
+    Fixes keep contexts, so a new set should be created for each content.
+
+    :param only: names of the fixes to enable (all if ``None``)
+    :type only: list of str
+    :param skip: names of the fixes to disable
+    :type skip: list of str
+    :rtype: list of Fix
+    """
 
-        context = self.context[container.slug]
-        return self.fix(math_expr, context, path, *args, **kwargs)
+    return [c() for c in get_fix_classes(only, skip)]
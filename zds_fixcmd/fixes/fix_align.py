@@ -21,10 +21,15 @@ class ChangeEnv(math_parser.ASTVisitor):
 
 class FixAlign(fixes.Fix):
 
+    after = ['newcommand']
+
     def __init__(self, fix_environments=True):
         super().__init__()
         self.fix_environments = fix_environments
 
+    def fingerprint(self):
+        return 'fix_environments={}'.format(self.fix_environments)
+
     def fix(self, math_expr, context, path, *args, **kwargs):
         """The actual fix
 
@@ -36,3 +41,6 @@ class FixAlign(fixes.Fix):
         """
 
         ChangeEnv(math_expr.ast).change()
+
+    def may_change(self, expression, context):
+        return 'align' in expression
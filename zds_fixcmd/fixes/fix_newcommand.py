@@ -1,15 +1,39 @@
 """
 Replace \\newcommand definitions by their value.
+
+Commands can also be defined once for all the contents, in a library of macros (see ``MacroLibrary``), which is
+loaded once per process (and shared by the workers forked afterwards).
 """
 
+import collections
 import re
 import copy
+import hashlib
 
 from zds_fixcmd import fixes, math_parser
 
 
 FIND_PARAM = re.compile('#([0-9])')
 
+# names of the commands (maybe followed by other characters, see ``command_names()``)
+FIND_COMMAND = re.compile('\\\\(\\w+)')
+
+
+def command_names(expression):
+    """Names of the commands used in an expression (as the parser gets them: the letters after the backslash)
+
+    :param expression: the expression
+    :type expression: str
+    :rtype: collections.Iterator
+    """
+
+    for match in FIND_COMMAND.finditer(expression):
+        name = match.group(1)
+        if not name.isalpha():
+            name = name[:next(i for i, c in enumerate(name) if not c.isalpha())]
+        if name != '':
+            yield name
+
 
 class NCError(Exception):
     def __init__(self, cmd, err):
@@ -30,8 +54,6 @@ class ReplaceParameters(math_parser.ASTVisitor):
         :type node: fix_cmd.math_parser.String
         """
 
-        p = node.parent
-        right = p.right
         splits = []
         content = node.content
         args = kwargs.get('args')
@@ -55,6 +77,9 @@ class ReplaceParameters(math_parser.ASTVisitor):
         splits.append(len(content))
 
         if found:
+            p = node.parent
+            right = p.right
+
             for i in range(len(splits) - 1):
                 b, e = splits[i:i + 2]
                 if content[b] == '#':
@@ -146,10 +171,20 @@ class CommandDefinition:
 
 
 class FixNewCommandContext(fixes.FixContext):
-    def __init__(self, container):
+    """Commands defined in a container, on top of the ones of the library (if any), which they may redefine
+
+    :param container: the container
+    :type container: fix_cmd.content.Container
+    :param library: the library
+    :type library: MacroLibrary
+    """
+
+    def __init__(self, container, library=None):
         super().__init__(container)
 
-        self.commands = {}
+        self.defined = {}
+        self.commands = self.defined if library is None else collections.ChainMap(self.defined, library.commands)
+        self.digest = ''
 
     def add_command(self, command):
         """Add a command
@@ -158,10 +193,17 @@ class FixNewCommandContext(fixes.FixContext):
         :type command: CommandDefinition
         """
 
-        if command.name in self.commands:
+        if command.name in self.defined:
             raise NCError(command.name, 'defined twice')
 
-        self.commands[command.name] = command
+        self.defined[command.name] = command
+        self.digest = hashlib.sha1('{}\0{}\0{}\0{}'.format(
+            self.digest, command.name, command.nargs, math_parser.Interpreter(command.replace_with).interpret()
+        ).encode('utf-8')).hexdigest()
+        self.touch()
+
+    def fingerprint(self):
+        return self.digest
 
 
 class Applier(math_parser.ASTVisitor):
@@ -230,6 +272,86 @@ class Applier(math_parser.ASTVisitor):
             super().visit_command(node, *args, **kwargs)
 
 
+class MacroLibrary:
+    """Commands defined once for all the contents (e.g. a preamble that they all copy)
+
+    :param definitions: math expressions that only contain definitions (``\\newcommand``)
+    :type definitions: list of str
+    :param path: where the definitions come from (in the errors)
+    :type path: str
+    :raise zds_fixcmd.fixes.FixError: if an expression is not only definitions
+    """
+
+    def __init__(self, definitions, path='macros'):
+        context = FixNewCommandContext(None)
+
+        for expression in definitions:
+            ast = math_parser.MathParser.parse(expression)
+            if ast is None:
+                continue
+
+            Applier(ast).apply(context=context, path=path)
+            remaining = math_parser.Interpreter(ast).interpret().strip()
+            if remaining != '':
+                raise fixes.FixError(path, 'only definitions are expected, but there is "{}"'.format(remaining))
+
+        self.path = path
+        self.commands = context.commands
+        self.digest = context.digest
+
+    @classmethod
+    def load(cls, path):
+        """Load the definitions of a file: its math expressions, or the whole file if there is none
+
+        :param path: the file
+        :type path: str
+        :rtype: MacroLibrary
+        """
+
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+
+        definitions = [g.group(2) for g in fixes.FIND_MATH.finditer(text)]
+        return cls(definitions if definitions else [text], path)
+
+
+_library = None
+
+
+def get_library():
+    """Get the library of the process (if any)
+
+    :rtype: MacroLibrary
+    """
+
+    return _library
+
+
+def set_library(library):
+    """Set the library of the process (used by the contexts created afterwards)
+
+    :param library: the library (``None`` to remove it)
+    :type library: MacroLibrary
+    """
+
+    global _library
+    _library = library
+
+
+def load_library(path):
+    """Load the library of the process from a file (unless it is already loaded)
+
+    :param path: the file
+    :type path: str
+    :rtype: MacroLibrary
+    """
+
+    if _library is None or _library.path != path:
+        set_library(MacroLibrary.load(path))
+
+    return _library
+
+
 class FixNewCommand(fixes.Fix):
     def create_context(self, container, *args, **kwargs):
         """Context object for a given container
@@ -237,7 +359,10 @@ class FixNewCommand(fixes.Fix):
         :param container: the container
         :type container: fix_cmd.content.Container
         """
-        return FixNewCommandContext(container)
+        return FixNewCommandContext(container, _library)
+
+    def fingerprint(self):
+        return '' if _library is None else _library.digest
 
     def fix(self, math_expr, context, path, *args, **kwargs):
         """The actual fix
@@ -250,3 +375,7 @@ class FixNewCommand(fixes.Fix):
         """
 
         Applier(math_expr.ast).apply(context=context, path=path)
+
+    def may_change(self, expression, context):
+        # (the cost does not depend on the number of commands, e.g. in a large library)
+        return 'newcommand' in expression or any(name in context.commands for name in command_names(expression))
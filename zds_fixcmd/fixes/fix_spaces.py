@@ -25,10 +25,19 @@ class FindEnv(math_parser.ASTVisitor):
 
 class FixSpaces(fixes.Fix):
 
+    after = ['newcommand', 'align']
+
     def __init__(self, fix_environments=True):
         super().__init__()
         self.fix_environments = fix_environments
 
+    def fingerprint(self):
+        return 'fix_environments={}'.format(self.fix_environments)
+
+    def may_change(self, expression, context):
+        return expression[0].isspace() or expression[-1].isspace() or \
+            (self.fix_environments and '\\begin' in expression)
+
     def fix(self, math_expr, context, path, *args, **kwargs):
         """The actual fix
 
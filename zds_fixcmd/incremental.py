@@ -0,0 +1,213 @@
+"""
+Incremental fix: reuse the output of a previous run for the files that did not change.
+
+A sidecar index records, for each file, the hash of its input, of its "macro context" and of its output.
+The macro context of a file is built from the previous files of the same container which contain ``\\newcommand``
+definitions (those files are therefore always fixed again, so that the contexts of the fixes are filled).
+"""
+
+import hashlib
+import zipfile
+
+from zds_fixcmd import content, math_parser, fixes as fixes_module
+
+INDEX_VERSION = 1
+
+
+def hash_text(text):
+    """Hash a text (or a document, without materializing it)
+
+    :param text: the text
+    :type text: str|bytes|zds_fixcmd.content.Document
+    :rtype: str
+    """
+
+    h = hashlib.sha1()
+
+    chunks = text.chunks() if isinstance(text, content.Document) else [text]
+    for chunk in chunks:
+        h.update(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+
+    return h.hexdigest()
+
+
+def defines_commands(text):
+    """Check if a text (may) contain ``\\newcommand`` definitions
+
+    :param text: the text
+    :type text: str|bytes
+    :rtype: bool
+    """
+
+    return ('newcommand' if isinstance(text, str) else b'newcommand') in text
+
+
+class BadIndexError(Exception):
+    pass
+
+
+class FixIndex:
+    """Index of a run
+
+    :param fingerprint: fingerprint of the fixes
+    :type fingerprint: str
+    """
+
+    def __init__(self, fingerprint=''):
+        self.fingerprint = fingerprint
+        self.files = {}
+
+    def record(self, path, input_hash, context_hash, output_hash, edits):
+        """Record a file
+
+        :param path: path of the file
+        :type path: str
+        :param input_hash: hash of the input
+        :type input_hash: str
+        :param context_hash: hash of the macro context
+        :type context_hash: str
+        :param output_hash: hash of the output
+        :type output_hash: str
+        :param edits: number of edits
+        :type edits: int
+        """
+
+        self.files[path] = {'input': input_hash, 'context': context_hash, 'output': output_hash, 'edits': edits}
+
+    def save(self, path):
+        """Save the index
+
+        :param path: path of the index
+        :type path: str
+        """
+
+        with open(path, 'w') as f:
+            f.write(content.get_json_handler().dumps(
+                {'version': INDEX_VERSION, 'fingerprint': self.fingerprint, 'files': self.files}))
+
+    @staticmethod
+    def load(path):
+        """Load an index
+
+        :param path: path of the index
+        :type path: str
+        :rtype: FixIndex
+        """
+
+        try:
+            with open(path) as f:
+                data = content.get_json_handler().loads(f.read())
+        except ValueError:
+            raise BadIndexError('{}: not in the JSON format'.format(path))
+
+        if data.get('version') != INDEX_VERSION:
+            raise BadIndexError('{}: unknown version'.format(path))
+
+        index = FixIndex(data.get('fingerprint', ''))
+        index.files = data.get('files', {})
+        return index
+
+
+class IncrementalFix:
+    """Keep track of the files of a run, and reuse the output of a previous one if possible.
+
+    :param fixes: the fixes
+    :type fixes: list
+    :param previous_index: the index of the previous run
+    :type previous_index: FixIndex
+    :param previous_output: path to the output of the previous run (a zip archive)
+    :type previous_output: str
+    :param limits: limits on the size of the math expressions (outputs obtained with other limits are not reused)
+    :type limits: zds_fixcmd.math_parser.Limits
+    """
+
+    def __init__(self, fixes, previous_index=None, previous_output=None, limits=None):
+        self.index = FixIndex('{}:{}'.format(
+            fixes_module.fixes_fingerprint(fixes), (limits or math_parser.NO_LIMITS).fingerprint()))
+        self.previous_index = previous_index
+        self.previous_archive = None
+        self.contexts = {}
+        self.reused = []
+
+        if previous_index is not None and previous_output is not None \
+                and previous_index.fingerprint == self.index.fingerprint:
+            self.previous_archive = zipfile.ZipFile(previous_output, 'r')
+
+    def close(self):
+        """Close the previous output (should be done before it is overwritten)
+        """
+
+        if self.previous_archive is not None:
+            self.previous_archive.close()
+            self.previous_archive = None
+
+    def context_hash(self, container):
+        """
+        :param container: the container
+        :type container: zds_fixcmd.content.Container
+        :rtype: str
+        """
+
+        return self.contexts.get(container.key, '')
+
+    def reuse(self, container, path, text):
+        """Get the previous output of a file, if its input and its context did not change
+
+        :param container: the container
+        :type container: zds_fixcmd.content.Container
+        :param path: the file
+        :type path: str
+        :param text: the input
+        :type text: str|bytes
+        :return: the previous output (and the number of edits), or ``None``
+        :rtype: tuple
+        """
+
+        if self.previous_archive is None or defines_commands(text):
+            return None
+
+        previous = self.previous_index.files.get(path)
+        if previous is None or previous['context'] != self.context_hash(container) \
+                or previous['input'] != hash_text(text):
+            return None
+
+        try:
+            output = self.previous_archive.read(path)
+        except KeyError:
+            return None
+
+        if hash_text(output) != previous['output']:
+            return None
+
+        if isinstance(text, str):
+            try:
+                output = str(output, 'utf-8')
+            except UnicodeDecodeError:
+                return None
+
+        self.reused.append(path)
+        return output, previous['edits']
+
+    def record(self, container, path, text, output, edits):
+        """Record a file (fixed or reused), and update the context of its container
+
+        :param container: the container
+        :type container: zds_fixcmd.content.Container
+        :param path: the file
+        :type path: str
+        :param text: the input
+        :type text: str|bytes
+        :param output: the output
+        :type output: str|bytes|zds_fixcmd.content.Document
+        :param edits: number of edits
+        :type edits: int
+        """
+
+        input_hash = hash_text(text)
+        context_hash = self.context_hash(container)
+
+        self.index.record(
+            path, input_hash, context_hash, input_hash if edits == 0 else hash_text(output), edits)
+
+        if defines_commands(text):
+            self.contexts[container.key] = hashlib.sha1((context_hash + input_hash).encode('utf-8')).hexdigest()
@@ -0,0 +1,194 @@
+"""
+Journal of a batch run (``--journal``), so that it can be resumed (``--resume``), and sharding of the inputs
+(``--shard``).
+
+The journal is append-only, with a JSON line per event: an archive (or directory) was started, done or failed, with
+the hash of the input (so that an input that changed since is processed again), and of the output when it replaces
+the input (``--in-place``).
+"""
+
+import hashlib
+import json
+import os
+import time
+
+STARTED = 'started'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def hash_input(path, chunk_size=1024 * 1024):
+    """Hash of an archive, or of all the files of a directory
+
+    :param path: the archive or directory
+    :type path: str
+    :param chunk_size: size of the chunks read
+    :type chunk_size: int
+    :rtype: str
+    """
+
+    def update(h, file_path):
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                h.update(chunk)
+
+    h = hashlib.sha1()
+
+    if not os.path.isdir(path):
+        update(h, path)
+    else:
+        for directory, directories, files in os.walk(path):
+            directories.sort()
+            for name in sorted(files):
+                file_path = os.path.join(directory, name)
+                h.update(os.path.relpath(file_path, path).encode('utf-8') + b'\0')
+                update(h, file_path)
+                h.update(b'\0')
+
+    return h.hexdigest()
+
+
+class BadShardError(Exception):
+    pass
+
+
+def parse_shard(s):
+    """Parse ``i/N`` (with ``1 <= i <= N``)
+
+    :param s: the shard
+    :type s: str
+    :rtype: tuple of int
+    """
+
+    try:
+        i, n = (int(x) for x in s.split('/'))
+    except ValueError:
+        raise BadShardError('"{}" is not i/N'.format(s))
+
+    if not 1 <= i <= n:
+        raise BadShardError('in "{}", i should be between 1 and N'.format(s))
+
+    return i, n
+
+
+def in_shard(path, i, n):
+    """Check if an input belongs to a shard. This only depends on the path (as given), so that different machines
+    get disjoint slices of the same inputs without coordination, whatever the order in which they are listed.
+
+    :param path: the input
+    :type path: str
+    :param i: the shard (``1 <= i <= n``)
+    :type i: int
+    :param n: number of shards
+    :type n: int
+    :rtype: bool
+    """
+
+    return int(hashlib.sha1(os.path.normpath(path).encode('utf-8')).hexdigest(), 16) % n == i - 1
+
+
+class Journal:
+    """Append-only journal of a batch run. The previous events (if any) are loaded, so that ``is_done()`` tells if
+    an input was already processed.
+
+    :param path: path of the journal
+    :type path: str
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        self.running = {}  # input -> hash, for the inputs that are started
+
+        truncated = False
+
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    truncated = not line.endswith('\n')
+                    try:
+                        event = json.loads(line)
+                    except ValueError:  # partially written by a crashed run
+                        continue
+
+                    self.state[event['archive']] = event
+
+        self.file = open(path, 'a', encoding='utf-8')
+
+        if truncated:  # do not append the next event to the last line
+            self.file.write('\n')
+
+    def is_done(self, archive, input_hash):
+        """Check if an input was processed (and not changed since, or replaced by its output), and if its output is
+        still there
+
+        :param archive: the input
+        :type archive: str
+        :param input_hash: hash of the input
+        :type input_hash: str
+        :rtype: bool
+        """
+
+        event = self.state.get(archive)
+        return event is not None and event['status'] == DONE and \
+            input_hash in (event['hash'], event.get('output_hash')) and os.path.exists(event.get('output', ''))
+
+    def write(self, event):
+        """Append an event (written on the disk right away)
+
+        :param event: the event
+        :type event: dict
+        """
+
+        event['time'] = time.time()
+        self.state[event['archive']] = event
+
+        self.file.write(json.dumps(event) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def start(self, archive, input_hash):
+        """Record that an input is being processed
+
+        :param archive: the input
+        :type archive: str
+        :param input_hash: hash of the input
+        :type input_hash: str
+        """
+
+        self.running[archive] = input_hash
+        self.write({'archive': archive, 'hash': input_hash, 'status': STARTED})
+
+    def done(self, archive, output, output_hash=None):
+        """Record that an input was processed
+
+        :param archive: the input
+        :type archive: str
+        :param output: the output
+        :type output: str
+        :param output_hash: hash of the output, if it replaces the input
+        :type output_hash: str
+        """
+
+        event = {'archive': archive, 'hash': self.running.pop(archive), 'status': DONE, 'output': output}
+        if output_hash is not None:
+            event['output_hash'] = output_hash
+
+        self.write(event)
+
+    def failed(self, archive, error):
+        """Record that an input could not be processed
+
+        :param archive: the input
+        :type archive: str
+        :param error: the error
+        :type error: str
+        """
+
+        self.write({'archive': archive, 'hash': self.running.pop(archive), 'status': FAILED, 'error': error})
+
+    def close(self):
+        self.file.close()
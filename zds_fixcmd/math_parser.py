@@ -32,8 +32,13 @@ ast := expression? EOF ;
 ```
 
 Environments are detected latter on.
+
+The size of the expressions can be limited (see ``Limits``), in which case a ``LimitExceeded`` is raised as soon as
+a limit is exceeded, while lexing or parsing.
 """
 
+import sys
+
 BSLASH, LCB, RCB, LSB, RSB, DOWN, UP, EOF = ('\\', '{', '}', '[', ']', '_', '^', 'EOF')
 STRING = 'STRING'
 SYMBOL = 'SYMBOL'
@@ -62,6 +67,48 @@ class MathToken:
             self.type, repr(self.value), ', {}'.format(self.position) if self.position > -1 else '')
 
 
+class Limits:
+    """Limits on the size of a math expression (``None`` for no limit)
+
+    :param length: number of characters
+    :type length: int
+    :param tokens: number of tokens
+    :type tokens: int
+    :param depth: nesting depth of the sub-elements (``{...}`` and ``[...]``)
+    :type depth: int
+    :param nodes: number of nodes of the AST, while it is built (consecutive strings are only merged afterwards)
+    :type nodes: int
+    """
+
+    def __init__(self, length=None, tokens=None, depth=None, nodes=None):
+        self.length = length
+        self.tokens = tokens
+        self.depth = depth
+        self.nodes = nodes
+
+    def maximum(self, limit):
+        """Get a limit (``sys.maxsize`` if there is none, so that it can always be compared)
+
+        :param limit: the name of the limit
+        :type limit: str
+        :rtype: int
+        """
+
+        value = getattr(self, limit)
+        return sys.maxsize if value is None else value
+
+    def fingerprint(self):
+        """Fingerprint of the limits (results obtained with other limits cannot be reused)
+
+        :rtype: str
+        """
+
+        return '{},{},{},{}'.format(self.length, self.tokens, self.depth, self.nodes)
+
+
+NO_LIMITS = Limits()
+
+
 class LexerException(Exception):
     def __init__(self, position, msg):
         super().__init__('lexer error at position {}: {}'.format(position, msg))
@@ -73,10 +120,15 @@ class MathLexer:
     """Lexer
     """
 
-    def __init__(self, input_):
+    def __init__(self, input_, limits=None):
         self.input = input_
         self.pos = 0
         self.current_string = None
+        self.limits = limits if limits is not None else NO_LIMITS
+
+        if len(input_) > self.limits.maximum('length'):
+            raise LimitExceeded(MathToken(STRING, '', self.limits.length), 'length', self.limits.length)
+
         self.next()
 
     def next(self):
@@ -102,7 +154,15 @@ class MathLexer:
         """Tokenize the input
         """
 
+        max_tokens = self.limits.maximum('tokens')
+        n = 0
+
         while self.current_string is not None:
+            n += 1
+            if n > max_tokens:
+                raise LimitExceeded(
+                    MathToken(STRING, '', self.pos - len(self.current_string)), 'tokens', max_tokens)
+
             pos = self.pos
             if self.current_string in SYMBOLS_TR:
                 yield MathToken(SYMBOLS_TR[self.current_string], self.current_string, pos - len(self.current_string))
@@ -318,6 +378,34 @@ class ASTVisitor(NodeVisitor):
         pass
 
 
+class NodeCounter(ASTVisitor):
+    """Count the nodes of an AST
+
+    :param node: the node to visit
+    :type node: AST
+    """
+
+    def __init__(self, node):
+        super().__init__(node)
+        self.count = 0
+
+    def visit(self, node, *args, **kwargs):
+        self.count += 1
+        return super().visit(node, *args, **kwargs)
+
+    def count_nodes(self):
+        """
+
+        :rtype: int
+        """
+
+        self.count = 0
+        if self.node is not None:
+            self._start()
+
+        return self.count
+
+
 class BadEnvironment(Exception):
     pass
 
@@ -352,16 +440,25 @@ class EnvironmentFix(ASTVisitor):
                 end_parent = end.parent
                 end_grandparent = end_parent.parent
 
-                e = Environment(name, begin_parent.right, parameters=begin.parameters[1:])
+                # other parameters of \end are not part of the environment
+                after = end_parent.right
+                for p in reversed(end.parameters[1:]):
+                    after = Expression(p, after)
+
+                if begin_parent.right is end_parent:  # empty environment
+                    content = Empty()
+                else:
+                    content = begin_parent.right
+                    end_grandparent.right = None
+
+                e = Environment(name, content, parameters=begin.parameters[1:])
                 e.parent = begin_parent
 
                 begin_parent.left = e
-                begin_parent.right = end_parent.right
-
-                if end_parent.right is not None:
-                    begin_parent.right.parent = begin_parent
+                begin_parent.right = after
 
-                end_grandparent.right = None
+                if after is not None:
+                    after.parent = begin_parent
 
                 del env_stack[-1]
 
@@ -412,15 +509,43 @@ class ParserException(Exception):
         self.message = msg
 
 
+class LimitExceeded(ParserException):
+    """A limit on the size of the expression (see ``Limits``) was exceeded
+
+    :param token: the token where it happened
+    :type token: MathToken
+    :param limit: the name of the limit (or ``recursion``, if the AST is too deep for the stack of Python, whatever
+      the limits)
+    :type limit: str
+    :param maximum: the limit
+    :type maximum: int
+    """
+
+    def __init__(self, token, limit, maximum):
+        super().__init__(token, 'more than {} {}'.format(maximum, {
+            'length': 'characters', 'tokens': 'tokens', 'depth': 'nested sub-elements', 'nodes': 'nodes',
+            'recursion': 'levels of recursion'}[limit]))
+        self.limit = limit
+        self.maximum = maximum
+
+
 class MathParser:
     """Parser (generate and AST from the tokens).
 
     :type lexer: MathLexer
     :param lexer: The lexer
+    :param limits: limits on the depth and number of nodes (those on the length and number of tokens are checked by
+      the lexer)
+    :type limits: Limits
     """
 
-    def __init__(self, lexer):
+    def __init__(self, lexer, limits=None):
         self.lexer = lexer
+        self.limits = limits if limits is not None else NO_LIMITS
+        self.max_depth = self.limits.maximum('depth')
+        self.max_nodes = self.limits.maximum('nodes')
+        self.depth = 0
+        self.nodes = 0
         self.tokenizer = lexer.tokenize()
         self.current_token = None
         self.previous_tokens = []
@@ -461,6 +586,7 @@ class MathParser:
             raise ParserException(self.current_token, 'expected STRING in one_char')
 
         c = self.current_token.value[0]
+        self.nodes += 1  # (always a string)
         self.current_token.value = self.current_token.value[1:]
         self.current_token.position += 1
 
@@ -503,7 +629,9 @@ class MathParser:
         """
 
         self.eat(LSB)
+        self.enter()
         node = self.expression(additional_stoppers=[RSB])
+        self.depth -= 1
         self.eat(RSB)
 
         return SubElement(node, squared=True)
@@ -515,7 +643,9 @@ class MathParser:
         """
 
         self.eat(LCB)
+        self.enter()
         node = self.expression(additional_stoppers=[RCB])
+        self.depth -= 1
         self.eat(RCB)
 
         return SubElement(node)
@@ -527,6 +657,7 @@ class MathParser:
         """
 
         operator = self.current_token.value
+        self.nodes += 1
         self.next()
 
         if self.current_token.type == STRING:  # only catch the first character
@@ -547,6 +678,7 @@ class MathParser:
         """
 
         self.eat(BSLASH)
+        self.nodes += 1
 
         if self.current_token.type in [BSLASH, LCB, RCB]:  # it was only escaping
             node = String('\\' + self.current_token.value)
@@ -576,13 +708,19 @@ class MathParser:
         :rtype: Expression
         """
 
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise LimitExceeded(self.current_token, 'nodes', self.max_nodes)
+
         if self.current_token.type == STRING:
             left = String(self.current_token.value)
+            self.nodes += 1
             self.next()
         elif self.current_token.type == LCB:
             left = self.sub_element()
         elif self.current_token.type in [LSB, RSB]:  # here, it is nothing more than a string
             left = String(self.current_token.value)
+            self.nodes += 1
             self.next()
         elif self.current_token.type in [UP, DOWN]:
             left = self.unary_operator()
@@ -603,9 +741,21 @@ class MathParser:
             while isinstance(left, String) and right is not None and isinstance(right.left, String):
                 left.content += right.left.content
                 right = right.right
+                self.nodes -= 2
 
         return Expression(left=left, right=right)
 
+    def enter(self):
+        """Enter a sub-element
+
+        :raise LimitExceeded: if it is too deep
+        """
+
+        self.depth += 1
+        self.nodes += 1
+        if self.depth > self.max_depth:
+            raise LimitExceeded(self.current_token, 'depth', self.max_depth)
+
     def ast(self, environments=True):
         """
 
@@ -616,25 +766,32 @@ class MathParser:
 
         node = None
 
-        if self.current_token.type != EOF:
-            node = self.expression()
-            if environments:
-                EnvironmentFix(node).modify()
+        try:
+            if self.current_token.type != EOF:
+                node = self.expression()
+                if environments:
+                    EnvironmentFix(node).modify()
+        except RecursionError:
+            # (deeply nested, or long sequence of elements, since the parser recurses on both)
+            raise LimitExceeded(self.current_token, 'recursion', sys.getrecursionlimit()) from None
 
         self.eat(EOF)
         return node
 
     @staticmethod
-    def parse(s, environments=True):
+    def parse(s, environments=True, limits=None):
         """Parse a string
 
         :param environments: post-modify AST to get the environments
         :type environments: bool
         :param s: string
         :type s: str
+        :param limits: limits on the size of the expression
+        :type limits: Limits
         :rtype: Expression
+        :raise LimitExceeded: if a limit is exceeded
         """
-        return MathParser(MathLexer(s)).ast(environments)
+        return MathParser(MathLexer(s, limits), limits).ast(environments)
 
 
 class Interpreter(NodeVisitor):
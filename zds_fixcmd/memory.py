@@ -0,0 +1,143 @@
+"""
+Memory report of a run (with ``tracemalloc``): peak and retained memory after each stage, top allocation sites and
+largest ASTs.
+
+The containers and ASTs are recorded by ``zds_fixcmd.fixes.FixableContent`` when its ``memory`` is set.
+"""
+
+import heapq
+import tracemalloc
+
+
+class MemoryReport:
+    """Follow the memory used by a run.
+    The peak of a stage is the maximum memory used since the previous stage (if possible, i.e. with Python >= 3.9,
+    otherwise since the beginning).
+
+    :param top: number of allocation sites and ASTs to keep
+    :type top: int
+    :param frames: number of frames kept by ``tracemalloc`` for each allocation
+    :type frames: int
+    """
+
+    def __init__(self, top=10, frames=1):
+        self.top = top
+        self.frames = frames
+        self.stages = []
+        self.sites = []
+        self.largest_asts = []
+        self.archive = None
+
+    def start(self):
+        """Start to trace the memory allocations
+        """
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        """Stop to trace the memory allocations
+        """
+
+        tracemalloc.stop()
+
+    def snapshot(self, stage, sites=False):
+        """Record the memory at the end of a stage
+
+        :param stage: name of the stage
+        :type stage: str
+        :param sites: also record the top allocation sites (slower)
+        :type sites: bool
+        """
+
+        current, peak = tracemalloc.get_traced_memory()
+        self.stages.append({'archive': self.archive or '', 'stage': stage, 'retained': current, 'peak': peak})
+
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        if sites:
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+                tracemalloc.Filter(False, '<unknown>'),
+            ])
+
+            for statistic in snapshot.statistics('lineno')[:self.top]:
+                frame = statistic.traceback[0]
+                self.sites.append({
+                    'archive': self.archive or '',
+                    'stage': stage,
+                    'site': '{}:{}'.format(frame.filename, frame.lineno),
+                    'size': statistic.size,
+                    'count': statistic.count
+                })
+
+    def ast(self, path, offset, nodes, expression):
+        """Record the size of an AST (only the largest ones are kept)
+
+        :param path: the file
+        :type path: str
+        :param offset: offset of the expression in the file
+        :type offset: int
+        :param nodes: number of nodes
+        :type nodes: int
+        :param expression: the expression
+        :type expression: str
+        """
+
+        item = (nodes, self.archive or '', path, offset, expression)
+        if len(self.largest_asts) < self.top:
+            heapq.heappush(self.largest_asts, item)
+        elif nodes > self.largest_asts[0][0]:
+            heapq.heapreplace(self.largest_asts, item)
+
+    def report(self):
+        """
+        :return: the report, in a form that can be written in JSON
+        :rtype: dict
+        """
+
+        return {
+            'stages': list(self.stages),
+            'sites': list(self.sites),
+            'largest_asts': [
+                {'archive': a, 'path': p, 'offset': o, 'nodes': n, 'expression': e}
+                for n, a, p, o, e in sorted(self.largest_asts, reverse=True)]
+        }
+
+    def summary(self):
+        """
+        :return: human-readable summary
+        :rtype: str
+        """
+
+        def size(n):
+            return '{:.1f}'.format(n / 1024)
+
+        report = self.report()
+
+        lines = ['{:<40} {:>14} {:>14}'.format('stage', 'retained (kB)', 'peak (kB)')]
+        for stage in report['stages']:
+            lines.append('{:<40} {:>14} {:>14}'.format(
+                (stage['archive'] + ':' if stage['archive'] else '') + stage['stage'],
+                size(stage['retained']), size(stage['peak'])))
+
+        if len(report['sites']) != 0:
+            lines.append('')
+            lines.append('top allocation sites:')
+            for site in report['sites']:
+                lines.append('  {:>10} kB {:>8} blocks  {} ({})'.format(
+                    size(site['size']), site['count'], site['site'], site['stage']))
+
+        if len(report['largest_asts']) != 0:
+            lines.append('')
+            lines.append('largest ASTs:')
+            for a in report['largest_asts']:
+                expression = a['expression'].replace('\n', ' ')
+                lines.append('  {:>8} nodes {}{}:{} {}'.format(
+                    a['nodes'], a['archive'] + ':' if a['archive'] else '', a['path'], a['offset'],
+                    expression if len(expression) < 60 else expression[:57] + '...'))
+
+        return '\n'.join(lines)
@@ -0,0 +1,244 @@
+"""
+Metrics of the runs (counters and latency histograms), exported in the Prometheus text format or as JSON lines.
+
+The expressions are counted by ``zds_fixcmd.fixes.FixableContent`` when its ``metrics`` is set.
+"""
+
+import bisect
+import json
+import os
+import time
+
+PREFIX = 'zds_fixcmd_'
+
+# in seconds
+LATENCY_BUCKETS = (.00001, .000025, .00005, .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1.)
+
+FORMATS = ('prometheus', 'jsonl')
+
+COUNTERS_HELP = {
+    'expressions_seen': 'Math expressions found',
+    'expressions_parsed': 'Math expressions parsed (and fixed)',
+    'expressions_modified': 'Math expressions changed by the fixes',
+    'expressions_skipped': 'Math expressions not parsed (result reused, or that no fix may change)',
+    'expressions_failed': 'Math expressions that could not be fixed',
+    'archives': 'Archives processed',
+    'bytes_read': 'Size of the input archives',
+    'bytes_written': 'Size of the output archives',
+}
+
+# labels with one value per input (which would give one time series per archive): they are only kept in the JSON
+# lines, and the counters are summed over them in the Prometheus format
+UNBOUNDED_LABELS = ('archive', )
+
+HISTOGRAMS_HELP = {
+    'parse_seconds': 'Time to parse a math expression',
+    'fix_seconds': 'Time to apply the fixes to a math expression',
+}
+
+
+class Histogram:
+    """Histogram of values
+
+    :param buckets: upper bounds of the buckets (in increasing order, the last one being implicitly ``+Inf``)
+    :type buckets: tuple of float
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        """
+        :param value: the value
+        :type value: float
+        """
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """
+        :return: ``(upper bound, number of values lower or equal)``, the last bound being ``+Inf``
+        :rtype: list of tuple
+        """
+
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'), ), self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+
+class Metrics:
+    """Counters (possibly with labels) and histograms.
+
+    ``expressions_skipped`` is not counted, but deduced from the others.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, n=1, **labels):
+        """Increase a counter
+
+        :param name: name of the counter
+        :type name: str
+        :param n: increment
+        :type n: int
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, name, value):
+        """Add a value to a histogram
+
+        :param name: name of the histogram
+        :type name: str
+        :param value: the value
+        :type value: float
+        """
+
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+
+        self.histograms[name].observe(value)
+
+    def get(self, name, **labels):
+        """
+        :param name: name of the counter
+        :type name: str
+        :rtype: int
+        """
+
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def all_counters(self, dropped_labels=()):
+        """
+        :param dropped_labels: labels that are removed (the counters are summed over their values)
+        :type dropped_labels: tuple of str
+        :return: ``(name, labels, value)``, including the deduced counters
+        :rtype: list of tuple
+        """
+
+        counters = {}
+        for (name, labels), value in self.counters.items():
+            key = (name, tuple((k, v) for k, v in labels if k not in dropped_labels))
+            counters[key] = counters.get(key, 0) + value
+
+        counters[('expressions_skipped', ())] = \
+            self.get('expressions_seen') - self.get('expressions_parsed') - self.get('expressions_failed')
+
+        return [(name, dict(labels), value) for (name, labels), value in sorted(counters.items())]
+
+    def to_prometheus(self):
+        """
+        :return: the metrics, in the Prometheus text format
+        :rtype: str
+        """
+
+        def labels_text(labels):
+            if len(labels) == 0:
+                return ''
+            return '{' + ','.join('{}="{}"'.format(
+                k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                for k, v in sorted(labels.items())) + '}'
+
+        def bound_text(bound):
+            return '+Inf' if bound == float('inf') else repr(bound)
+
+        lines = []
+        described = set()
+
+        for name, labels, value in self.all_counters(UNBOUNDED_LABELS):
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP {}{}_total {}'.format(PREFIX, name, COUNTERS_HELP.get(name, name)))
+                lines.append('# TYPE {}{}_total counter'.format(PREFIX, name))
+            lines.append('{}{}_total{} {}'.format(PREFIX, name, labels_text(labels), value))
+
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append('# HELP {}{} {}'.format(PREFIX, name, HISTOGRAMS_HELP.get(name, name)))
+            lines.append('# TYPE {}{} histogram'.format(PREFIX, name))
+            for bound, count in histogram.cumulative_counts():
+                lines.append('{}{}_bucket{{le="{}"}} {}'.format(PREFIX, name, bound_text(bound), count))
+            lines.append('{}{}_sum {}'.format(PREFIX, name, repr(histogram.sum)))
+            lines.append('{}{}_count {}'.format(PREFIX, name, histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        """
+        :return: the metrics (and the time), in a form that can be written in JSON
+        :rtype: dict
+        """
+
+        return {
+            'time': time.time(),
+            'counters': [
+                {'name': name, 'labels': labels, 'value': value} for name, labels, value in self.all_counters()],
+            'histograms': dict(
+                (name, {
+                    'buckets': [['+Inf' if b == float('inf') else b, c] for b, c in h.cumulative_counts()],
+                    'sum': h.sum,
+                    'count': h.count
+                }) for name, h in self.histograms.items())
+        }
+
+
+class MetricsExporter:
+    """Write the metrics in a file, at the end of the run or periodically.
+
+    In the Prometheus format, the file is replaced (atomically, so that it can be read by a collector at any time).
+    As JSON lines, a snapshot is appended each time.
+
+    :param metrics: the metrics
+    :type metrics: Metrics
+    :param path: the file
+    :type path: str
+    :param format_: one of ``FORMATS``
+    :type format_: str
+    :param interval: minimum time between two exports by ``export_if_needed()`` (in seconds, 0 to only export when
+      ``export()`` is called)
+    :type interval: float
+    """
+
+    def __init__(self, metrics, path, format_='prometheus', interval=0):
+        if format_ not in FORMATS:
+            raise ValueError('unknown format {}'.format(format_))
+
+        self.metrics = metrics
+        self.path = path
+        self.format = format_
+        self.interval = interval
+        self.last_export = time.monotonic()
+
+    def export_if_needed(self):
+        """Export if the last export is older than ``interval``
+        """
+
+        if self.interval > 0 and time.monotonic() - self.last_export >= self.interval:
+            self.export()
+
+    def export(self):
+        """Export the metrics
+        """
+
+        if self.format == 'prometheus':
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(self.metrics.to_prometheus())
+            os.replace(tmp_path, self.path)
+        else:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(self.metrics.to_json()))
+                f.write('\n')
+
+        self.last_export = time.monotonic()
@@ -0,0 +1,233 @@
+"""
+Pool of worker processes for batch runs (``--jobs``).
+
+Unlike ``multiprocessing.Pool``, a worker that takes too long on a task (or that dies) is killed and replaced, and
+the task is reported as lost, so that the other tasks go on.
+
+The workers are forked (where it is possible), so that they start with the modules and data of the parent (which
+are preloaded, then frozen, so that the garbage collector does not copy their pages), or started by a fork server
+that preloads the modules.
+"""
+
+import gc
+import importlib
+import multiprocessing
+import multiprocessing.connection
+import sys
+import time
+
+# time (in seconds) left to a worker to exit by itself, before it is killed
+KILL_DELAY = 1.
+
+
+def _work(connection, function, arguments, initializer, finalizer):
+    """Main loop of a worker: get a task, send back ``(True, result)`` (or ``(False, error)``), until ``None``"""
+
+    if initializer is not None:
+        initializer(*arguments)
+
+    try:
+        while True:
+            try:
+                task = connection.recv()
+            except EOFError:
+                break
+
+            if task is None:
+                break
+
+            try:
+                connection.send((True, function(task, *arguments)))
+            except Exception as e:
+                connection.send((False, '{}: {}'.format(type(e).__name__, str(e))))
+    finally:
+        if finalizer is not None:
+            finalizer(*arguments)
+
+
+class Worker:
+    """A worker process, and the task it is working on (if any)
+
+    :param context: the multiprocessing context
+    :param target_arguments: arguments of ``_work()`` (except the connection)
+    :type target_arguments: tuple
+    """
+
+    def __init__(self, context, target_arguments):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_work, args=(child_connection, ) + target_arguments, daemon=True)
+        self.process.start()
+        child_connection.close()
+
+        self.task = None
+        self.started = None
+
+    def submit(self, task):
+        self.task = task
+        self.started = time.monotonic()
+        self.connection.send(task)
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join(KILL_DELAY)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+        self.connection.close()
+
+    def stop(self):
+        """Ask the worker to exit (once its task is done), and wait for it
+        """
+
+        try:
+            self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+
+        self.process.join(KILL_DELAY if self.task is None else 0)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.connection.close()
+
+
+def default_start_method():
+    """Fork, except on the platforms where it is not available (or not safe, like macOS), where a fork server or
+    (as a last resort) new interpreters are used
+
+    :rtype: str
+    """
+
+    methods = multiprocessing.get_all_start_methods()
+    if 'fork' in methods and sys.platform != 'darwin':
+        return 'fork'
+
+    return 'forkserver' if 'forkserver' in methods else 'spawn'
+
+
+class WorkerPool:
+    """Run ``function(task, *arguments)`` on tasks, in worker processes.
+
+    ``function``, ``initializer`` and ``finalizer`` (called with ``*arguments`` when a worker starts and stops)
+    are given by reference, so they should be defined at the top level of a module, and the tasks, arguments and
+    results should be picklable.
+
+    :param function: the function
+    :type function: callable
+    :param arguments: other arguments of the functions
+    :type arguments: tuple
+    :param processes: number of workers
+    :type processes: int
+    :param timeout: time (in seconds) after which a task is lost (no limit if ``None``)
+    :type timeout: float
+    :param initializer: function called when a worker starts
+    :type initializer: callable
+    :param finalizer: function called when a worker stops
+    :type finalizer: callable
+    :param start_method: how the workers are started (``fork``, ``forkserver`` or ``spawn``, see
+      ``default_start_method()`` if ``None``)
+    :type start_method: str
+    :param preload: modules that are imported before the workers are started (for ``fork`` and ``forkserver``)
+    :type preload: list of str
+    """
+
+    def __init__(
+            self, function, arguments=(), processes=2, timeout=None, initializer=None, finalizer=None,
+            start_method=None, preload=()):
+        self.start_method = start_method if start_method is not None else default_start_method()
+        self.context = multiprocessing.get_context(self.start_method)
+
+        if self.start_method == 'forkserver':
+            self.context.set_forkserver_preload(['__main__'] + list(preload))
+        elif self.start_method == 'fork':
+            for module in preload:
+                importlib.import_module(module)
+
+            # objects of the parent are shared with the workers as long as they are not written, which the garbage
+            # collector would do (when it visits them)
+            gc.freeze()
+
+        self.target_arguments = (function, arguments, initializer, finalizer)
+        self.processes = processes
+        self.timeout = timeout
+        self.workers = []
+        self.replaced = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """Stop the workers
+        """
+
+        for worker in self.workers:
+            worker.stop()
+
+        self.workers = []
+
+        if self.start_method == 'fork':
+            gc.unfreeze()
+
+    def _replace(self, worker):
+        worker.kill()
+        self.workers[self.workers.index(worker)] = Worker(self.context, self.target_arguments)
+        self.replaced += 1
+
+    def imap_unordered(self, tasks):
+        """Run the tasks (in the order they are given, but the results come back as soon as they are ready)
+
+        :param tasks: the tasks
+        :type tasks: collections.Iterable
+        :return: ``(task, success, result)``, where ``result`` is the error if the function failed (or if the worker
+          was killed or died)
+        :rtype: collections.Iterator
+        """
+
+        tasks = iter(tasks)
+        no_more_tasks = False
+
+        while len(self.workers) < self.processes:
+            self.workers.append(Worker(self.context, self.target_arguments))
+
+        while True:
+            for worker in self.workers:
+                if worker.task is None and not no_more_tasks:
+                    try:
+                        worker.submit(next(tasks))
+                    except StopIteration:
+                        no_more_tasks = True
+
+            busy = [worker for worker in self.workers if worker.task is not None]
+            if not busy:
+                return
+
+            wait_for = None
+            if self.timeout is not None:
+                wait_for = max(0, min(w.started for w in busy) + self.timeout - time.monotonic())
+
+            ready = multiprocessing.connection.wait(
+                [w.connection for w in busy] + [w.process.sentinel for w in busy], wait_for)
+
+            for worker in busy:
+                task = worker.task
+
+                if worker.connection in ready or worker.process.sentinel in ready:
+                    try:
+                        success, result = worker.connection.recv()
+                    except (EOFError, OSError):
+                        worker.process.join(KILL_DELAY)
+                        success, result = False, 'worker died (exit code {})'.format(worker.process.exitcode)
+                        self._replace(worker)
+                    else:
+                        worker.task = None
+                elif self.timeout is not None and time.monotonic() - worker.started >= self.timeout:
+                    success, result = False, 'worker killed after {:g}s'.format(self.timeout)
+                    self._replace(worker)
+                else:
+                    continue
+
+                yield task, success, result
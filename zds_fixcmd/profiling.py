@@ -0,0 +1,169 @@
+"""
+Profiling of a run: wall time and number of calls per stage (and per fix), and the slowest math expressions.
+
+The stages are recorded by ``zds_fixcmd.fixes.FixableContent`` when its ``profiler`` is set (the instrumented path
+is separate, so that nothing is measured otherwise).
+"""
+
+import contextlib
+import heapq
+import time
+
+
+class TokensLexer:
+    """Lexer that gives back tokens that were already produced (so that lexing and parsing can be timed separately)
+
+    :param tokens: the tokens
+    :type tokens: list of zds_fixcmd.math_parser.MathToken
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def tokenize(self):
+        return iter(self.tokens)
+
+
+class Profiler:
+    """Collect the time spent in the different stages
+
+    :param slowest: number of slowest expressions to keep
+    :type slowest: int
+    """
+
+    def __init__(self, slowest=10):
+        self.stages = {}
+        self.counters = {}
+        self.slowest = []
+        self.max_slowest = slowest
+        self.archive = None
+        self.start = time.perf_counter()
+
+    def add(self, name, elapsed, calls=1):
+        """Add time to a stage
+
+        :param name: name of the stage
+        :type name: str
+        :param elapsed: time (in seconds)
+        :type elapsed: float
+        :param calls: number of calls
+        :type calls: int
+        """
+
+        if name not in self.stages:
+            self.stages[name] = [0., 0]
+
+        self.stages[name][0] += elapsed
+        self.stages[name][1] += calls
+
+    def count(self, name, n=1):
+        """Increase a counter
+
+        :param name: name of the counter
+        :type name: str
+        :param n: increment
+        :type n: int
+        """
+
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the code of the ``with`` block as a stage
+
+        :param name: name of the stage
+        :type name: str
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def iterate(self, name, iterator):
+        """Time the production of each item of an iterator as a stage
+
+        :param name: name of the stage
+        :type name: str
+        :param iterator: the iterator
+        :type iterator: collections.Iterator
+        :rtype: collections.Iterator
+        """
+
+        iterator = iter(iterator)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start, 0)
+                return
+
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def expression(self, path, offset, elapsed, expression):
+        """Record the time spent on a math expression (only the slowest ones are kept)
+
+        :param path: the file
+        :type path: str
+        :param offset: offset of the expression in the file
+        :type offset: int
+        :param elapsed: time (in seconds)
+        :type elapsed: float
+        :param expression: the expression
+        :type expression: str
+        """
+
+        item = (elapsed, self.archive or '', path, offset, expression)
+        if len(self.slowest) < self.max_slowest:
+            heapq.heappush(self.slowest, item)
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def report(self):
+        """
+        :return: the report, in a form that can be written in JSON
+        :rtype: dict
+        """
+
+        return {
+            'total': time.perf_counter() - self.start,
+            'stages': dict((name, {'time': t, 'calls': n}) for name, (t, n) in self.stages.items()),
+            'counters': dict(self.counters),
+            'slowest': [
+                {'archive': a, 'path': p, 'offset': o, 'time': t, 'expression': e}
+                for t, a, p, o, e in sorted(self.slowest, reverse=True)]
+        }
+
+    def summary(self):
+        """
+        :return: human-readable summary
+        :rtype: str
+        """
+
+        report = self.report()
+        total = report['total']
+
+        lines = ['{:<30} {:>10} {:>12} {:>7} {:>12}'.format('stage', 'calls', 'time (ms)', '%', 'mean (µs)')]
+        for name, stage in sorted(report['stages'].items(), key=lambda x: -x[1]['time']):
+            lines.append('{:<30} {:>10} {:>12.2f} {:>7.1f} {:>12.1f}'.format(
+                name, stage['calls'], stage['time'] * 1000, stage['time'] / total * 100 if total > 0 else 0,
+                stage['time'] / stage['calls'] * 1e6 if stage['calls'] > 0 else 0))
+
+        lines.append('{:<30} {:>10} {:>12.2f}'.format('total', '', total * 1000))
+
+        for name, value in sorted(report['counters'].items()):
+            lines.append('{}: {}'.format(name, value))
+
+        if len(report['slowest']) != 0:
+            lines.append('')
+            lines.append('slowest expressions:')
+            for e in report['slowest']:
+                expression = e['expression'].replace('\n', ' ')
+                lines.append('  {:>9.2f}ms {}{}:{} {}'.format(
+                    e['time'] * 1000, e['archive'] + ':' if e['archive'] else '', e['path'], e['offset'],
+                    expression if len(expression) < 60 else expression[:57] + '...'))
+
+        return '\n'.join(lines)
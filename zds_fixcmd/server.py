@@ -0,0 +1,387 @@
+"""
+Long-running fix service (``zds-fixcmd serve``), over HTTP on a local port or on a Unix socket.
+
++ ``POST /fix``: the body is the archive of a content, the response is the fixed archive ;
++ ``POST /fix/markdown``: the body is a (UTF-8) markdown text, the response is the fixed text ;
++ ``GET /health``: ``{"status": "ok"}`` ;
++ ``GET /stats``: counters of the service (requests, errors, time, cache, ...), in JSON.
+
+The modules, the fixes and the caches (in memory, and the persistent one if any) are loaded once for all the
+requests, which are handled by a bounded pool of workers (one connection per request). The requests that arrive
+when too many are already waiting are answered with status 503, and the bodies larger than ``max_body_size`` with
+status 413.
+Errors are given as ``{"error": "..."}``, with status 400 (bad input) or 422 (the fix failed).
+"""
+
+import concurrent.futures
+import http.server
+import io
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import zipfile
+
+from zds_fixcmd import cache, content
+from zds_fixcmd.fixes import EXPRESSION_ERRORS, FixableContent
+
+MARKDOWN_PATH = 'text.md'
+
+# in bytes
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+# number of requests that may wait for a worker, per worker
+PENDING_PER_WORKER = 4
+
+# time (in seconds) given to a client to finish to send a request that is rejected, before the connection is closed
+LINGER_DELAY = .5
+
+
+def linger(connection, delay=LINGER_DELAY):
+    """Discard what the client still sends (for a while), so that closing the connection with unread data does not
+    reset it before the client reads the response
+
+    :param connection: the connection (once the response is sent)
+    :type connection: socket.socket
+    :param delay: maximum time (in seconds)
+    :type delay: float
+    """
+
+    deadline = time.monotonic() + delay
+    try:
+        connection.shutdown(socket.SHUT_WR)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            connection.settimeout(remaining)
+            if not connection.recv(65536):
+                break
+    except OSError:
+        pass
+
+
+class FixService:
+    """Fix archives and texts (thread-safe: each request gets its own fixes and content)
+
+    :param fix_classes: the fixes to apply
+    :type fix_classes: list of type
+    :param fix_cache: persistent cache, shared by the requests
+    :type fix_cache: zds_fixcmd.cache.FixCache
+    :param raw: work on the UTF-8 bytes of the files of the archives
+    :type raw: bool
+    :param limits: limits on the size of the math expressions
+    :type limits: zds_fixcmd.math_parser.Limits
+    :param memory_entries: maximum number of entries of the cache in memory, shared by the requests (in front of
+      the persistent one), 0 to disable it
+    :type memory_entries: int
+    """
+
+    def __init__(
+            self, fix_classes, fix_cache=None, raw=False, limits=None, memory_entries=cache.DEFAULT_MEMORY_ENTRIES):
+        self.fix_classes = fix_classes
+        self.fix_cache = fix_cache
+        self.raw = raw
+        self.limits = limits
+
+        self.cache = fix_cache
+        if memory_entries > 0:
+            self.cache = cache.MemoryCache(memory_entries, backend=fix_cache)
+
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {
+            'requests': 0, 'errors': 0, 'rejected': 0, 'in_flight': 0, 'archives': 0, 'texts': 0, 'bytes_read': 0,
+            'bytes_written': 0, 'expressions_modified': 0, 'seconds': 0.}
+
+    def count(self, **increments):
+        """Increase the counters
+
+        :param increments: name of the counter -> increment
+        :type increments: dict
+        """
+
+        with self.lock:
+            for name, n in increments.items():
+                self.counters[name] += n
+
+    def fix_archive(self, data):
+        """Fix an archive
+
+        :param data: the archive
+        :type data: bytes
+        :return: the fixed archive
+        :rtype: bytes
+        """
+
+        c = FixableContent.extract(
+            io.BytesIO(data), fixes=[f() for f in self.fix_classes], raw=self.raw, memoize=True, cache=self.cache)
+        c.limits = self.limits
+        c.fix()
+
+        output = io.BytesIO()
+        c.save(output)
+
+        self.count(archives=1, expressions_modified=sum(c.edits.values()))
+        return output.getvalue()
+
+    def fix_markdown(self, text):
+        """Fix a text
+
+        :param text: the text
+        :type text: str
+        :return: the fixed text
+        :rtype: str
+        """
+
+        c = FixableContent(
+            'markdown', 'markdown', fixes=[f() for f in self.fix_classes], memoize=True, cache=self.cache)
+        c.introduction_path = MARKDOWN_PATH
+        c.introduction_value = text
+        c.limits = self.limits
+        c.fix()
+
+        self.count(texts=1, expressions_modified=sum(c.edits.values()))
+        return c.introduction_value
+
+    def stats(self):
+        """
+        :rtype: dict
+        """
+
+        with self.lock:
+            stats = dict(self.counters)
+
+        stats['uptime'] = time.time() - self.started
+        stats['fixes'] = [f.__name__ for f in self.fix_classes]
+
+        if self.cache is not None:
+            stats['cache_hits'] = self.cache.hits
+            stats['cache_misses'] = self.cache.misses
+
+        if self.fix_cache is not None and self.fix_cache is not self.cache:
+            stats['persistent_cache_hits'] = self.fix_cache.hits
+            stats['persistent_cache_misses'] = self.fix_cache.misses
+
+        return stats
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handle a request to the service (``self.server.service``)
+    """
+
+    def address_string(self):
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send(self, status, body, content_type='application/json'):
+        """Send the response
+
+        :param status: HTTP status
+        :type status: int
+        :param body: the body (dumped in JSON if it is not bytes)
+        :type body: bytes|dict
+        :param content_type: type of the body
+        :type content_type: str
+        """
+
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self.send(200, self.server.service.stats())
+        else:
+            self.send(404, {'error': 'no such endpoint: {}'.format(self.path)})
+
+    def do_POST(self):
+        service = self.server.service
+
+        if self.path not in ('/fix', '/fix/markdown'):
+            self.send(404, {'error': 'no such endpoint: {}'.format(self.path)})
+            return
+
+        if 'Content-Length' not in self.headers:
+            self.send(411, {'error': 'the length of the body is required'})
+            return
+
+        try:
+            length = int(self.headers['Content-Length'])
+        except ValueError:
+            length = -1
+
+        if length < 0:
+            self.send(400, {'error': 'invalid length of the body'})
+            return
+
+        if length > self.server.max_body_size:
+            self.close_connection = True
+            self.send(413, {'error': 'body larger than {} bytes'.format(self.server.max_body_size)})
+            linger(self.connection)  # the body is not read
+            return
+
+        data = self.rfile.read(length)
+
+        service.count(requests=1, in_flight=1, bytes_read=len(data))
+        start = time.perf_counter()
+
+        try:
+            if self.path == '/fix':
+                status, body, content_type = 200, service.fix_archive(data), 'application/zip'
+            else:
+                status, body, content_type = \
+                    200, service.fix_markdown(str(data, 'utf-8')).encode('utf-8'), 'text/markdown; charset=utf-8'
+        except (content.BadArchiveError, content.BadManifestError, zipfile.BadZipFile, UnicodeDecodeError) as e:
+            status, body, content_type = 400, {'error': str(e)}, 'application/json'
+        except EXPRESSION_ERRORS as e:
+            status, body, content_type = 422, {'error': str(e)}, 'application/json'
+        except Exception as e:
+            self.log_error('error while handling %s: %r', self.path, e)
+            status, body, content_type = 500, {'error': 'internal error'}, 'application/json'
+        finally:
+            service.count(in_flight=-1, seconds=time.perf_counter() - start)
+
+        if status != 200:
+            service.count(errors=1)
+        else:
+            service.count(bytes_written=len(body))
+
+        self.send(status, body, content_type)
+
+
+class PoolMixIn:
+    """Handle the requests in a bounded pool of threads (instead of a thread per request), and reject them (with
+    status 503) when ``max_pending`` requests are already handled or waiting
+    """
+
+    workers = 4
+    max_pending = 4 * PENDING_PER_WORKER
+    executor = None
+    pending = 0
+    pending_lock = None
+
+    def process_request(self, request, client_address):
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix='zds-fixcmd')
+            self.pending_lock = threading.Lock()
+
+        with self.pending_lock:
+            accepted = self.pending < self.max_pending
+            if accepted:
+                self.pending += 1
+
+        if not accepted:
+            self.reject_request(request)
+            self.shutdown_request(request)
+            return
+
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def reject_request(self, request):
+        """Answer that the service is busy (without reading the request)
+        """
+
+        self.service.count(rejected=1)
+
+        body = json.dumps({'error': 'too many pending requests'}).encode('utf-8')
+        try:
+            request.sendall(
+                'HTTP/1.0 503 Service Unavailable\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                'Retry-After: 1\r\n\r\n'.format(len(body)).encode('ascii') + body)
+        except OSError:
+            pass
+        else:
+            linger(request)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.pending_lock:
+                self.pending -= 1
+
+    def server_close(self):
+        super().server_close()
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+class HTTPFixServer(PoolMixIn, http.server.HTTPServer):
+
+    def server_bind(self):
+        # do not look for the fully qualified name of the host (which may be slow)
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = self.server_address[:2]
+
+
+class UnixFixServer(PoolMixIn, socketserver.UnixStreamServer):
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+        super().server_bind()
+
+    def server_close(self):
+        super().server_close()
+
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def create_server(
+        service, port=0, host='127.0.0.1', socket_path=None, workers=4, verbose=False, max_pending=None,
+        max_body_size=MAX_BODY_SIZE):
+    """Create the server (listening, but not serving yet: use ``serve_forever()``)
+
+    :param service: the service
+    :type service: FixService
+    :param port: port (0 for any free port, see ``server_address``)
+    :type port: int
+    :param host: host
+    :type host: str
+    :param socket_path: path of a Unix socket, used instead of the port if given
+    :type socket_path: str
+    :param workers: number of requests handled at the same time
+    :type workers: int
+    :param verbose: log the requests in stderr
+    :type verbose: bool
+    :param max_pending: number of requests handled or waiting for a worker, the other ones being rejected
+      (``PENDING_PER_WORKER`` times ``workers`` if ``None``)
+    :type max_pending: int
+    :param max_body_size: maximum size of the body of a request (in bytes)
+    :type max_body_size: int
+    :rtype: HTTPFixServer|UnixFixServer
+    """
+
+    if socket_path is not None:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OSError('Unix sockets are not available')
+        server = UnixFixServer(socket_path, RequestHandler)
+    else:
+        server = HTTPFixServer((host, port), RequestHandler)
+
+    server.service = service
+    server.workers = workers
+    server.max_pending = max_pending if max_pending is not None else PENDING_PER_WORKER * workers
+    server.max_body_size = max_body_size
+    server.verbose = verbose
+
+    return server